@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+benchmarks.bench_computed_columns
+==================================
+
+Benchmark :func:`pypfi.pypfi.add_computed_columns` against the
+previous per-row ``Series.apply`` implementation.
+
+Usage::
+
+    python -m benchmarks.bench_computed_columns
+    python -m benchmarks.bench_computed_columns -n 1000000
+
+(The ``time_*`` methods are also discoverable by ``asv``.)
+"""
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from pypfi import pypfi
+
+
+def make_transactions(n, tz=None, seed=0):
+    """
+    Args:
+        n (int): number of rows
+        tz (str): timezone for the ``date`` column (``None`` for naive)
+        seed (int): random seed
+    Returns:
+        pandas.DataFrame: ``date,desc,amount,balance`` frame
+    """
+    rs = np.random.RandomState(seed)
+    dates = pd.date_range('2014-12-18 10:57', periods=n, freq='2H', tz=tz)
+    amount = np.round(rs.uniform(-100, -0.5, n), 2)
+    return pd.DataFrame({
+        'date': dates,
+        'desc': 'ABC',
+        'amount': amount,
+        'balance': 10000 + amount.cumsum()},
+        columns=['date', 'desc', 'amount', 'balance'])
+
+
+class TimeAddComputedColumns(object):
+    params = ([10000, 100000], [None, 'US/Central'])
+    param_names = ['n', 'tz']
+
+    def setup(self, n, tz):
+        self.df = make_transactions(n, tz=tz)
+
+    def time_add_computed_columns(self, n, tz):
+        pypfi.add_computed_columns(self.df.copy())
+
+    def time_add_computed_columns_apply(self, n, tz):
+        pypfi._add_computed_columns_apply(self.df.copy())
+
+
+def main(*args):
+    import optparse
+
+    prs = optparse.OptionParser(usage="%prog [-n <rows>] [-r <repeat>]")
+    prs.add_option('-n', '--rows',
+                   dest='rows',
+                   type=int,
+                   default=100000)
+    prs.add_option('-r', '--repeat',
+                   dest='repeat',
+                   type=int,
+                   default=3)
+    prs.add_option('-z', '--tz',
+                   dest='tz',
+                   default=None)
+
+    args = args and list(args) or sys.argv[1:]
+    (opts, args) = prs.parse_args(args)
+
+    df = make_transactions(opts.rows, tz=opts.tz)
+    results = []
+    for func in (pypfi.add_computed_columns,
+                 pypfi._add_computed_columns_apply):
+        seconds = min(timeit.repeat(lambda: func(df.copy()),
+                                    repeat=opts.repeat, number=1))
+        results.append(seconds)
+        print("%-32s %10d rows %10.4fs" % (func.__name__, opts.rows, seconds))
+    print("speedup: %.1fx" % (results[1] / results[0]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+benchmarks.bench_pipeline
+==========================
+
+Benchmark each stage of the report pipeline on synthetic ledgers:
+:func:`pypfi.pypfi.read_transactions_tsv`,
+:func:`pypfi.pypfi.add_computed_columns`,
+:func:`pypfi.pypfi.build_groupby_reports`,
+:func:`pypfi.pypfi.build_pivot_reports` and
+:func:`pypfi.pypfi.write_html_report`.
+
+Ledgers are written once per size to ``$PYPFI_BENCH_DIR``
+(default: ``<tempdir>/pypfi-bench``) and reused; they are generated with
+:class:`pypfi.datagenerator.BulkDataGenerator`
+(see :func:`benchmarks.bench_read_transactions.write_transactions_csv`).
+
+Usage::
+
+    asv run                     # asv.conf.json: time_* and peakmem_*
+    python -m benchmarks.bench_pipeline -n 10000 -n 100000
+    python -m benchmarks.bench_pipeline -n 1000000 --record bench.jsonl
+
+``--record`` appends one JSON line per size (commit, versions and the
+wall time, CPU time and peak memory of each stage; see
+:class:`pypfi.profiling.StageProfiler`) and prints the ratio to the
+previous recorded commit, so regressions are visible across commits.
+"""
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from pypfi import profiling
+from pypfi import pypfi
+from benchmarks.bench_read_transactions import write_transactions_csv
+
+
+SIZES = (10000, 100000, 1000000, 10000000)
+
+STAGES = (
+    'read_transactions_tsv',
+    'add_computed_columns',
+    'build_groupby_reports',
+    'build_pivot_reports',
+    'write_html_report',
+)
+
+
+def get_bench_dir():
+    """
+    Returns:
+        str: ``$PYPFI_BENCH_DIR`` (default: ``<tempdir>/pypfi-bench``)
+    """
+    path = os.environ.get(
+        'PYPFI_BENCH_DIR', os.path.join(tempfile.gettempdir(), 'pypfi-bench'))
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return path
+
+
+def get_ledger(n):
+    """
+    Args:
+        n (int): number of rows
+    Returns:
+        str: path of a synthetic ledger of (about) ``n`` rows
+    """
+    path = os.path.join(get_bench_dir(), 'ledger-%d.csv' % n)
+    if not os.path.exists(path):
+        tmp_path = path + '.tmp'
+        write_transactions_csv(tmp_path, n)
+        os.rename(tmp_path, path)
+    return path
+
+
+def run_stage(stage, state):
+    """
+    Run one pipeline stage
+
+    Args:
+        stage (str): one of STAGES
+        state (dict): ``path``, and the outputs of the previous stages
+            (``df``, ``report_dict``, ``output_file``)
+    Returns:
+        dict: ``state``, updated with this stage's output
+    """
+    if stage == 'read_transactions_tsv':
+        state['df'] = pypfi.read_transactions_tsv(state['path'])
+    elif stage == 'add_computed_columns':
+        state['df'] = pypfi.add_computed_columns(state['df'])
+    elif stage == 'build_groupby_reports':
+        report_dict = state.setdefault('report_dict', pypfi.ReportDict())
+        report_dict['build_groupby_reports'] = pypfi.build_groupby_reports(
+            state['df'])
+    elif stage == 'build_pivot_reports':
+        report_dict = state.setdefault('report_dict', pypfi.ReportDict())
+        report_dict['build_pivot_reports'] = pypfi.build_pivot_reports(
+            state['df'])
+    elif stage == 'write_html_report':
+        pypfi.write_html_report(state['path'], state['output_file'],
+                                state['report_dict'])
+    else:
+        raise KeyError(stage)
+    return state
+
+
+class _PipelineSuite(object):
+    params = (list(SIZES),)
+    param_names = ['n']
+    timeout = 3600
+    stage = None
+
+    def setup(self, n):
+        self.state = {'path': get_ledger(n)}
+        self.state['output_file'] = os.path.join(
+            tempfile.mkdtemp(), 'report.html')
+        for stage in STAGES[:STAGES.index(self.stage)]:
+            run_stage(stage, self.state)
+        if 'df' in self.state:
+            self.df = self.state['df']
+
+    def teardown(self, n):
+        output_dir = os.path.dirname(self.state['output_file'])
+        for filename in os.listdir(output_dir):
+            os.remove(os.path.join(output_dir, filename))
+        os.rmdir(output_dir)
+
+    def run(self):
+        state = dict(self.state)
+        if 'df' in state and self.stage != 'write_html_report':
+            state['df'] = self.df.copy()
+            state['report_dict'] = pypfi.ReportDict()
+        run_stage(self.stage, state)
+
+
+def _make_suite(stage):
+    name = ''.join(x.capitalize() for x in stage.split('_'))
+
+    def time_stage(self, n):
+        self.run()
+
+    def peakmem_stage(self, n):
+        self.run()
+
+    return type(name, (_PipelineSuite,), {
+        'stage': stage,
+        'time_%s' % stage: time_stage,
+        'peakmem_%s' % stage: peakmem_stage,
+    })
+
+
+ReadTransactionsTsv = _make_suite('read_transactions_tsv')
+AddComputedColumns = _make_suite('add_computed_columns')
+BuildGroupbyReports = _make_suite('build_groupby_reports')
+BuildPivotReports = _make_suite('build_pivot_reports')
+WriteHtmlReport = _make_suite('write_html_report')
+
+
+def get_commit():
+    """
+    Returns:
+        str: ``git rev-parse HEAD`` of the working tree (None if unknown)
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).strip().decode()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def profile_pipeline(n):
+    """
+    Run each stage once, with a :class:`pypfi.profiling.StageProfiler`
+
+    Args:
+        n (int): number of rows
+    Returns:
+        pypfi.profiling.StageProfiler: one record per stage
+    """
+    state = {'path': get_ledger(n)}
+    output_dir = tempfile.mkdtemp()
+    state['output_file'] = os.path.join(output_dir, 'report.html')
+    profiler = profiling.StageProfiler()
+    try:
+        for stage in STAGES:
+            with profiler.stage(stage) as record:
+                run_stage(stage, state)
+                record['rows'] = len(state['df'])
+    finally:
+        if os.path.exists(state['output_file']):
+            os.remove(state['output_file'])
+        os.rmdir(output_dir)
+    return profiler
+
+
+def read_records(path):
+    """
+    Args:
+        path (str): JSON lines file written by :func:`record_results`
+    Returns:
+        list: records (dicts)
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record_results(path, n, profiler):
+    """
+    Append a benchmark record to a JSON lines file
+
+    Args:
+        path (str): output path
+        n (int): number of rows
+        profiler (pypfi.profiling.StageProfiler): stage timings
+    Returns:
+        dict: the record
+    """
+    record = {
+        'commit': get_commit(),
+        'date': datetime.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'n': n,
+        'stages': profiler.records,
+    }
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    return record
+
+
+def compare_records(record, previous):
+    """
+    Args:
+        record (dict): benchmark record
+        previous (dict): an earlier record for the same ``n``
+    Returns:
+        pandas.DataFrame: ``wall_s`` of each stage and the ratio
+    """
+    def wall_s(r):
+        return pd.Series(dict((s['stage'], s['wall_s']) for s in r['stages']))
+    df = pd.DataFrame({'previous': wall_s(previous), 'current': wall_s(record)},
+                      columns=['previous', 'current'])
+    df['ratio'] = df['current'] / df['previous']
+    return df.reindex(STAGES)
+
+
+def main(*args):
+    import optparse
+
+    prs = optparse.OptionParser(
+        usage="%prog [-n <rows> ...] [--record <results.jsonl>]")
+    prs.add_option('-n', '--rows',
+                   dest='sizes',
+                   type=int,
+                   action='append',
+                   default=[])
+    prs.add_option('--record',
+                   dest='record',
+                   help='Append results to this JSON lines file',
+                   default=None)
+
+    args = args and list(args) or sys.argv[1:]
+    (opts, args) = prs.parse_args(args)
+
+    for n in opts.sizes or SIZES[:2]:
+        profiler = profile_pipeline(n)
+        print('n = %d' % n)
+        print(profiler.to_frame().to_string(na_rep=''))
+        if opts.record:
+            previous = [r for r in read_records(opts.record) if r['n'] == n]
+            record = record_results(opts.record, n, profiler)
+            if previous:
+                print('vs. %s:' % previous[-1]['commit'])
+                print(compare_records(record, previous[-1]).to_string(
+                    float_format=lambda x: '%.4f' % x))
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+benchmarks.bench_read_transactions
+===================================
+
+Benchmark :func:`pypfi.pypfi.read_transactions_tsv` options against the
+previous ``pd.read_csv(parse_dates=['date'], thousands=',')`` call,
+on files in the ``pypfi.datagenerator`` output format
+(``2014-12-18 10:57:00-06:00,ABC fehQyUpDSU,-80.09,9919.91``).
+
+Usage::
+
+    python -m benchmarks.bench_read_transactions -n 1000000
+    python -m benchmarks.bench_read_transactions -n 10000000 -r 1
+
+"""
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+import arrow
+import pandas as pd
+
+from pypfi import pypfi
+from pypfi.datagenerator import BulkDataGenerator
+
+
+def write_transactions_csv(path, n, tz='America/Chicago', seed=0):
+    """
+    Write ``n`` rows with :class:`pypfi.datagenerator.BulkDataGenerator`
+
+    (The initial balance is high enough that the random walk of the
+    balance does not overdraw, which would stop the ledger early.)
+
+    Args:
+        path (str): output path
+        n (int): number of rows
+        tz (str): timezone of the dates (UTC offsets change with DST)
+        seed (int): random seed
+    """
+    date_start = arrow.get('2014-12-18T10:57:00').replace(tzinfo=tz)
+    generator = BulkDataGenerator(initial_balance=10 ** 6,
+                                  date_start=date_start,
+                                  max_count=n,
+                                  seed=seed)
+    with open(path, 'wb') as f:
+        generator.write_csv(f)
+
+
+def read_transactions_legacy(path):
+    return pd.read_csv(path,
+                       parse_dates=['date'],
+                       names=['date', 'desc', 'amount', 'balance'],
+                       thousands=',')
+
+
+VARIANTS = (
+    ('legacy', read_transactions_legacy),
+    ('default', pypfi.read_transactions_tsv),
+    ('tz', lambda path: pypfi.read_transactions_tsv(
+        path, tz='America/Chicago')),
+    ('tz+category+cents', lambda path: pypfi.read_transactions_tsv(
+        path, tz='America/Chicago', desc_dtype='category', cents=True)),
+)
+
+
+class TimeReadTransactions(object):
+    params = ([1000000, 10000000], [name for name, _ in VARIANTS])
+    param_names = ['n', 'variant']
+    timeout = 3600
+
+    def setup(self, n, variant):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'transactions.csv')
+        write_transactions_csv(self.path, n)
+        self.func = dict(VARIANTS)[variant]
+
+    def teardown(self, n, variant):
+        shutil.rmtree(self.tmpdir)
+
+    def time_read_transactions(self, n, variant):
+        self.func(self.path)
+
+
+def main(*args):
+    import optparse
+
+    prs = optparse.OptionParser(usage="%prog [-n <rows>] [-r <repeat>]")
+    prs.add_option('-n', '--rows',
+                   dest='rows',
+                   type=int,
+                   default=1000000)
+    prs.add_option('-r', '--repeat',
+                   dest='repeat',
+                   type=int,
+                   default=3)
+
+    args = args and list(args) or sys.argv[1:]
+    (opts, args) = prs.parse_args(args)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'transactions.csv')
+        write_transactions_csv(path, opts.rows)
+        for name, func in VARIANTS:
+            seconds = min(timeit.repeat(lambda: func(path),
+                                        repeat=opts.repeat, number=1))
+            print("%-20s %10d rows %10.4fs" % (name, opts.rows, seconds))
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,10 +5,45 @@ from __future__ import print_function
 pypfi.accounts
 ===============
 
+Accounts, and recurring expenses and incomes.
+
+:class:`Expense` and :class:`Income` are slotted records (no instance
+``__dict__``); :class:`ExpenseTable` and :class:`IncomeTable` hold many
+of them as columns (NumPy arrays; ``freq`` as Categorical codes), for
+loading and totaling hundreds of thousands of items at once.
+
 """
+import collections
+
+import numpy as np
+import pandas as pd
+
+
+class _SlotsRecord(object):
+    """
+    Pickle support for slotted records
+
+    Without ``__getstate__``, pickle protocols 0 and 1 cannot pickle an
+    instance of a class with ``__slots__``.
+    """
+    __slots__ = ()
 
+    def _get_slots(self):
+        return [name for cls in type(self).__mro__
+                for name in getattr(cls, '__slots__', ())]
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self._get_slots()
+                    if hasattr(self, name))
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class Account(_SlotsRecord):
+    __slots__ = ('name', 'subaccounts')
 
-class Account(object):
     def __init__(self,
                  name=None,
                  subaccounts=None):
@@ -17,49 +52,254 @@ class Account(object):
 
 
 class ExpenseAccount(Account):
-    pass
+    __slots__ = ()
 
 
 class IncomeAccount(Account):
-    pass
+    __slots__ = ()
 
 
-FREQUENCIES = [
+# (ordered: the codes of ``freq`` Categoricals)
+FREQUENCIES = (
     'yearly',
     'monthly',
     'weekly',
     'daily',
     'onetime',
-]
+)
+
+FREQUENCY_CODES = dict((freq, code) for code, freq in enumerate(FREQUENCIES))
+
+# occurrences per year (a onetime item does not recur)
+PERIODS_PER_YEAR = {
+    'yearly': 1.0,
+    'monthly': 12.0,
+    'weekly': 365.25 / 7,
+    'daily': 365.25,
+    'onetime': 0.0,
+}
+
+
+def get_frequency_codes(values):
+    """
+    Args:
+        values (array-like): frequency names (one of ``FREQUENCIES`` each)
+    Returns:
+        numpy.ndarray: codes (int8; indexes of ``FREQUENCIES``)
+    Raises:
+        KeyError: if a value is not one of ``FREQUENCIES``
+    """
+    codes = pd.Categorical(
+        np.asarray(values, dtype=object), categories=FREQUENCIES).codes
+    if (codes == -1).any():
+        raise KeyError(np.asarray(values, dtype=object)[codes == -1][0])
+    return codes.astype(np.int8)
+
+
+class Expense(_SlotsRecord):
+    __slots__ = ('name', 'freq', 'amount', 'payee')
 
-class Expense(object):
     def __init__(self,
                  name=None,
                  freq=None,
                  amount=None,
                  payee=None):
         self.name = name
-        if freq not in FREQUENCIES:
-            raise KeyError
+        if freq not in FREQUENCY_CODES:
+            raise KeyError(freq)
         self.freq = freq
         self.amount = amount
         self.payee = payee
 
 
-class Income(object):
+class Income(_SlotsRecord):
+    __slots__ = ('name', 'freq', 'amount', 'source')
+
     def __init__(self,
                  name=None,
                  freq=None,
                  amount=None,
                  source=None):
         self.name = name
-        if freq not in FREQUENCIES:
-            raise KeyError
+        if freq not in FREQUENCY_CODES:
+            raise KeyError(freq)
         self.freq = freq
         self.amount = amount
         self.source = source
 
 
+class _RecurringTable(object):
+    """
+    Recurring items as columns: ``name``, ``freq``, ``amount`` and
+    ``party`` (an :class:`ExpenseTable`'s ``payee``, an
+    :class:`IncomeTable`'s ``source``)
+    """
+    record_class = None
+    party = None
+
+    def __init__(self, name, freq, amount, party=None):
+        """
+        Args:
+            name (array-like): item names
+            freq (array-like): frequency names (``FREQUENCIES``), or a
+                Categorical with categories ``FREQUENCIES``
+            amount (array-like): amounts (None: NaN)
+            party (array-like): payees or sources (default: None)
+        Raises:
+            KeyError: if a ``freq`` is not one of ``FREQUENCIES``
+        """
+        self.name = np.asarray(name, dtype=object)
+        if (isinstance(freq, pd.Categorical) and
+                list(freq.categories) == list(FREQUENCIES) and
+                not (freq.codes == -1).any()):
+            self.freq_codes = freq.codes.astype(np.int8)
+        else:
+            self.freq_codes = get_frequency_codes(freq)
+        self.amount = np.array(
+            [np.nan if x is None else x for x in amount]
+            if not isinstance(amount, np.ndarray) else amount,
+            dtype=np.float64)
+        if party is None:
+            party = np.full(len(self.name), None, dtype=object)
+        self.parties = np.asarray(party, dtype=object)
+        lengths = set(map(len, (self.name, self.freq_codes, self.amount,
+                                self.parties)))
+        if len(lengths) > 1:
+            raise ValueError('columns have different lengths: %r' % (
+                sorted(lengths),))
+
+    @property
+    def columns(self):
+        return ('name', 'freq', 'amount', self.party)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Args:
+            records (iterable): ``record_class`` instances
+        Returns:
+            table
+        """
+        records = list(records)
+        return cls([x.name for x in records],
+                   [x.freq for x in records],
+                   [x.amount for x in records],
+                   [getattr(x, cls.party) for x in records])
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Args:
+            df (pandas.DataFrame): ``name``, ``freq``, ``amount`` and
+                (optionally) ``payee``/``source`` columns
+        Returns:
+            table
+        """
+        freq = df['freq']
+        if freq.dtype.name == 'category':
+            freq = freq.values
+        party = None
+        if cls.party in df.columns:
+            party = df[cls.party].where(df[cls.party].notnull(), None).values
+        return cls(df['name'].values, freq, df['amount'].values, party)
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        """
+        Args:
+            path (str): CSV file with the :meth:`from_frame` columns
+            kwargs (dict): ``pd.read_csv`` arguments
+        Returns:
+            table
+        """
+        kwargs.setdefault('dtype', {'freq': 'category'})
+        return cls.from_frame(pd.read_csv(path, **kwargs))
+
+    def __len__(self):
+        return len(self.name)
+
+    def __getitem__(self, column):
+        """
+        Args:
+            column (str): one of ``self.columns``
+        Returns:
+            numpy.ndarray or pandas.Categorical: the column (``freq``: a
+            Categorical with categories ``FREQUENCIES``)
+        """
+        if column == 'name':
+            return self.name
+        elif column == 'freq':
+            return pd.Categorical.from_codes(self.freq_codes, FREQUENCIES)
+        elif column == 'amount':
+            return self.amount
+        elif column == self.party:
+            return self.parties
+        raise KeyError(column)
+
+    def to_frame(self):
+        """
+        Returns:
+            pandas.DataFrame: one row per item, one column per
+            ``self.columns``
+        """
+        return pd.DataFrame(collections.OrderedDict(
+            (column, self[column]) for column in self.columns))
+
+    def to_records(self):
+        """
+        Returns:
+            list: a ``record_class`` instance per item
+        """
+        return [self.record_class(name, FREQUENCIES[code],
+                                  None if np.isnan(amount) else amount,
+                                  party)
+                for name, code, amount, party in zip(
+                    self.name.tolist(), self.freq_codes.tolist(),
+                    self.amount.tolist(), self.parties.tolist())]
+
+    def get_monthly_amounts(self):
+        """
+        Returns:
+            numpy.ndarray: the average monthly amount of each item
+            (``amount * PERIODS_PER_YEAR[freq] / 12``; onetime: 0)
+        """
+        factors = np.array([PERIODS_PER_YEAR[x] / 12 for x in FREQUENCIES])
+        return self.amount * factors.take(self.freq_codes)
+
+    @property
+    def total_monthly_amount(self):
+        return np.nansum(self.get_monthly_amounts())
+
+    def total_by_freq(self):
+        """
+        Returns:
+            pandas.Series: the sum of ``amount`` of each of ``FREQUENCIES``
+        """
+        return pd.Series(
+            np.bincount(self.freq_codes, minlength=len(FREQUENCIES),
+                        weights=np.where(np.isnan(self.amount), 0,
+                                         self.amount)),
+            index=pd.Index(FREQUENCIES, name='freq'))
+
+
+class ExpenseTable(_RecurringTable):
+    """
+    :class:`Expense` s as columns (``name``, ``freq``, ``amount``,
+    ``payee``)
+    """
+    record_class = Expense
+    party = 'payee'
+
+
+class IncomeTable(_RecurringTable):
+    """
+    :class:`Income` s as columns (``name``, ``freq``, ``amount``,
+    ``source``)
+    """
+    record_class = Income
+    party = 'source'
+
+
 import unittest
 class Test_Accounts(unittest.TestCase):
     def test_011_Account(self):
@@ -109,6 +349,86 @@ class Test_Accounts(unittest.TestCase):
         self.assertEqual(i.amount, AMOUNT)
         self.assertEqual(i.source, SOURCE)
 
+    def test_061_slots(self):
+        for obj in (Account('a'), ExpenseAccount('b'), IncomeAccount('c'),
+                    Expense('d', 'daily'), Income('e', 'weekly')):
+            self.assertFalse(hasattr(obj, '__dict__'))
+            self.assertRaises(AttributeError, setattr, obj, 'x', 1)
+        self.assertRaises(KeyError, Expense, 'f', 'hourly')
+        self.assertRaises(KeyError, Income, 'g', None)
+
+    def test_062_pickle(self):
+        import pickle
+        for obj in (Account('a', ['x']), ExpenseAccount('b'),
+                    IncomeAccount('c'), Expense('d', 'daily', 1, 'p'),
+                    Income('e', 'weekly', 2.5, 's')):
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+                output = pickle.loads(pickle.dumps(obj, protocol))
+                self.assertIs(type(output), type(obj))
+                self.assertEqual(output.__getstate__(), obj.__getstate__())
+                self.assertEqual(len(obj.__getstate__()),
+                                 len(obj._get_slots()))
+            self.assertEqual(pickle.loads(pickle.dumps(obj)).name, obj.name)
+
+    def test_071_ExpenseTable(self):
+        expenses = [Expense('rent', 'monthly', 1200, 'Landlord'),
+                    Expense('coffee', 'daily', 3.5, 'Cafe'),
+                    Expense('insurance', 'yearly', 600, None),
+                    Expense('laptop', 'onetime', 1000, 'Shop'),
+                    Expense('misc', 'weekly', None, None)]
+        table = ExpenseTable.from_records(expenses)
+        self.assertEqual(len(table), 5)
+        self.assertEqual(table.columns, ('name', 'freq', 'amount', 'payee'))
+        self.assertEqual(list(table['freq']),
+                         ['monthly', 'daily', 'yearly', 'onetime', 'weekly'])
+        self.assertEqual(table['freq'].dtype.name, 'category')
+        self.assertEqual(list(table['payee']),
+                         ['Landlord', 'Cafe', None, 'Shop', None])
+        np.testing.assert_allclose(
+            table.get_monthly_amounts(),
+            [1200, 3.5 * 365.25 / 12, 50, 0, np.nan])
+        self.assertAlmostEqual(table.total_monthly_amount,
+                               1250 + 3.5 * 365.25 / 12)
+        self.assertEqual(table.total_by_freq()['monthly'], 1200)
+        self.assertEqual(table.total_by_freq()['weekly'], 0)
+
+        records = table.to_records()
+        self.assertTrue(all(isinstance(x, Expense) for x in records))
+        self.assertEqual(
+            [(x.name, x.freq, x.amount, x.payee) for x in records],
+            [(x.name, x.freq, x.amount, x.payee) for x in expenses])
+
+        df = table.to_frame()
+        self.assertEqual(list(df.columns), list(table.columns))
+        output = ExpenseTable.from_frame(df)
+        pd.util.testing.assert_frame_equal(output.to_frame(), df)
+
+        self.assertRaises(KeyError, ExpenseTable, ['a'], ['hourly'], [1])
+        self.assertRaises(ValueError, ExpenseTable, ['a', 'b'], ['daily'], [1])
+
+    def test_081_IncomeTable(self):
+        import os
+        import shutil
+        import tempfile
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'incomes.csv')
+            with open(path, 'w') as f:
+                f.write('name,freq,amount,source\n'
+                        'salary,monthly,3000,ACME\n'
+                        'bonus,yearly,1200,ACME\n'
+                        'gift,onetime,100,\n')
+            table = IncomeTable.from_csv(path)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(table.columns, ('name', 'freq', 'amount', 'source'))
+        self.assertEqual(list(table['freq']), ['monthly', 'yearly', 'onetime'])
+        self.assertEqual(table.total_monthly_amount, 3100)
+        records = table.to_records()
+        self.assertTrue(all(isinstance(x, Income) for x in records))
+        self.assertEqual(records[1].source, 'ACME')
+        self.assertIsNone(records[2].source)
+
 
 def main(*args):
     import logging
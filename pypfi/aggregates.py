@@ -0,0 +1,718 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.aggregates
+=================
+
+Single-pass grouped aggregates of one value column over several keys.
+
+Each grouping key is factorized to integer codes once; the codes are
+combined into one composite group id per row, and ``count`` and ``sum``
+are reduced with ``np.bincount`` in one scan of the value column.
+The aggregates for each key are then rolled up from the (small) table of
+composite groups.
+
+"""
+import collections
+import unittest
+
+import numpy as np
+import pandas as pd
+
+
+AGGFUNCS = (
+    'sum',
+    'count',
+    'mean',
+    'std',
+    'min',
+    'max',
+)
+
+
+def factorize_key(values, name=None):
+    """
+    Factorize a grouping key column to integer codes
+
+    Args:
+        values (pandas.Series): key column
+        name (str): name of the returned index (default: ``values.name``)
+    Returns:
+        tuple: ``(codes, level, ordered)`` where ``codes`` is an int64
+        array (``-1`` for NA), ``level`` is a sorted ``pandas.Index`` of
+        labels, and ``ordered`` is None (not a Categorical) or the
+        Categorical ``ordered`` flag
+    """
+    name = values.name if name is None else name
+    if pd.api.types.is_categorical_dtype(values):
+        cat = values.values
+        return (np.asarray(cat.codes, dtype=np.int64),
+                pd.Index(np.asarray(cat.categories), name=name),
+                cat.ordered)
+    codes, uniques = pd.factorize(values, sort=True)
+    return (np.asarray(codes, dtype=np.int64),
+            pd.Index(uniques, name=name),
+            None)
+
+
+def combine_codes(codes_list, sizes):
+    """
+    Combine the codes of several keys into one group id per row
+
+    Args:
+        codes_list (list): int64 code arrays (``-1`` for NA), one per key
+        sizes (list): number of labels for each key
+    Returns:
+        tuple: ``(group_ids, group_codes)`` where ``group_ids`` is an
+        int64 array of dense group ids (one per row) and
+        ``group_codes`` is a list of int64 arrays (one per key) of the
+        key codes of each group
+    """
+    n = len(codes_list[0]) if codes_list else 0
+    radixes = [size + 1 for size in sizes]  # +1: NA (-1) is its own code
+    if np.prod([float(r) for r in radixes]) < 2 ** 62:
+        composite = np.zeros(n, dtype=np.int64)
+        for codes, radix in zip(codes_list, radixes):
+            composite *= radix
+            composite += codes + 1
+        group_ids, uniques = pd.factorize(composite)
+        group_codes = []
+        for radix in reversed(radixes):
+            uniques, codes = np.divmod(uniques, radix)
+            group_codes.insert(0, codes - 1)
+        return np.asarray(group_ids, dtype=np.int64), group_codes
+
+    # too many combinations for one int64: combine one key at a time
+    group_ids = np.zeros(n, dtype=np.int64)
+    group_codes = []
+    for codes, radix in zip(codes_list, radixes):
+        group_ids, uniques = pd.factorize(group_ids * radix + (codes + 1))
+        previous, current = np.divmod(uniques, radix)
+        group_codes = [c[previous] for c in group_codes] + [current - 1]
+    return np.asarray(group_ids, dtype=np.int64), group_codes
+
+
+PERCENTILES = (0.25, 0.5, 0.75)
+
+
+def get_percentile_label(q):
+    """
+    Args:
+        q (float): percentile (0-1)
+    Returns:
+        str: label used by ``describe()``: ``25%``
+    """
+    return "%g%%" % (q * 100)
+
+
+class TDigest(object):
+    """
+    A mergeable t-digest of a stream of values, for approximate quantiles
+
+    Values are kept exactly until there are more than ``10 * compression``
+    centroids; then neighbouring centroids are merged into buckets of
+    equal width in the ``k1`` scale (``arcsin``), which keeps the tails
+    precise.
+    """
+
+    def __init__(self, compression=200, means=None, weights=None,
+                 minimum=np.nan, maximum=np.nan):
+        """
+        Args:
+            compression (int): approximate number of centroids kept
+            means (array-like): centroid means (sorted)
+            weights (array-like): centroid weights
+            minimum (float): smallest value seen
+            maximum (float): largest value seen
+        """
+        self.compression = compression
+        self.means = np.asarray(
+            means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(
+            weights if weights is not None else [], dtype=np.float64)
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_sorted(cls, values, compression=200):
+        """
+        Args:
+            values (numpy.ndarray): sorted values (without NaN)
+            compression (int): approximate number of centroids kept
+        Returns:
+            TDigest: digest of ``values``
+        """
+        if not len(values):
+            return cls(compression)
+        return cls(compression, values, np.ones(len(values)),
+                   values[0], values[-1])._compress()
+
+    @property
+    def count(self):
+        return self.weights.sum()
+
+    def _compress(self):
+        if len(self.means) <= 10 * self.compression:
+            return self
+        cumulative = np.cumsum(self.weights)
+        q = (cumulative - self.weights / 2.0) / cumulative[-1]
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        buckets = np.floor(k - k[0]).astype(np.int64)
+        weights = np.bincount(buckets, weights=self.weights)
+        sums = np.bincount(buckets, weights=self.means * self.weights)
+        nonempty = weights > 0
+        self.weights = weights[nonempty]
+        self.means = sums[nonempty] / self.weights
+        return self
+
+    def merge(self, other):
+        """
+        Args:
+            other (TDigest): digest to merge
+        Returns:
+            TDigest: new digest of the values of ``self`` and ``other``
+        """
+        means = np.concatenate([self.means, other.means])
+        weights = np.concatenate([self.weights, other.weights])
+        order = np.argsort(means, kind='mergesort')
+        return TDigest(self.compression, means[order], weights[order],
+                       np.fmin(self.minimum, other.minimum),
+                       np.fmax(self.maximum, other.maximum))._compress()
+
+    def quantile(self, q):
+        """
+        Args:
+            q (float): quantile (0-1)
+        Returns:
+            float: estimated quantile (linearly interpolated, and exact
+            while the digest is not compressed)
+        """
+        if not len(self.means):
+            return np.nan
+        centers = np.cumsum(self.weights) - self.weights / 2.0
+        target = q * (centers[-1] + self.weights[-1] / 2.0 - 1) + 0.5
+        return np.interp(target,
+                         np.concatenate([[0], centers, [centers[-1] +
+                                                         self.weights[-1] / 2.0]]),
+                         np.concatenate([[self.minimum], self.means,
+                                         [self.maximum]]))
+
+
+def _reduce_groups(group_ids, ngroups, columns):
+    """
+    Reduce the (partial) aggregates of each row into groups
+
+    Args:
+        group_ids (numpy.ndarray): group id of each row
+        ngroups (int): number of groups
+        columns (dict): partial ``count`` and ``sum`` arrays, and optional
+            ``min``, ``max``, ``m2`` (sum of squared deviations from the
+            mean) and ``digest`` (object array of TDigest) arrays
+    Returns:
+        collections.OrderedDict: reduced arrays (one value per group)
+    """
+    output = collections.OrderedDict()
+    count = columns['count']
+    output['count'] = np.bincount(
+        group_ids, weights=count, minlength=ngroups).astype(np.int64)
+    output['sum'] = np.bincount(
+        group_ids, weights=columns['sum'], minlength=ngroups)
+    for name, func in (('min', np.fmin), ('max', np.fmax)):
+        if name in columns:
+            output[name] = np.full(ngroups, np.nan)
+            func.at(output[name], group_ids, columns[name])
+    if 'm2' in columns:
+        # parallel variance (Chan et al.): M2 = sum(M2_i) +
+        # sum(n_i * (mean_i - mean)**2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = output['sum'] / output['count']
+            deviation = np.where(
+                count > 0, columns['sum'] / count - mean[group_ids], 0)
+        output['m2'] = np.bincount(
+            group_ids, weights=columns['m2'] + count * deviation ** 2,
+            minlength=ngroups)
+    if 'digest' in columns:
+        digests = np.empty(ngroups, dtype=object)
+        for group_id, digest in zip(group_ids, columns['digest']):
+            if digests[group_id] is None:
+                digests[group_id] = digest
+            else:
+                digests[group_id] = digests[group_id].merge(digest)
+        output['digest'] = digests
+    return output
+
+
+class GroupAccumulator(object):
+    """
+    Accumulate grouped aggregates of one value column over several keys
+
+    The state is one row per observed combination of key labels
+    (``self.state``, a DataFrame with a MultiIndex), so chunks of a
+    larger frame can be folded in with :meth:`update` and two
+    accumulators can be combined with :meth:`merge`.
+    """
+
+    def __init__(self, keys, value='amount', aggfuncs=('sum',),
+                 percentiles=None, compression=200):
+        """
+        Args:
+            keys (list): names of the grouping key columns
+            value (str): name of the value column to aggregate
+            aggfuncs (iterable): subset of ``AGGFUNCS``
+                (``count`` and ``sum`` are always tracked)
+            percentiles (iterable): percentiles (0-1) for
+                :meth:`describe_groups` (``None``: do not track
+                ``describe()`` statistics)
+            compression (int): compression of the percentile TDigests
+        """
+        for aggfunc in aggfuncs:
+            if aggfunc not in AGGFUNCS:
+                raise KeyError(aggfunc)
+        self.keys = list(keys)
+        self.value = value
+        self.aggfuncs = tuple(aggfuncs)
+        self.percentiles = (
+            tuple(percentiles) if percentiles is not None else None)
+        self.compression = compression
+        describe = self.percentiles is not None
+        self.track_minmax = describe or bool(
+            set(self.aggfuncs) & set(('min', 'max')))
+        self.track_m2 = describe or 'std' in self.aggfuncs
+        self.ordered = {}
+        self.state = None
+
+    def _chunk_state(self, df):
+        codes_list, levels = [], []
+        for key in self.keys:
+            codes, level, ordered = factorize_key(df[key], name=key)
+            codes_list.append(codes)
+            levels.append(level)
+            if ordered is not None:
+                self.ordered[key] = ordered
+        group_ids, group_codes = combine_codes(
+            codes_list, [len(level) for level in levels])
+
+        values = np.asarray(df[self.value], dtype=np.float64)
+        isnull = np.isnan(values)
+        ngroups = len(group_codes[0]) if group_codes else 0
+        reduced = _reduce_groups(group_ids, ngroups, {
+            'count': (~isnull).astype(np.float64),
+            'sum': np.where(isnull, 0, values)})
+        if self.track_minmax:
+            grouped = pd.Series(values).groupby(group_ids, sort=True)
+            groups = np.arange(ngroups)
+            reduced['min'] = grouped.min().reindex(groups).values
+            reduced['max'] = grouped.max().reindex(groups).values
+        if self.track_m2:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = reduced['sum'] / reduced['count']
+            reduced['m2'] = np.bincount(
+                group_ids[~isnull],
+                weights=(values[~isnull] - mean[group_ids[~isnull]]) ** 2,
+                minlength=ngroups)
+        if self.percentiles is not None:
+            notnull = ~isnull
+            order = np.lexsort((values[notnull], group_ids[notnull]))
+            sorted_values = values[notnull][order]
+            bounds = np.cumsum(reduced['count'])[:-1]
+            reduced['digest'] = np.empty(ngroups, dtype=object)
+            for i, group_values in enumerate(np.split(sorted_values, bounds)):
+                reduced['digest'][i] = TDigest.from_sorted(
+                    group_values, self.compression)
+        index = pd.MultiIndex(levels=levels, codes=group_codes,
+                              names=self.keys, verify_integrity=False)
+        return pd.DataFrame(reduced, index=index)
+
+    def _merge_state(self, states):
+        states = [s for s in states if s is not None]
+        if len(states) == 1:
+            return states[0]
+        levels, codes_list = [], []
+        for i, key in enumerate(self.keys):
+            level = states[0].index.levels[i]
+            for state in states[1:]:
+                level = level.union(state.index.levels[i])
+            level = level.rename(key)
+            levels.append(level)
+            codes_list.append(np.concatenate([
+                np.where(state.index.codes[i] == -1, -1,
+                         level.get_indexer(state.index.levels[i])[
+                             state.index.codes[i]])
+                for state in states]).astype(np.int64))
+        group_ids, group_codes = combine_codes(
+            codes_list, [len(level) for level in levels])
+        ngroups = len(group_codes[0]) if group_codes else 0
+        reduced = _reduce_groups(group_ids, ngroups, dict(
+            (name, np.concatenate([s[name].values for s in states]))
+            for name in states[0].columns))
+        index = pd.MultiIndex(levels=levels, codes=group_codes,
+                              names=self.keys, verify_integrity=False)
+        return pd.DataFrame(reduced, index=index)
+
+    def update(self, df):
+        """
+        Fold the rows of ``df`` into the accumulated state
+
+        Args:
+            df (pandas.DataFrame): frame with the key and value columns
+        Returns:
+            GroupAccumulator: self
+        """
+        self.state = self._merge_state([self.state, self._chunk_state(df)])
+        return self
+
+    def merge(self, other):
+        """
+        Fold the state of another accumulator (with the same keys)
+
+        Args:
+            other (GroupAccumulator): accumulator to merge
+        Returns:
+            GroupAccumulator: self
+        """
+        if other.keys != self.keys or other.value != self.value:
+            raise ValueError("keys and value must match")
+        self.ordered.update(other.ordered)
+        self.state = self._merge_state([self.state, other.state])
+        return self
+
+    def rollup(self, keys):
+        """
+        Reduce the state to a subset of the keys
+
+        Args:
+            keys (list): names of (some of) ``self.keys``
+        Returns:
+            pandas.DataFrame: state columns (``count``, ``sum``, ...) with
+            one row per observed combination of ``keys`` labels (a
+            MultiIndex; NA labels have code ``-1``)
+        """
+        positions = [self.keys.index(key) for key in keys]
+        levels = [self.state.index.levels[i] for i in positions]
+        group_ids, group_codes = combine_codes(
+            [np.asarray(self.state.index.codes[i], dtype=np.int64)
+             for i in positions],
+            [len(level) for level in levels])
+        ngroups = len(group_codes[0]) if group_codes else 0
+        reduced = _reduce_groups(group_ids, ngroups, dict(
+            (name, self.state[name].values) for name in self.state.columns))
+        index = pd.MultiIndex(levels=levels, codes=group_codes,
+                              names=list(keys), verify_integrity=False)
+        return pd.DataFrame(reduced, index=index)
+
+    def _rollup_index(self, key):
+        level = self.state.index.levels[self.keys.index(key)]
+        if key in self.ordered:
+            categories = level.rename(None)
+            return pd.CategoricalIndex(categories, categories=categories,
+                                       ordered=self.ordered[key], name=key)
+        return level
+
+    def aggregate(self, key, aggfunc='sum'):
+        """
+        Aggregate the value column grouped by one of the keys
+
+        Args:
+            key (str): grouping key name
+            aggfunc (str): one of ``self.aggfuncs`` (or count/sum)
+        Returns:
+            pandas.Series: same as
+            ``df.groupby(key)[value].agg(aggfunc)``
+        """
+        if aggfunc not in self.aggfuncs + ('count', 'sum'):
+            raise KeyError(aggfunc)
+        i = self.keys.index(key)
+        index = self._rollup_index(key)
+        codes = np.asarray(self.state.index.codes[i], dtype=np.int64)
+        mask = codes != -1
+        state = self.state[mask]
+        columns = [c for c in state.columns if c != 'digest']
+        reduced = _reduce_groups(codes[mask], len(index), dict(
+            (name, state[name].values) for name in columns))
+        count = reduced['count']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if aggfunc == 'mean':
+                values = np.where(count > 0, reduced['sum'] / count, np.nan)
+            elif aggfunc == 'std':
+                values = np.where(
+                    count > 1, np.sqrt(reduced['m2'] / (count - 1)), np.nan)
+            else:
+                values = reduced[aggfunc]
+        return pd.Series(values, index=index, name=self.value)
+
+    def aggregate_all(self):
+        """
+        Returns:
+            collections.OrderedDict: ``{key: DataFrame}`` with one column
+            per aggfunc in ``self.aggfuncs``
+        """
+        output = collections.OrderedDict()
+        for key in self.keys:
+            output[key] = pd.DataFrame(collections.OrderedDict(
+                (aggfunc, self.aggregate(key, aggfunc))
+                for aggfunc in self.aggfuncs))
+        return output
+
+    def describe_groups(self, margins_name=None):
+        """
+        Compute ``describe()`` statistics (and the sum) for each group
+
+        Requires ``percentiles``; percentiles are exact for groups of up
+        to ``10 * compression`` values and approximate (TDigest) above.
+
+        Args:
+            margins_name (str): if not None, add a row (labeled
+                ``(margins_name, '', ...)``) for all of the values
+        Returns:
+            pandas.DataFrame: one row per combination of key labels
+            (sorted, with a MultiIndex); columns as
+            :func:`describe_by_group`
+        """
+        if self.percentiles is None:
+            raise ValueError("percentiles were not tracked")
+        state = self.state.sort_index()
+        state = state[state['count'] > 0]
+        if margins_name is not None:
+            margins = _reduce_groups(
+                np.zeros(len(state), dtype=np.int64), 1,
+                dict((name, state[name].values) for name in state.columns))
+            index = state.index.append(pd.MultiIndex.from_tuples(
+                [(margins_name,) + ('',) * (len(self.keys) - 1)],
+                names=self.keys))
+            state = pd.concat([state, pd.DataFrame(margins)])
+            state.index = index
+        count = state['count'].values.astype(np.float64)
+        output = collections.OrderedDict()
+        output['count'] = count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            output['mean'] = state['sum'].values / count
+            output['std'] = np.where(
+                count > 1, np.sqrt(state['m2'].values / (count - 1)), np.nan)
+        output['min'] = state['min'].values
+        for q in self.percentiles:
+            output[get_percentile_label(q)] = [
+                digest.quantile(q) for digest in state['digest'].values]
+        output['max'] = state['max'].values
+        output['sum'] = state['sum'].values
+        return pd.DataFrame(output, index=state.index)
+
+
+def rollup_hierarchy(state, key, labels, descendants, ancestors):
+    """
+    Roll the groups of a state up a hierarchy of ``key`` labels
+
+    Each state row is added to the group of each of its ancestors (and
+    itself), so the rolled up value of a label is the aggregate of its
+    whole subtree. Only the (small) state is expanded; the transactions
+    are not re-read.
+
+    Args:
+        state (pandas.DataFrame): state with a MultiIndex (see
+            :meth:`GroupAccumulator.rollup`)
+        key (str): name of the hierarchical index level
+        labels (pandas.Index): all of the hierarchy labels
+        descendants (numpy.ndarray): positions (in ``labels``), sorted
+        ancestors (numpy.ndarray): for each of ``descendants``, the
+            position of one of its ancestors (or of itself)
+    Returns:
+        pandas.DataFrame: rolled up state, with ``labels`` as the
+        ``key`` level (sorted)
+    """
+    i = list(state.index.names).index(key)
+    codes = np.asarray(state.index.codes[i], dtype=np.int64)
+    state = state[codes != -1]
+    positions = labels.get_indexer(state.index.levels[i])[codes[codes != -1]]
+    if (positions == -1).any():
+        raise KeyError("labels not in the hierarchy")
+    counts = np.bincount(descendants, minlength=len(labels))
+    starts = np.cumsum(counts) - counts
+    repeats = counts[positions]
+    rows = np.repeat(np.arange(len(state)), repeats)
+    offsets = np.arange(len(rows)) - np.repeat(
+        np.cumsum(repeats) - repeats, repeats)
+    levels, codes_list = [], []
+    for j, level in enumerate(state.index.levels):
+        if j == i:
+            levels.append(labels.rename(key))
+            codes_list.append(
+                np.asarray(ancestors, dtype=np.int64)[
+                    starts[positions][rows] + offsets])
+        else:
+            levels.append(level)
+            codes_list.append(
+                np.asarray(state.index.codes[j], dtype=np.int64)[rows])
+    group_ids, group_codes = combine_codes(
+        codes_list, [len(level) for level in levels])
+    ngroups = len(group_codes[0]) if group_codes else 0
+    reduced = _reduce_groups(group_ids, ngroups, dict(
+        (name, state[name].values[rows]) for name in state.columns))
+    index = pd.MultiIndex(levels=levels, codes=group_codes,
+                          names=state.index.names, verify_integrity=False)
+    return pd.DataFrame(reduced, index=index).sort_index()
+
+
+def describe_by_group(values, group_ids, ngroups, percentiles=PERCENTILES):
+    """
+    Compute ``describe()`` statistics (and the sum) of values for each group
+
+    Moments are reduced with ``np.bincount``; min, max and the (exact,
+    linearly interpolated) percentiles are read from one sort of the
+    values by ``(group_id, value)``.
+
+    Args:
+        values (array-like): float values (NaN values are skipped)
+        group_ids (array-like): int group id for each value
+        ngroups (int): number of groups (``group_ids < ngroups``)
+        percentiles (iterable): percentiles (0-1) to compute
+    Returns:
+        pandas.DataFrame: one row per group; columns ``count, mean, std,
+        min, 25%, 50%, 75%, max, sum``
+    """
+    values = np.asarray(values, dtype=np.float64)
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    notnull = ~np.isnan(values)
+    values, group_ids = values[notnull], group_ids[notnull]
+
+    count = np.bincount(group_ids, minlength=ngroups)
+    total = np.bincount(group_ids, weights=values, minlength=ngroups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        m2 = np.bincount(group_ids, weights=(values - mean[group_ids]) ** 2,
+                         minlength=ngroups)
+        std = np.where(count > 1, np.sqrt(m2 / (count - 1)), np.nan)
+
+    order = np.lexsort((values, group_ids))
+    values = values[order]
+    starts = np.cumsum(count) - count
+    observed = count > 0
+    last = np.maximum(count - 1, 0)
+
+    def take(positions):
+        output = np.full(ngroups, np.nan)
+        output[observed] = values[positions[observed]]
+        return output
+
+    output = collections.OrderedDict()
+    output['count'] = count.astype(np.float64)
+    output['mean'] = mean
+    output['std'] = std
+    output['min'] = take(starts)
+    for q in percentiles:
+        position = last * float(q)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        fraction = position - lower
+        lower_values = take(starts + lower)
+        upper_values = take(starts + upper)
+        output[get_percentile_label(q)] = (
+            lower_values + (upper_values - lower_values) * fraction)
+    output['max'] = take(starts + last)
+    output['sum'] = total
+    return pd.DataFrame(output)
+
+
+def aggregate_by_keys(df, keys, value='amount', aggfuncs=('sum',)):
+    """
+    Aggregate ``df[value]`` grouped by each of ``keys`` in one pass
+
+    Args:
+        df (pandas.DataFrame): frame with the key and value columns
+        keys (list): names of the grouping key columns
+        value (str): name of the value column to aggregate
+        aggfuncs (iterable): subset of ``AGGFUNCS``
+    Returns:
+        GroupAccumulator: call ``.aggregate(key, aggfunc)`` for a Series
+    """
+    return GroupAccumulator(keys, value=value, aggfuncs=aggfuncs).update(df)
+
+
+class Test_aggregates(unittest.TestCase):
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        n = 1000
+        self.df = pd.DataFrame({
+            'a': rs.randint(0, 5, n),
+            'b': pd.Categorical.from_codes(rs.randint(0, 3, n),
+                                           ['x', 'y', 'z']),
+            'c': rs.choice(['p', 'q', None], n),
+            'amount': np.round(rs.uniform(-100, 100, n), 2)})
+        self.df.loc[::7, 'amount'] = np.nan
+        self.keys = ['a', 'b', 'c']
+
+    def assertAggregatesEqual(self, acc, df):
+        for key in self.keys:
+            for aggfunc in acc.aggfuncs:
+                expected = df.groupby(key)['amount'].agg(aggfunc)
+                pd.util.testing.assert_series_equal(
+                    acc.aggregate(key, aggfunc), expected,
+                    check_dtype=aggfunc != 'count')
+
+    def test_010_aggregate_by_keys(self):
+        acc = aggregate_by_keys(self.df, self.keys, aggfuncs=AGGFUNCS)
+        self.assertAggregatesEqual(acc, self.df)
+
+    def test_020_update_merge(self):
+        acc = GroupAccumulator(self.keys, aggfuncs=AGGFUNCS)
+        acc.update(self.df[:300]).update(self.df[300:600])
+        other = aggregate_by_keys(self.df[600:], self.keys, aggfuncs=AGGFUNCS)
+        acc.merge(other)
+        self.assertAggregatesEqual(acc, self.df)
+
+    def test_025_describe_by_group(self):
+        df = self.df[self.df['a'] != 4].copy()
+        df.loc[df.index[0], 'a'] = 4  # a group with one value
+        output = describe_by_group(df['amount'], df['a'], 6)
+        expected = df.groupby('a')['amount'].describe()
+        self.assertEqual(list(output.index), list(range(6)))
+        self.assertEqual(output.loc[5, 'count'], 0)
+        self.assertTrue(np.isnan(output.loc[4, 'std']))
+        pd.util.testing.assert_frame_equal(
+            output.loc[expected.index, expected.columns], expected,
+            check_names=False)
+        pd.util.testing.assert_series_equal(
+            output.loc[expected.index, 'sum'],
+            df.groupby('a')['amount'].sum(), check_names=False)
+
+    def test_027_describe_groups(self):
+        acc = GroupAccumulator(['a'], aggfuncs=('std',),
+                               percentiles=PERCENTILES)
+        for start in range(0, len(self.df), 300):
+            acc.update(self.df[start:start + 300])
+        output = acc.describe_groups(margins_name='All')
+        codes, level, _ = factorize_key(self.df['a'])
+        expected = describe_by_group(self.df['amount'], codes, len(level))
+        expected = expected.append(describe_by_group(
+            self.df['amount'], np.zeros(len(self.df), dtype=np.int64), 1))
+        np.testing.assert_allclose(output.values, expected.values)
+        pd.util.testing.assert_series_equal(
+            acc.aggregate('a', 'std'), self.df.groupby('a')['amount'].std())
+
+    def test_028_TDigest(self):
+        rs = np.random.RandomState(0)
+        values = rs.standard_normal(100000)
+        digest = TDigest.from_sorted(np.sort(values[:50000]))
+        digest = digest.merge(TDigest.from_sorted(np.sort(values[50000:])))
+        self.assertLess(len(digest.means), 1000)
+        self.assertEqual(digest.count, len(values))
+        for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+            self.assertAlmostEqual(digest.quantile(q),
+                                   np.percentile(values, q * 100), delta=0.01)
+
+    def test_029_rollup(self):
+        acc = aggregate_by_keys(self.df, self.keys, aggfuncs=AGGFUNCS)
+        output = acc.rollup(['a', 'b']).sort_index()
+        grouped = self.df.groupby(['a', 'b'])['amount']
+        np.testing.assert_allclose(output['sum'].values, grouped.sum().values)
+        np.testing.assert_array_equal(output['count'].values,
+                                      grouped.count().values)
+        np.testing.assert_allclose(
+            np.sqrt(output['m2'] / (output['count'] - 1)).values,
+            grouped.std().values)
+
+    def test_030_combine_codes_large(self):
+        codes_list = [np.array([0, 1, 0, -1]), np.array([2, 2, 2, 0])]
+        group_ids, group_codes = combine_codes(codes_list, [2 ** 40, 2 ** 40])
+        self.assertEqual(list(group_ids), [0, 1, 0, 2])
+        self.assertEqual(list(group_codes[0]), [0, 1, -1])
+        self.assertEqual(list(group_codes[1]), [2, 2, 0])
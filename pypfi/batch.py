@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.batch
+============
+
+Process many statement files in one invocation.
+
+Inputs are directories, globs, or ``@manifest`` files (one input per
+line; relative paths are relative to the manifest). Each input is read
+and reported by a worker process (see
+:class:`pypfi.scheduler.ReportScheduler`), so interpreter, numpy and
+pandas startup is paid once per worker, not once per file. One HTML
+report is written per input, plus a combined summary report; a per-file
+timing table is printed.
+
+Usage::
+
+    python -m pypfi.batch -o reports/ -j 8 statements/ '2015-*.csv' @manifest.txt
+
+"""
+import collections
+import glob
+import logging
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import pypfi as _pypfi
+    from . import scheduler as _scheduler
+except (ImportError, ValueError):  # python ./pypfi/batch.py
+    import pypfi as _pypfi
+    import scheduler as _scheduler
+
+log = logging.getLogger('pypfi.batch')
+
+
+INPUT_EXTENSIONS = ('.csv', '.tsv')
+
+BUILD_KWARGS = ('wide_pivots', 'chunksize', 'date_format', 'tz', 'engine',
+                'cache')
+
+WRITE_KWARGS = ('max_rows', 'compress', 'lazy')
+
+
+def expand_inputs(specs, extensions=INPUT_EXTENSIONS):
+    """
+    Expand directories, globs and ``@manifest`` files into input paths
+
+    Args:
+        specs (iterable): directories (files with ``extensions``, sorted),
+            globs (sorted matches), ``@manifest`` files, or paths
+        extensions (iterable): file extensions to list from directories
+    Returns:
+        list: input paths, in order, without duplicates
+    """
+    output = []
+    for spec in specs:
+        if spec.startswith('@'):
+            manifest = spec[1:]
+            basedir = os.path.dirname(manifest)
+            with open(manifest) as f:
+                lines = [line.strip() for line in f]
+            paths = expand_inputs(
+                [os.path.join(basedir, line) for line in lines
+                 if line and not line.startswith('#')],
+                extensions=extensions)
+        elif os.path.isdir(spec):
+            paths = sorted(
+                os.path.join(spec, filename)
+                for filename in os.listdir(spec)
+                if os.path.splitext(filename)[1].lower() in extensions)
+        elif glob.has_magic(spec):
+            paths = sorted(glob.glob(spec))
+        else:
+            paths = [spec]
+        for path in paths:
+            if path not in output:
+                output.append(path)
+    return output
+
+
+def get_output_files(input_files, output_dir, suffix='.html', reserved=()):
+    """
+    Args:
+        input_files (list): input paths
+        output_dir (str): output directory
+        suffix (str): output file suffix (e.g. ``.html.gz``)
+        reserved (iterable): paths which must not be used
+            (e.g. the summary report)
+    Returns:
+        list: ``<output_dir>/<input name><suffix>`` for each input
+        (``<input name>-2<suffix>``, ... for repeated or reserved names)
+    """
+    output = []
+    seen = collections.Counter()
+    used = set(os.path.normpath(x) for x in reserved)
+    for path in input_files:
+        name = os.path.splitext(os.path.basename(path))[0]
+        output_file = None
+        while output_file is None or os.path.normpath(output_file) in used:
+            seen[name] += 1
+            output_name = name
+            if seen[name] > 1:
+                output_name = '%s-%d' % (name, seen[name])
+            output_file = os.path.join(output_dir, output_name + suffix)
+        used.add(os.path.normpath(output_file))
+        output.append(output_file)
+    return output
+
+
+def process_statement(job):
+    """
+    Build and write the report for one statement file (in a worker)
+
+    Args:
+        job (tuple): ``(input_file, output_file, kwargs)``; ``kwargs`` are
+            :func:`pypfi.pypfi.pypfi` arguments
+    Returns:
+        collections.OrderedDict: ``input_file``, ``output_file``,
+        ``status``, ``rows``, ``amount``, ``build_s``, ``write_s``,
+        ``total_s``, and ``groupby_yearmonth`` (a Series, or None)
+    """
+    input_file, output_file, kwargs = job
+    result = collections.OrderedDict((
+        ('input_file', input_file),
+        ('output_file', output_file),
+        ('status', 'ok'),
+        ('rows', np.nan),
+        ('amount', np.nan),
+        ('build_s', np.nan),
+        ('write_s', np.nan),
+        ('total_s', np.nan),
+        ('groupby_yearmonth', None)))
+    start = time.time()
+    try:
+        report_dict = _pypfi.build_report_dict(
+            input_file, output=StringIO.StringIO(),
+            **dict((k, v) for k, v in kwargs.items() if k in BUILD_KWARGS))
+        built = time.time()
+        result['build_s'] = built - start
+        _pypfi.write_report(
+            input_file, output_file, report_dict,
+            **dict((k, v) for k, v in kwargs.items() if k in WRITE_KWARGS))
+        result['write_s'] = time.time() - built
+        yearmonth = report_dict['build_groupby_reports']['groupby_yearmonth']
+        result['groupby_yearmonth'] = yearmonth.astype(float)
+        result['amount'] = yearmonth.sum()
+        if kwargs.get('chunksize'):
+            result['rows'] = report_dict['ingest']['rows']
+        else:
+            result['rows'] = len(report_dict['df'])
+    except Exception as e:
+        log.exception('%s: %s', input_file, e)
+        result['status'] = 'error: %s' % e
+    result['total_s'] = time.time() - start
+    return result
+
+
+def build_summary_reports(results):
+    """
+    Combine the per-file results of :func:`process_statement`
+
+    Args:
+        results (list): results of :func:`process_statement`
+    Returns:
+        pypfi.pypfi.ReportDict: ``files`` (status, rows, amount and
+        timings of each file) and ``groupby_yearmonth`` (amount by month,
+        one column per file, and an ``All`` column)
+    """
+    report_dict = _pypfi.ReportDict(headingchar='=', headinghtml='h2')
+    files = pd.DataFrame(
+        [collections.OrderedDict(
+            (k, v) for k, v in result.items() if k != 'groupby_yearmonth')
+         for result in results])
+    if len(files):
+        files = files.set_index('input_file')
+        files.loc['All'] = files[
+            ['rows', 'amount', 'build_s', 'write_s', 'total_s']].sum()
+        files.loc['All', 'status'] = ''
+    report_dict['files'] = files
+
+    columns = collections.OrderedDict(
+        (os.path.basename(result['output_file']), result['groupby_yearmonth'])
+        for result in results if result['groupby_yearmonth'] is not None)
+    if columns:
+        yearmonth = pd.concat(columns.values(), axis=1,
+                              keys=list(columns.keys()))
+        yearmonth.index = yearmonth.index.astype(str)
+        yearmonth = yearmonth.sort_index()
+        yearmonth['All'] = yearmonth.sum(axis=1)
+        report_dict['groupby_yearmonth'] = yearmonth
+    return report_dict
+
+
+def run_batch(input_files, output_dir, scheduler=None, summary_file=None,
+              suffix='.html', output=sys.stdout, **kwargs):
+    """
+    Report each input file, and write a combined summary report
+
+    Args:
+        input_files (list): statement file paths
+        output_dir (str): directory for the reports
+        scheduler (pypfi.scheduler.ReportScheduler): worker pool
+            (default: serial)
+        summary_file (str): summary report path
+            (default: ``<output_dir>/summary<suffix>``)
+        suffix (str): report file suffix
+        output (file): where to print the timing table
+        kwargs (dict): :func:`pypfi.pypfi.pypfi` arguments
+    Returns:
+        list: results of :func:`process_statement`, in input order
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    if summary_file is None:
+        summary_file = os.path.join(output_dir, 'summary' + suffix)
+    output_files = get_output_files(input_files, output_dir, suffix=suffix,
+                                    reserved=[summary_file])
+    jobs = [(input_file, output_file, kwargs)
+            for input_file, output_file in zip(input_files, output_files)]
+    if scheduler is None:
+        scheduler = _scheduler.ReportScheduler(1, mode='serial')
+    results = scheduler.map(process_statement, jobs)
+
+    report_dict = build_summary_reports(results)
+    _pypfi.write_html_report(
+        '%d statement files' % len(input_files), summary_file, report_dict,
+        compress=kwargs.get('compress'))
+
+    if results:
+        print(report_dict['files'][
+            ['status', 'rows', 'build_s', 'write_s', 'total_s']].to_string(
+                float_format=lambda x: '%.3f' % x,
+                formatters={'rows': lambda x: '%.0f' % x}), file=output)
+    return results
+
+
+class Test_batch(unittest.TestCase):
+    def setUp(self):
+        self.INPUT_FILE = os.path.join(os.path.dirname(__file__),
+                                       '..', 'tests', 'testdata.csv')
+        self.tmpdir = tempfile.mkdtemp()
+        self.inputdir = os.path.join(self.tmpdir, 'statements')
+        os.makedirs(self.inputdir)
+        for name in ('2015-01.csv', '2015-02.csv'):
+            shutil.copy(self.INPUT_FILE, os.path.join(self.inputdir, name))
+        with open(os.path.join(self.inputdir, 'notes.txt'), 'w') as f:
+            f.write('not a statement\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_010_expand_inputs(self):
+        expected = [os.path.join(self.inputdir, name)
+                    for name in ('2015-01.csv', '2015-02.csv')]
+        self.assertEqual(expand_inputs([self.inputdir]), expected)
+        self.assertEqual(
+            expand_inputs([os.path.join(self.inputdir, '*-02.csv')]),
+            expected[1:])
+        manifest = os.path.join(self.tmpdir, 'manifest.txt')
+        with open(manifest, 'w') as f:
+            f.write('# statements\nstatements/2015-02.csv\n\nstatements\n')
+        self.assertEqual(expand_inputs(['@' + manifest]),
+                         expected[::-1])
+
+    def test_020_get_output_files(self):
+        self.assertEqual(
+            get_output_files(['a/x.csv', 'b/x.csv', 'y.tsv'], 'out'),
+            ['out/x.html', 'out/x-2.html', 'out/y.html'])
+        self.assertEqual(
+            get_output_files(['summary.csv', 'a/summary.csv'], 'out',
+                             reserved=['out/summary.html']),
+            ['out/summary-2.html', 'out/summary-3.html'])
+
+    def test_040_run_batch_summary_name(self):
+        input_file = os.path.join(self.inputdir, 'summary.csv')
+        shutil.copy(self.INPUT_FILE, input_file)
+        output_dir = os.path.join(self.tmpdir, 'reports')
+        results = run_batch([input_file], output_dir,
+                            output=StringIO.StringIO(), max_rows=10)
+        self.assertEqual(results[0]['output_file'],
+                         os.path.join(output_dir, 'summary-2.html'))
+        self.assertEqual(sorted(os.listdir(output_dir)),
+                         ['summary-2.html', 'summary.html'])
+
+    def test_030_run_batch(self):
+        input_files = expand_inputs([self.inputdir]) + [
+            os.path.join(self.inputdir, 'notes.txt')]
+        output_dir = os.path.join(self.tmpdir, 'reports')
+        output = StringIO.StringIO()
+        with _scheduler.ReportScheduler(2) as scheduler:
+            results = run_batch(input_files, output_dir, scheduler=scheduler,
+                                output=output, max_rows=10)
+        self.assertEqual([r['input_file'] for r in results], input_files)
+        self.assertEqual([r['status'] for r in results[:2]], ['ok', 'ok'])
+        self.assertTrue(results[2]['status'].startswith('error'))
+        self.assertEqual(results[0]['rows'], 1436)
+        for result in results[:2]:
+            self.assertTrue(os.path.exists(result['output_file']))
+        self.assertTrue(
+            os.path.exists(os.path.join(output_dir, 'summary.html')))
+        self.assertIn('total_s', output.getvalue())
+
+    def test_050_run_batch_no_inputs(self):
+        output_dir = os.path.join(self.tmpdir, 'reports')
+        output = StringIO.StringIO()
+        self.assertEqual(run_batch([], output_dir, output=output), [])
+        self.assertEqual(output.getvalue(), '')
+        self.assertTrue(
+            os.path.exists(os.path.join(output_dir, 'summary.html')))
+        self.assertRaises(SystemExit, main, '-o', output_dir, '-q',
+                          os.path.join(self.inputdir, 'nomatch*.csv'))
+
+
+def main(*args):
+    import optparse
+
+    prs = optparse.OptionParser(
+        usage="%prog -o <output_dir> <dir|glob|@manifest> [...]")
+
+    prs.add_option('-o', '--output-dir',
+                   dest='output_dir',)
+    prs.add_option('-j', '--jobs',
+                   dest='jobs',
+                   help='Number of worker processes (default: CPU count)',
+                   type=int,
+                   default=None)
+    prs.add_option('--summary-file',
+                   dest='summary_file',
+                   help='Summary report path (default: OUTPUT_DIR/summary.html)',
+                   default=None)
+    prs.add_option('--date-format',
+                   dest='date_format',
+                   help='strptime format of the date column',
+                   default=None)
+    prs.add_option('--tz',
+                   dest='tz',
+                   help='Convert dates to this timezone (e.g. US/Central)',
+                   default=None)
+    prs.add_option('--engine',
+                   dest='engine',
+                   help='pandas.read_csv parser engine (c or python)',
+                   type='choice',
+                   choices=_pypfi.CSV_ENGINES,
+                   default='c')
+    prs.add_option('--chunksize',
+                   dest='chunksize',
+                   help='Stream each input in chunks of this many rows',
+                   type=int,
+                   default=None)
+    prs.add_option('--max-rows',
+                   dest='max_rows',
+                   help='Truncate HTML tables to this many rows',
+                   type=int,
+                   default=None)
+    prs.add_option('-z', '--gzip',
+                   dest='compress',
+                   help='gzip the HTML reports',
+                   action='store_true',
+                   default=None)
+    prs.add_option('--lazy',
+                   dest='lazy',
+                   help='Write lazily loaded HTML reports',
+                   action='store_true',)
+    prs.add_option('--wide-pivots',
+                   dest='wide_pivots',
+                   help='Report dense pivot tables (uses more memory)',
+                   action='store_true',)
+
+    prs.add_option('-v', '--verbose',
+                    dest='verbose',
+                    action='store_true',)
+    prs.add_option('-q', '--quiet',
+                    dest='quiet',
+                    action='store_true',)
+    prs.add_option('-t', '--test',
+                    dest='run_tests',
+                    action='store_true',)
+
+    args = args and list(args) or sys.argv[1:]
+    (opts, args) = prs.parse_args(args)
+
+    if not opts.quiet:
+        logging.basicConfig()
+
+        if opts.verbose:
+            logging.getLogger().setLevel(logging.DEBUG)
+
+    if opts.run_tests:
+        sys.argv = [sys.argv[0]] + args
+        exit(unittest.main())
+
+    if not opts.output_dir or not args:
+        prs.error('an output directory (-o) and inputs are required')
+
+    input_files = expand_inputs(args)
+    if not input_files:
+        prs.error('no statement files match %s' % ' '.join(args))
+    suffix = '.html.gz' if opts.compress else '.html'
+    scheduler = _scheduler.ReportScheduler(
+        opts.jobs, mode='serial' if opts.jobs == 1 else 'process')
+    try:
+        results = run_batch(input_files, opts.output_dir,
+                            scheduler=scheduler,
+                            summary_file=opts.summary_file,
+                            suffix=suffix,
+                            wide_pivots=opts.wide_pivots,
+                            chunksize=opts.chunksize,
+                            date_format=opts.date_format,
+                            tz=opts.tz,
+                            engine=opts.engine,
+                            max_rows=opts.max_rows,
+                            compress=opts.compress,
+                            lazy=opts.lazy)
+    finally:
+        scheduler.close()
+    return 0 if all(r['status'] == 'ok' for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,9 +5,15 @@ from __future__ import print_function
 pypfi.budget
 =============
 
+:class:`Budget` is one budget; :class:`BudgetBatch` is many budget
+scenarios (what-if variants) as one array, with vectorized totals.
+
 """
 import sys
 
+import numpy as np
+import pandas as pd
+
 class Budget(object):
     monthly_expense_attrs = (
         'monthly_electric',
@@ -31,6 +37,7 @@ class Budget(object):
         'monthly_health_prescriptions',
         'monthly_home_rent',
         'monthly_home_mortgage',
+        'monthly_home_insurance',
         'monthly_pet_food',
         'monthly_pet_health',
     )
@@ -123,6 +130,133 @@ class Budget(object):
         return (self.monthly_net >= 0)
 
 
+class BudgetBatch(object):
+    """
+    Many budget scenarios: one row per scenario, one column per
+    ``Budget.monthly_income_attrs`` + ``Budget.monthly_expense_attrs``
+    attribute
+
+    Unset (``None``) attributes are NaN, and count as 0 in the totals.
+    """
+    income_attrs = Budget.monthly_income_attrs
+    expense_attrs = Budget.monthly_expense_attrs
+    attrs = income_attrs + expense_attrs
+
+    def __init__(self, values, index=None):
+        """
+        Args:
+            values (array-like): ``(n_scenarios, len(attrs))`` values
+            index (array-like): scenario labels (default: 0..n-1)
+        """
+        self.values = np.array(values, dtype=np.float64, ndmin=2)
+        if self.values.shape[1] != len(self.attrs):
+            raise ValueError('expected %d columns, got %d' % (
+                len(self.attrs), self.values.shape[1]))
+        self.index = pd.Index(
+            np.arange(len(self.values)) if index is None else index)
+        # +1 for income, -1 for expenses
+        self._signs = np.concatenate([np.ones(len(self.income_attrs)),
+                                      -np.ones(len(self.expense_attrs))])
+
+    @classmethod
+    def from_budgets(cls, budgets, index=None):
+        """
+        Args:
+            budgets (iterable): :class:`Budget` s
+            index (array-like): scenario labels
+        Returns:
+            BudgetBatch: one scenario per budget
+        """
+        values = [[np.nan if getattr(budget, attr) is None
+                   else getattr(budget, attr) for attr in cls.attrs]
+                  for budget in budgets]
+        return cls(np.array(values, dtype=np.float64).reshape(
+            len(values), len(cls.attrs)), index=index)
+
+    @classmethod
+    def from_budget(cls, budget, n):
+        """
+        Args:
+            budget (Budget): base scenario
+            n (int): number of scenarios
+        Returns:
+            BudgetBatch: ``n`` copies of ``budget`` (to vary with
+                ``batch[attr] = ...``)
+        """
+        batch = cls.from_budgets([budget])
+        return cls(np.repeat(batch.values, n, axis=0))
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Args:
+            df (pandas.DataFrame): one row per scenario, with (some of)
+                the ``attrs`` columns
+        Returns:
+            BudgetBatch
+        """
+        return cls(df.reindex(columns=list(cls.attrs)).values, index=df.index)
+
+    def to_frame(self):
+        """
+        Returns:
+            pandas.DataFrame: one row per scenario, one column per attr
+        """
+        return pd.DataFrame(self.values, index=self.index,
+                            columns=list(self.attrs))
+
+    def to_budgets(self):
+        """
+        Returns:
+            list: a :class:`Budget` per scenario
+        """
+        return [Budget(**dict(
+                    (attr, None if np.isnan(value) else value)
+                    for attr, value in zip(self.attrs, row)))
+                for row in self.values.tolist()]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, attr):
+        """
+        Returns:
+            numpy.ndarray: the ``attr`` column (a view)
+        """
+        return self.values[:, self.attrs.index(attr)]
+
+    def __setitem__(self, attr, value):
+        self.values[:, self.attrs.index(attr)] = value
+
+    @property
+    def total_monthly_income(self):
+        return np.nansum(self.values[:, :len(self.income_attrs)], axis=1)
+
+    @property
+    def total_monthly_expenses(self):
+        return np.nansum(self.values[:, len(self.income_attrs):], axis=1)
+
+    @property
+    def monthly_gross(self):
+        return self.total_monthly_income
+
+    @property
+    def monthly_net(self):
+        """
+        Returns:
+            numpy.ndarray: difference between income and expenses
+        """
+        return np.where(np.isnan(self.values), 0, self.values).dot(self._signs)
+
+    @property
+    def is_balanced(self):
+        """
+        Returns:
+            numpy.ndarray: whether the net (income-expenses) is >= 0
+        """
+        return self.monthly_net >= 0
+
+
 import unittest
 class Test_Budget(unittest.TestCase):
     def test_001_Budget(self):
@@ -134,6 +268,39 @@ class Test_Budget(unittest.TestCase):
         self.assertEqual(b.monthly_net, 0)
         self.assertTrue(b.is_balanced)
 
+    def test_010_BudgetBatch(self):
+        budgets = [
+            Budget(),
+            Budget(monthly_salary=3000, monthly_home_rent=1200,
+                   monthly_groceries=400, monthly_home_insurance=50),
+            Budget(monthly_salary=1000, monthly_home_mortgage=1500),
+        ]
+        batch = BudgetBatch.from_budgets(budgets, index=['a', 'b', 'c'])
+        self.assertEqual(len(batch), 3)
+        for attr in ('total_monthly_income', 'total_monthly_expenses',
+                     'monthly_gross', 'monthly_net', 'is_balanced'):
+            self.assertEqual(list(getattr(batch, attr)),
+                             [getattr(b, attr) for b in budgets])
+        self.assertEqual(list(batch.is_balanced), [True, True, False])
+
+        for budget, output in zip(budgets, batch.to_budgets()):
+            self.assertEqual(vars(output), vars(budget))
+        df = batch.to_frame()
+        self.assertEqual(list(df.index), ['a', 'b', 'c'])
+        self.assertEqual(df.loc['b', 'monthly_home_rent'], 1200)
+        np.testing.assert_array_equal(BudgetBatch.from_frame(df).values,
+                                      batch.values)
+        self.assertRaises(ValueError, BudgetBatch, np.zeros((2, 3)))
+
+    def test_020_BudgetBatch_scenarios(self):
+        base = Budget(monthly_salary=3000, monthly_home_rent=1200)
+        batch = BudgetBatch.from_budget(base, 10000)
+        batch['monthly_groceries'] = np.linspace(0, 3000, 10000)
+        self.assertEqual(batch['monthly_home_rent'][-1], 1200)
+        self.assertEqual(batch.monthly_net[0], 1800)
+        self.assertEqual(batch.monthly_net[-1], -1200)
+        self.assertEqual(batch.is_balanced.sum(), 6000)
+
 
 def main():
     import optparse
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.cache
+============
+
+Content-hash-keyed cache of parsed (and enriched) transaction frames.
+
+Frames are stored in a columnar binary format (Feather or Parquet, with
+``pyarrow``; otherwise pickle) in a cache directory. Entries are keyed
+by a hash of the input file contents and of the read options, so a
+changed file (or different options) is a cache miss; the least recently
+used entries are evicted when the cache grows past ``max_bytes``.
+
+Installation (for the columnar formats)::
+
+    pip install pyarrow
+
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger('pypfi.cache')
+
+
+CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 2 * 2 ** 30
+
+
+def get_default_cache_dir():
+    """
+    Returns:
+        str: ``$XDG_CACHE_HOME/pypfi`` (default: ``~/.cache/pypfi``)
+    """
+    return os.path.join(
+        os.environ.get('XDG_CACHE_HOME',
+                       os.path.join(os.path.expanduser('~'), '.cache')),
+        'pypfi')
+
+
+def get_default_format():
+    """
+    Returns:
+        str: ``feather`` if ``pyarrow`` is installed, else ``pickle``
+    """
+    try:
+        import pyarrow  # noqa
+        return 'feather'
+    except ImportError:
+        return 'pickle'
+
+
+FORMAT_EXTENSIONS = {
+    'feather': '.feather',
+    'parquet': '.parquet',
+    'pickle': '.pkl',
+}
+
+
+def file_digest(path, algorithm='sha1', blocksize=2 ** 20):
+    """
+    Hash the contents of a file, one block at a time
+
+    Args:
+        path (str): path to the file
+        algorithm (str): ``hashlib`` algorithm name
+        blocksize (int): number of bytes to read at a time
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def encode_columns(df):
+    """
+    Encode object columns of tz-aware datetimes for columnar formats
+
+    An object column of datetimes with varying UTC offsets (see
+    :func:`pypfi.pypfi.parse_transaction_dates`) is stored as a UTC
+    datetime64 column and an int offset (in seconds) column.
+
+    Args:
+        df (pandas.DataFrame): frame to encode
+    Returns:
+        tuple: ``(encoded_df, encoded_colnames)``
+    """
+    df = df.copy(deep=False)
+    encoded = []
+    for colname in df.columns:
+        values = df[colname]
+        if values.dtype != object or not len(values):
+            continue
+        first = values.iloc[0]
+        if not (hasattr(first, 'utcoffset') and first.utcoffset() is not None):
+            continue
+        df[colname] = pd.to_datetime(values, utc=True).dt.tz_localize(None)
+        df['%s.utcoffset' % colname] = np.array(
+            [x.utcoffset().total_seconds() for x in values], dtype=np.int64)
+        encoded.append(colname)
+    return df, encoded
+
+
+def decode_columns(df, encoded):
+    """
+    Decode the columns encoded by :func:`encode_columns`
+
+    Args:
+        df (pandas.DataFrame): encoded frame
+        encoded (list): names of the encoded columns
+    Returns:
+        pandas.DataFrame: decoded frame
+    """
+    from dateutil.tz import tzoffset
+    for colname in encoded:
+        offsets = df.pop('%s.utcoffset' % colname).values
+        utc = pd.DatetimeIndex(df[colname]).tz_localize('UTC')
+        output = np.empty(len(df), dtype=object)
+        for offset in np.unique(offsets):
+            mask = offsets == offset
+            output[mask] = utc[mask].tz_convert(
+                tzoffset(None, int(offset))).astype(object)
+        df[colname] = output
+    return df
+
+
+class TransactionCache(object):
+    """
+    A directory of cached transaction frames
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES,
+                 format=None):
+        """
+        Args:
+            cache_dir (str): cache directory
+                (default: :func:`get_default_cache_dir`)
+            max_bytes (int): evict entries when the cache is larger
+            format (str): ``feather``, ``parquet`` or ``pickle``
+                (default: :func:`get_default_format`)
+        """
+        self.cache_dir = cache_dir or get_default_cache_dir()
+        self.max_bytes = max_bytes
+        self.format = format or get_default_format()
+        if self.format not in FORMAT_EXTENSIONS:
+            raise ValueError(self.format)
+
+    def get_key(self, path, **options):
+        """
+        Args:
+            path (str): path to the input file
+            options (dict): options which change the parsed frame
+        Returns:
+            str: cache key (hash of the file contents and ``options``)
+        """
+        digest = hashlib.sha1(file_digest(path).encode('ascii'))
+        digest.update(json.dumps(
+            [CACHE_VERSION, sorted((k, str(v)) for k, v in options.items())]
+        ).encode('utf8'))
+        return digest.hexdigest()
+
+    def get_path(self, key):
+        """
+        Returns:
+            str: path of the cache entry for ``key``
+        """
+        return os.path.join(self.cache_dir,
+                            key + FORMAT_EXTENSIONS[self.format])
+
+    def load(self, key):
+        """
+        Args:
+            key (str): cache key
+        Returns:
+            pandas.DataFrame: cached frame (None if not cached)
+        """
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            log.debug('cache miss: %s', path)
+            return None
+        log.debug('cache hit: %s', path)
+        os.utime(path, None)  # mark as recently used
+        if self.format == 'pickle':
+            return pd.read_pickle(path)
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        if self.format == 'feather':
+            df = pd.read_feather(path)
+        else:
+            df = pd.read_parquet(path)
+        for colname, categories in meta['categoricals'].items():
+            if df[colname].dtype.name != 'category':
+                df[colname] = pd.Categorical(df[colname],
+                                             categories=categories)
+        return decode_columns(df, meta['encoded'])
+
+    def store(self, key, df):
+        """
+        Write ``df`` to the cache (and evict old entries)
+
+        Args:
+            key (str): cache key
+            df (pandas.DataFrame): frame to cache
+        Returns:
+            str: path of the cache entry
+        """
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = self.get_path(key)
+        tmp_path = path + '.tmp'
+        if self.format == 'pickle':
+            df.to_pickle(tmp_path)
+        else:
+            encoded_df, encoded = encode_columns(df.reset_index(drop=True))
+            meta = {
+                'encoded': encoded,
+                'categoricals': dict(
+                    (colname, list(df[colname].cat.categories))
+                    for colname in df.columns
+                    if df[colname].dtype.name == 'category')}
+            if self.format == 'feather':
+                encoded_df.to_feather(tmp_path)
+            else:
+                encoded_df.to_parquet(tmp_path)
+            with open(path + '.json', 'w') as f:
+                json.dump(meta, f)
+        os.rename(tmp_path, path)
+        self.evict()
+        return path
+
+    def entries(self):
+        """
+        Returns:
+            list: ``(mtime, size, path)`` of each cache entry, oldest first
+        """
+        if not os.path.exists(self.cache_dir):
+            return []
+        output = []
+        for filename in os.listdir(self.cache_dir):
+            if os.path.splitext(filename)[1] not in (
+                    FORMAT_EXTENSIONS.values()):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            stat = os.stat(path)
+            output.append((stat.st_mtime, stat.st_size, path))
+        return sorted(output)
+
+    def evict(self):
+        """
+        Remove the least recently used entries while the cache is larger
+        than ``max_bytes``
+
+        Returns:
+            list: paths of the removed entries
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            for _path in (path, path + '.json'):
+                if os.path.exists(_path):
+                    os.remove(_path)
+            total -= size
+            removed.append(path)
+            log.debug('cache evict: %s', path)
+        return removed
+
+
+class Test_cache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'input.csv')
+        with open(self.path, 'w') as f:
+            f.write('2014-12-18 10:57:00-06:00,ABC,1,1\n')
+        from dateutil.tz import tzoffset
+        self.df = pd.DataFrame({
+            'date': pd.Series([
+                pd.Timestamp('2015-03-08 01:57:00', tz=tzoffset(None, -21600)),
+                pd.Timestamp('2015-03-08 03:57:00', tz=tzoffset(None, -18000))],
+                dtype=object),
+            'yearmonth': pd.Categorical(['2015-03', '2015-03']),
+            'amount': [1.0, 2.0]},
+            columns=['date', 'yearmonth', 'amount'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_010_get_key(self):
+        cache = TransactionCache(os.path.join(self.tmpdir, 'cache'))
+        key = cache.get_key(self.path, tz=None)
+        self.assertEqual(key, cache.get_key(self.path, tz=None))
+        self.assertNotEqual(key, cache.get_key(self.path, tz='UTC'))
+        with open(self.path, 'a') as f:
+            f.write('2014-12-18 11:57:00-06:00,ABC,1,2\n')
+        self.assertNotEqual(key, cache.get_key(self.path, tz=None))
+
+    def test_020_store_load(self):
+        for format in ('pickle', get_default_format()):
+            cache = TransactionCache(os.path.join(self.tmpdir, format),
+                                     format=format)
+            key = cache.get_key(self.path)
+            self.assertIsNone(cache.load(key))
+            cache.store(key, self.df)
+            output = cache.load(key)
+            pd.util.testing.assert_frame_equal(output, self.df)
+            self.assertEqual([str(x) for x in output['date']],
+                             [str(x) for x in self.df['date']])
+
+    def test_030_evict(self):
+        cache = TransactionCache(os.path.join(self.tmpdir, 'cache'),
+                                 format='pickle')
+        for key in ('a', 'b', 'c'):
+            cache.store(key, self.df)
+            os.utime(cache.get_path(key), (0, len(cache.entries())))
+        cache.load('a')
+        size = cache.entries()[0][1]
+        cache.max_bytes = 2 * size
+        self.assertEqual(cache.evict(), [cache.get_path('b')])
+        self.assertEqual(len(cache.entries()), 2)
@@ -0,0 +1,492 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.categorize
+=================
+
+Assign a ``category`` to each transaction from its ``desc``.
+
+A :class:`Categorizer` compiles category rules into an index once:
+
+* ``regex`` rules are tested in order (the first match wins), behind a
+  combined regex which rejects most descriptions in one search (rules
+  with groups are searched separately, since combining them would
+  renumber their groups and backreferences)
+* ``prefix`` rules are looked up by the description's prefix of each
+  rule length (one dict lookup per distinct length; the longest
+  matching prefix wins)
+* ``contains`` rules (e.g. :attr:`pypfi.accounts.Expense.payee` and
+  :attr:`pypfi.accounts.Income.source`) are compiled into one regex
+  built from a trie of the keywords (the leftmost, longest keyword wins)
+
+Rules of these kinds are tried in that order. Each unique description
+is matched once (and cached); the categories are then broadcast back to
+the rows as a Categorical, which the groupby and pivot reports use as a
+dimension (see :func:`pypfi.pypfi.get_groupby_keys`).
+
+Usage::
+
+    python -m pypfi.categorize -i transactions.csv -r rules.csv
+    python -m pypfi.pypfi -i transactions.csv -o report.html -r rules.csv
+
+A rules file is a CSV file with ``category,kind,pattern`` columns::
+
+    category,kind,pattern
+    groceries,prefix,WHOLE FOODS
+    salary,contains,ACME CORP PAYROLL
+    fuel,regex,^(SHELL|EXXON)\\b
+
+"""
+import collections
+import csv
+import os
+import re
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .accounts import Expense, Income
+except (ImportError, ValueError):  # python ./pypfi/categorize.py
+    from accounts import Expense, Income
+
+
+UNCATEGORIZED = 'uncategorized'
+
+RULE_KINDS = ('regex', 'prefix', 'contains')
+
+# number of regex rules per combined (prefilter) regex
+REGEX_CHUNKSIZE = 50
+
+
+class CategoryRule(collections.namedtuple(
+        'CategoryRule', ('category', 'pattern', 'kind'))):
+    """
+    A categorization rule
+
+    Args:
+        category (str): category name
+        pattern (str): description prefix, keyword or regex
+        kind (str): one of ``RULE_KINDS``
+    """
+    __slots__ = ()
+
+
+def get_trie_pattern(words):
+    """
+    Build a regex which matches any of ``words``
+
+    The alternatives are nested by common prefix (a trie), so the regex
+    engine tests each character once per trie node instead of once per
+    word; at a position, the longest word matches.
+
+    Args:
+        words (iterable): literal strings
+    Returns:
+        str: regex pattern (no capturing groups); ``None`` if there are
+        no (non-empty) words
+    """
+    trie = {}
+    for word in words:
+        if not word:
+            continue
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def _pattern(node):
+        alternatives = [re.escape(char) + _pattern(child)
+                        for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        if '' in node:
+            return '(?:%s)?' % '|'.join(alternatives)
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:%s)' % '|'.join(alternatives)
+
+    return _pattern(trie) or None
+
+
+class Categorizer(object):
+    """
+    Map transaction descriptions to categories with a compiled rule index
+    """
+
+    def __init__(self, rules=(), categories=None, ignorecase=True,
+                 cache_size=2 ** 20):
+        """
+        Args:
+            rules (iterable): :class:`CategoryRule` s (or
+                ``(category, pattern, kind)`` tuples)
+            categories (iterable): category names (default: the rule
+                categories, in order of appearance);
+                ``UNCATEGORIZED`` is appended
+            ignorecase (bool): if True, match case-insensitively
+            cache_size (int): maximum number of cached descriptions
+        """
+        self.rules = [CategoryRule(*rule) for rule in rules]
+        for rule in self.rules:
+            if rule.kind not in RULE_KINDS:
+                raise KeyError(rule.kind)
+        if categories is None:
+            categories = [rule.category for rule in self.rules]
+        categories = list(collections.OrderedDict.fromkeys(
+            [c for c in categories if c != UNCATEGORIZED] + [UNCATEGORIZED]))
+        for rule in self.rules:
+            if rule.category not in categories:
+                raise KeyError(rule.category)
+        self.categories = categories
+        self.ignorecase = ignorecase
+        self.cache_size = cache_size
+        self._cache = {}
+        self._compile()
+
+    def _compile(self):
+        codes = dict((c, i) for i, c in enumerate(self.categories))
+        self.uncategorized_code = codes[UNCATEGORIZED]
+        flags = re.UNICODE | (re.IGNORECASE if self.ignorecase else 0)
+
+        self._regexes = [
+            (re.compile(rule.pattern, flags), codes[rule.category])
+            for rule in self.rules if rule.kind == 'regex']
+        # a pattern without groups has no (valid) backreferences either
+        patterns = [regex.pattern for regex, _ in self._regexes
+                    if regex.groups == 0]
+        self._regex_prefilters = [
+            re.compile('|'.join('(?:%s)' % p for p in
+                                patterns[start:start + REGEX_CHUNKSIZE]),
+                       flags)
+            for start in range(0, len(patterns), REGEX_CHUNKSIZE)]
+        self._regex_prefilters.extend(
+            regex for regex, _ in self._regexes if regex.groups)
+
+        # {length: {prefix: code}}, longest first
+        prefixes = collections.defaultdict(dict)
+        for rule in self.rules:
+            if rule.kind == 'prefix' and rule.pattern:
+                prefixes[len(rule.pattern)].setdefault(
+                    self._fold(rule.pattern), codes[rule.category])
+        self._prefixes = sorted(prefixes.items(), reverse=True)
+
+        keywords = collections.OrderedDict()
+        for rule in self.rules:
+            if rule.kind == 'contains' and rule.pattern:
+                keywords.setdefault(self._fold(rule.pattern),
+                                    codes[rule.category])
+        self._keywords = keywords
+        pattern = get_trie_pattern(keywords)
+        self._keyword_regex = (
+            None if pattern is None else re.compile(pattern, re.UNICODE))
+
+    def _fold(self, value):
+        return value.lower() if self.ignorecase else value
+
+    @classmethod
+    def from_accounts(cls, expenses=(), incomes=(), **kwargs):
+        """
+        Build ``contains`` rules from expenses and incomes
+
+        Args:
+            expenses (iterable): :class:`pypfi.accounts.Expense` s;
+                ``payee`` -> ``name``
+            incomes (iterable): :class:`pypfi.accounts.Income` s;
+                ``source`` -> ``name``
+            kwargs (dict): :class:`Categorizer` arguments
+        Returns:
+            Categorizer: categorizer
+        """
+        rules = [CategoryRule(x.name, x.payee, 'contains')
+                 for x in expenses if x.payee]
+        rules.extend(CategoryRule(x.name, x.source, 'contains')
+                     for x in incomes if x.source)
+        return cls(rules, **kwargs)
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        """
+        Args:
+            path (str): CSV file with ``category,kind,pattern`` columns
+            kwargs (dict): :class:`Categorizer` arguments
+        Returns:
+            Categorizer: categorizer
+        """
+        return cls(read_rules(path), **kwargs)
+
+    def match_values(self, values):
+        """
+        Match descriptions against the rules
+
+        Args:
+            values (array-like): descriptions (str)
+        Returns:
+            numpy.ndarray: category codes (int64; indexes of
+            ``self.categories``)
+        """
+        values = pd.Series(np.asarray(values, dtype=object), dtype=object)
+        codes = np.full(len(values), -1, dtype=np.int64)
+        if not len(values):
+            return codes
+        folded = values.str.lower() if self.ignorecase else values
+
+        if self._regexes:
+            candidates = np.zeros(len(values), dtype=bool)
+            for prefilter in self._regex_prefilters:
+                candidates |= np.array(
+                    [prefilter.search(x) is not None for x in values],
+                    dtype=bool)
+            for position in np.flatnonzero(candidates):
+                value = values.iat[position]
+                for regex, code in self._regexes:
+                    if regex.search(value) is not None:
+                        codes[position] = code
+                        break
+
+        for length, index in self._prefixes:
+            unmatched = codes == -1
+            if not unmatched.any():
+                break
+            prefix_codes = folded[unmatched].str[:length].map(index)
+            codes[np.flatnonzero(unmatched)] = (
+                prefix_codes.fillna(-1).values.astype(np.int64))
+
+        if self._keyword_regex is not None:
+            unmatched = codes == -1
+            if unmatched.any():
+                keyword_codes = folded[unmatched].str.extract(
+                    '(%s)' % self._keyword_regex.pattern,
+                    flags=re.UNICODE, expand=False).map(self._keywords)
+                codes[np.flatnonzero(unmatched)] = (
+                    keyword_codes.fillna(-1).values.astype(np.int64))
+
+        codes[codes == -1] = self.uncategorized_code
+        return codes
+
+    def get_codes(self, values):
+        """
+        Look up (or match, and cache) the category codes of unique values
+
+        Args:
+            values (array-like): unique descriptions (str)
+        Returns:
+            numpy.ndarray: category codes (int64)
+        """
+        values = pd.Series(np.asarray(values, dtype=object), dtype=object)
+        codes = values.map(self._cache)
+        missing = codes.isnull().values
+        if missing.any():
+            matched = self.match_values(values[missing])
+            if len(self._cache) + len(matched) > self.cache_size:
+                self._cache.clear()
+            self._cache.update(zip(values[missing], matched))
+            codes[missing] = matched
+        return codes.values.astype(np.int64)
+
+    def categorize(self, desc):
+        """
+        Categorize transactions
+
+        Args:
+            desc (array-like): transaction descriptions (NA: uncategorized)
+        Returns:
+            pandas.Categorical: categories ``self.categories``
+        """
+        codes, uniques = pd.factorize(np.asarray(desc, dtype=object))
+        unique_codes = np.concatenate([
+            self.get_codes(uniques),
+            # NA descriptions have code -1: the last unique code
+            [self.uncategorized_code]]).astype(np.int64)
+        return pd.Categorical.from_codes(unique_codes.take(codes),
+                                         self.categories)
+
+
+def read_rules(path):
+    """
+    Read category rules from a CSV file
+
+    Args:
+        path (str): CSV file with ``category,kind,pattern`` columns
+    Returns:
+        list: :class:`CategoryRule` s
+    """
+    with open(path, 'rb') as f:
+        return [CategoryRule(row['category'].decode('utf8'),
+                             row['pattern'].decode('utf8'),
+                             row['kind'])
+                for row in csv.DictReader(f)]
+
+
+def add_category_column(df, categorizer, colname='desc', column='category'):
+    """
+    Add a ``category`` Categorical column to a dataframe
+
+    Args:
+        df (pandas.DataFrame): transactions
+        categorizer (Categorizer): category rules
+        colname (str): name of the description column
+        column (str): name of the category column
+    Returns:
+        df (pandas.DataFrame): dataframe with ``column`` added
+
+    .. note:: This method modifies the ``df`` argument
+       (does not do ``df.copy()`` before adding the column)
+    """
+    df[column] = categorizer.categorize(df[colname])
+    return df
+
+
+class Test_categorize(unittest.TestCase):
+    def setUp(self):
+        self.INPUT_FILE = os.path.join(os.path.dirname(__file__),
+                                       '..', 'tests', 'testdata.csv')
+        self.rules = [
+            ('groceries', 'ABC', 'prefix'),
+            ('pharmacy', 'ABC Pharmacy', 'prefix'),
+            ('online', '.com', 'contains'),
+            ('online', 'web', 'contains'),
+            ('books', 'webbooks', 'contains'),
+            ('salary', r'^Paycheck\b', 'regex'),
+            ('fuel', r'\bfuel\b', 'regex'),
+        ]
+
+    def test_010_get_trie_pattern(self):
+        words = ['web', 'webbooks', 'wed', 'x.y', 'web']
+        regex = re.compile(get_trie_pattern(words))
+        self.assertEqual(regex.groups, 0)
+        for word in set(words):
+            self.assertEqual(regex.match(word).group(), word)
+        self.assertEqual(regex.search('a webbook').group(), 'web')
+        self.assertEqual(regex.search('a webbooks').group(), 'webbooks')
+        self.assertIsNone(regex.search('xzy'))
+        self.assertIsNone(get_trie_pattern(['']))
+
+    def test_020_categorize(self):
+        categorizer = Categorizer(self.rules)
+        self.assertEqual(categorizer.categories, [
+            'groceries', 'pharmacy', 'online', 'books', 'salary', 'fuel',
+            UNCATEGORIZED])
+        desc = ['abc x', 'ABC Pharmacy y', 'Paycheck 1', 'ABC fuel',
+                'example.COM z', 'x webbooks y', 'web', None, 'XYZ z',
+                'Paychecks', 'abc x']
+        output = categorizer.categorize(desc)
+        self.assertEqual(list(output.categories), categorizer.categories)
+        self.assertEqual(list(output), [
+            'groceries', 'pharmacy', 'salary', 'fuel', 'online', 'books',
+            'online', UNCATEGORIZED, UNCATEGORIZED, UNCATEGORIZED,
+            'groceries'])
+        self.assertEqual(len(categorizer._cache), 9)
+        self.assertEqual(list(categorizer.categorize(desc[::-1])),
+                         list(output[::-1]))
+
+        output = Categorizer(self.rules, ignorecase=False).categorize(desc)
+        self.assertEqual(output[0], UNCATEGORIZED)
+        self.assertEqual(output[4], UNCATEGORIZED)
+
+        self.assertRaises(KeyError, Categorizer, [('a', 'b', 'suffix')])
+        self.assertRaises(KeyError, Categorizer, self.rules,
+                          categories=['groceries'])
+
+    def test_025_regex_groups(self):
+        categorizer = Categorizer([('a', r'(a)\1', 'regex'),
+                                   ('b', r'(b)\1', 'regex'),
+                                   ('c', r'(?P<n>c)(?P=n)', 'regex'),
+                                   ('d', r'(?P<n>d)(?P=n)', 'regex'),
+                                   ('e', r'^e\d', 'regex')])
+        self.assertEqual(len(categorizer._regex_prefilters), 5)
+        self.assertEqual(
+            list(categorizer.categorize(['aa', 'bb', 'cc', 'dd', 'e1', 'ab'])),
+            ['a', 'b', 'c', 'd', 'e', UNCATEGORIZED])
+
+    def test_030_match_values_many_rules(self):
+        rs = np.random.RandomState(0)
+        words = ['%s%06d' % (w, i) for i, w in enumerate(
+            rs.choice(['shop', 'cafe', 'fuel'], 3000))]
+        rules = [(w[:4], w, ('prefix', 'contains')[i % 2])
+                 for i, w in enumerate(words)]
+        rules.append(('regex', r'^r\d+$', 'regex'))
+        categorizer = Categorizer(rules)
+        values = ['%s tail' % w for w in words[::2]] + [
+            'head %s' % w for w in words[1::2]] + ['r123', 'none']
+        codes = categorizer.match_values(values)
+        expected = ([categorizer.categories.index(w[:4])
+                     for w in words[::2] + words[1::2]] +
+                    [categorizer.categories.index('regex'),
+                     categorizer.uncategorized_code])
+        self.assertEqual(list(codes), expected)
+
+    def test_040_from_accounts(self):
+        categorizer = Categorizer.from_accounts(
+            expenses=[Expense('rent', 'monthly', 1200, 'Rent'),
+                      Expense('misc', 'onetime', 10, None)],
+            incomes=[Income('salary', 'monthly', 3000, 'Paycheck')])
+        self.assertEqual(categorizer.categories,
+                         ['rent', 'salary', UNCATEGORIZED])
+        df = pd.read_csv(self.INPUT_FILE, names=['date', 'desc', 'amount',
+                                                 'balance'])
+        df = add_category_column(df, categorizer)
+        self.assertEqual(df['category'].dtype.name, 'category')
+        self.assertEqual((df['category'] == 'salary').sum(),
+                         df['desc'].str.contains('Paycheck').sum())
+
+
+def main(*args):
+    import logging
+    import optparse
+
+    prs = optparse.OptionParser(
+        usage="%prog -i <input.tsv> -r <rules.csv>")
+
+    prs.add_option('-i', '--input-file',
+                   dest='input_file')
+    prs.add_option('-r', '--rules',
+                   dest='rules',
+                   help='CSV file with category,kind,pattern columns')
+    prs.add_option('--case-sensitive',
+                   dest='case_sensitive',
+                   action='store_true',)
+
+    prs.add_option('-v', '--verbose',
+                    dest='verbose',
+                    action='store_true',)
+    prs.add_option('-q', '--quiet',
+                    dest='quiet',
+                    action='store_true',)
+    prs.add_option('-t', '--test',
+                    dest='run_tests',
+                    action='store_true',)
+
+    args = args and list(args) or sys.argv[1:]
+    (opts, args) = prs.parse_args(args)
+
+    if not opts.quiet:
+        logging.basicConfig()
+
+        if opts.verbose:
+            logging.getLogger().setLevel(logging.DEBUG)
+
+    if opts.run_tests:
+        sys.argv = [sys.argv[0]] + args
+        exit(unittest.main())
+
+    if not (opts.input_file and opts.rules):
+        prs.error('-i <input.tsv> and -r <rules.csv> are required')
+
+    try:
+        from . import pypfi as _pypfi
+    except (ImportError, ValueError):  # python ./pypfi/categorize.py
+        import pypfi as _pypfi
+    categorizer = Categorizer.from_csv(opts.rules,
+                                       ignorecase=not opts.case_sensitive)
+    df = add_category_column(_pypfi.read_transactions_tsv(opts.input_file),
+                             categorizer)
+    counts = df.groupby('category')['amount'].agg(['count', 'sum'])
+    print(counts.to_string())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
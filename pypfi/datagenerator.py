@@ -8,11 +8,15 @@ pypfi.datagenerator
 Installation::
 
     pip install arrow factory-boy
+    pip install pyarrow  # (for Parquet and Feather output)
 
 Usage::
 
     python datagenerator.py -t
     python datagenerator.py -c 20
+    python datagenerator.py --bulk --seed 1 -c 10000000 -o transactions.csv
+    python datagenerator.py --seed 1 -c 10000000 -o transactions.parquet
+    python datagenerator.py --seed 1 -c 100000000 -j 8 -o transactions.npy
 
 Documentation:
 
@@ -23,14 +27,28 @@ Documentation:
 
 """
 import codecs
+import collections
 import datetime
+import itertools
+import os
+import shutil
+import string
+import struct
 import sys
+import tempfile
 import unittest
 
 import arrow
 import factory.fuzzy as fuzzy
 import numpy as np
-#import pandas as pd
+import pandas as pd
+
+try:
+    from . import cache as _cache
+    from . import scheduler as _scheduler
+except (ImportError, ValueError):  # python ./pypfi/datagenerator.py
+    import cache as _cache
+    import scheduler as _scheduler
 
 
 class DateTimeGenerator(object):
@@ -169,19 +187,618 @@ class DataGenerator(object):
             self.current_date = self.dtg.next()
 
 
+DEBIT_CENTS = (-10000, -50)
+CREDIT_CENTS = (1000, 200200)
+DEBIT_PERCENT = 95
+STEP_NS = 2 * 3600 * 10 ** 9
+
+
+def get_vocabulary(prefixes, length, size, random_state):
+    """
+    Generate descriptions like ``get_prefix() + FuzzyText(length).fuzz()``
+
+    Args:
+        prefixes (list): list of string prefixes
+        length (int): length of the random suffix
+        size (int): number of descriptions
+        random_state (numpy.random.RandomState): random state
+    Returns:
+        numpy.ndarray: object array of ``size`` unicode strings
+    """
+    letters = np.array(list(string.ascii_letters))
+    prefix_n = random_state.randint(0, len(prefixes), size)
+    suffixes = random_state.randint(0, len(letters), (size, length))
+    return np.array(
+        [u"%s %s" % (prefixes[n], u''.join(letters[suffix]))
+         for n, suffix in zip(prefix_n, suffixes)],
+        dtype=object)
+
+
+def format_isoformat(dates):
+    """
+    Format dates like ``arrow.Arrow.isoformat(sep=' ')``
+
+    Args:
+        dates (pandas.DatetimeIndex): (tz-aware) dates
+    Returns:
+        numpy.ndarray: ``YYYY-MM-DD HH:MM:SS[+HH:MM]`` strings
+    """
+    wall = dates.tz_localize(None) if dates.tz is not None else dates
+    strings = np.char.replace(
+        np.datetime_as_string(wall.values, unit='s'), 'T', ' ')
+    if dates.tz is None:
+        return strings
+    offset_minutes = (wall.asi8 - dates.asi8) // (60 * 10 ** 9)
+    codes, offsets = pd.factorize(offset_minutes)
+    suffixes = np.array(['%s%02d:%02d' % ('-' if offset < 0 else '+',
+                                         abs(offset) // 60, abs(offset) % 60)
+                         for offset in offsets])
+    return np.char.add(strings, suffixes[codes])
+
+
+def draw_transactions(random_state, n, debit_codes, credit_codes):
+    """
+    Draw the amounts and descriptions of ``n`` transactions
+
+    Args:
+        random_state (numpy.random.RandomState): random state
+        n (int): number of transactions
+        debit_codes (numpy.ndarray): description codes of debits
+        credit_codes (numpy.ndarray): description codes of credits
+    Returns:
+        tuple: ``(amount_cents, desc_codes)`` arrays
+    """
+    rs = random_state
+    debit = rs.randint(0, 100, n) < DEBIT_PERCENT
+    amount = np.where(
+        debit,
+        rs.randint(DEBIT_CENTS[0], DEBIT_CENTS[1] + 1, n),
+        rs.randint(CREDIT_CENTS[0], CREDIT_CENTS[1] + 1, n))
+    desc = np.where(
+        debit,
+        debit_codes.take(rs.randint(0, len(debit_codes), n)),
+        credit_codes.take(rs.randint(0, len(credit_codes), n)))
+    return amount, desc
+
+
+class BulkDataGenerator(object):
+    """
+    Generate transactions in blocks of NumPy arrays
+
+    The rows have the same distribution and stopping conditions as
+    :class:`DataGenerator` (an ``Account Statement`` row, then 95% debits
+    of -100 to -0.50 and 5% credits of 10 to 2002, two hours apart; stop
+    after ``max_count`` rows, the first row at or after ``date_end``, or
+    the first overdraft), but descriptions are drawn from a precomputed
+    vocabulary and amounts are whole cents, so balances are exact.
+
+    The output is reproducible for a given ``seed`` and ``blocksize``.
+    """
+    def __init__(self,
+                 initial_balance=1001,
+                 date_start=None,
+                 date_end=None,
+                 max_count=None,
+                 seed=None,
+                 blocksize=2 ** 16,
+                 vocabulary_size=1024):
+        """
+        Args:
+            initial_balance (numeric): starting balance
+            date_start (arrow.Arrow): starting date (if None, ``.now()``)
+            date_end (arrow.Arrow): stop at the first row on or after this
+            max_count (int): stop after this many rows
+            seed (int): random seed
+            blocksize (int): number of rows to generate at a time
+            vocabulary_size (int): number of distinct descriptions
+                (of each of debits and credits)
+        """
+        self.initial_balance = initial_balance
+        if date_start is None:
+            date_start = arrow.now().replace(second=0, microsecond=0)
+        self.date_start = date_start
+        self.date_end = date_end
+        self.max_count = max_count
+        self.seed = seed
+        self.blocksize = blocksize
+        self.random_state = np.random.RandomState(seed)
+        self.debit_vocabulary = get_vocabulary(
+            EXPENSE_PREFIXES, 10, vocabulary_size, self.random_state)
+        self.credit_vocabulary = get_vocabulary(
+            INCOME_PREFIXES, 4, vocabulary_size, self.random_state)
+        self.categories, codes = np.unique(
+            np.concatenate([[u"Account Statement"],
+                            self.debit_vocabulary,
+                            self.credit_vocabulary]).astype(object),
+            return_inverse=True)
+        self._statement_code = codes[0]
+        self._debit_codes = codes[1:len(self.debit_vocabulary) + 1]
+        self._credit_codes = codes[len(self.debit_vocabulary) + 1:]
+        self.tz = date_start.datetime.tzinfo
+        # DateTimeGenerator.next() is called once before the first row
+        self._start_ns = pd.Timestamp(date_start.datetime).value + STEP_NS
+        self._end_ns = (None if date_end is None else
+                        pd.Timestamp(arrow.get(date_end).datetime).value)
+        self.count = 0
+        self.balance_cents = int(round(initial_balance * 100))
+        self.done = False
+
+    @property
+    def balance(self):
+        return self.balance_cents / 100.
+
+    def generate_arrays(self):
+        """
+        Returns:
+            collections.OrderedDict: the next block of rows as arrays:
+                ``date`` (UTC nanoseconds), ``desc`` (codes into
+                ``self.categories``), ``amount`` and ``balance`` (cents)
+                (None when done)
+        """
+        if self.done:
+            return None
+        amount, desc = draw_transactions(
+            self.random_state, self.blocksize,
+            self._debit_codes, self._credit_codes)
+        if self.count == 0:
+            amount[0] = 0
+            desc[0] = self._statement_code
+        return self.stitch_arrays(amount, desc, amount.cumsum())
+
+    def stitch_arrays(self, amount, desc, cumsum):
+        """
+        Add the dates and balances of the next rows, and stop
+
+        Args:
+            amount (numpy.ndarray): amounts (cents)
+            desc (numpy.ndarray): description codes
+            cumsum (numpy.ndarray): ``amount.cumsum()``; the balances
+                are ``self.balance_cents + cumsum`` (a prefix sum fix-up)
+        Returns:
+            collections.OrderedDict: see :meth:`generate_arrays`
+        """
+        n = len(amount)
+        count = self.count + np.arange(n)
+        balance = self.balance_cents + cumsum
+        # the statement row and the first transaction have the same date
+        date_ns = self._start_ns + STEP_NS * np.maximum(count - 1, 0)
+
+        stop = balance <= 0
+        if self.max_count:
+            stop |= count + 1 >= self.max_count
+        if self._end_ns is not None:
+            stop |= date_ns >= self._end_ns
+        if self.count == 0:
+            stop[0] = False  # like DataGenerator, always yield a transaction
+        stops = np.flatnonzero(stop)
+        if len(stops):
+            n = stops[0] + 1
+            self.done = True
+
+        self.count += n
+        self.balance_cents = int(balance[n - 1])
+        return collections.OrderedDict((
+            ('date', date_ns[:n]),
+            ('desc', desc[:n]),
+            ('amount', amount[:n]),
+            ('balance', balance[:n])))
+
+    def generate_block(self, columnar=False):
+        """
+        Args:
+            columnar (bool): if True, encode ``date`` for columnar formats
+                (see :func:`encode_dates`)
+        Returns:
+            pandas.DataFrame: the next ``date,desc,amount,balance`` block
+                (None when done)
+        """
+        arrays = self.generate_arrays()
+        if arrays is None:
+            return None
+        df = pd.DataFrame({
+            'desc': self.categories.take(arrays['desc']),
+            'amount': arrays['amount'] / 100.,
+            'balance': arrays['balance'] / 100.},
+            columns=['desc', 'amount', 'balance'])
+        if columnar:
+            dates, utcoffsets = encode_dates(arrays['date'], self.tz)
+            df.insert(0, 'date', dates)
+            df.insert(1, 'date.utcoffset', utcoffsets)
+            return df
+        dates = pd.to_datetime(arrays['date'], utc=True)
+        # (a tz-aware column passed to DataFrame() is boxed row by row)
+        df.insert(0, 'date', dates.tz_convert(self.tz) if self.tz else dates)
+        return df
+
+    def generate_blocks(self, columnar=False):
+        """
+        Args:
+            columnar (bool): see :meth:`generate_block`
+        Yields:
+            pandas.DataFrame: ``date,desc,amount,balance`` blocks
+        """
+        while True:
+            block = self.generate_block(columnar=columnar)
+            if block is None:
+                break
+            yield block
+
+    def to_frame(self):
+        """
+        Returns:
+            pandas.DataFrame: all of the rows
+        """
+        return pd.concat(list(self.generate_blocks()), ignore_index=True)
+
+    def write(self, path, format=None):
+        """
+        Write the rows to a file (or, for ``npy``, a directory)
+
+        Args:
+            path (str): output path
+            format (str): one of ``OUTPUT_FORMATS``
+                (default: :func:`get_output_format`)
+        Returns:
+            int: number of rows written
+        """
+        format = format or get_output_format(path)
+        if format == 'csv':
+            with open(path, 'wb') as f:
+                return self.write_csv(f)
+        return getattr(self, 'write_%s' % format)(path)
+
+    def write_csv(self, output):
+        """
+        Write a transactions CSV (``date,desc,amount,balance``)
+
+        Args:
+            output (file-like): output to ``.write()`` to
+        Returns:
+            int: number of rows written
+        """
+        count = 0
+        for block in self.generate_blocks():
+            block['date'] = format_isoformat(pd.DatetimeIndex(block['date']))
+            block.to_csv(output, header=False, index=False,
+                         float_format='%.2f', encoding='utf-8')
+            count += len(block)
+        return count
+
+    def write_parquet(self, path):
+        """
+        Write a Parquet file, one row group per block
+
+        Args:
+            path (str): output path
+        Returns:
+            int: number of rows written
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        count = 0
+        writer = None
+        try:
+            for block in self.generate_blocks(columnar=True):
+                table = pa.Table.from_pandas(block, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                count += len(block)
+        finally:
+            if writer is not None:
+                writer.close()
+        return count
+
+    def write_feather(self, path):
+        """
+        Write a Feather file
+
+        (Feather files can not be appended to, so the whole frame is
+        built in memory.)
+
+        Args:
+            path (str): output path
+        Returns:
+            int: number of rows written
+        """
+        import pyarrow.feather as feather
+        df = pd.concat(list(self.generate_blocks(columnar=True)),
+                       ignore_index=True)
+        feather.write_feather(df, path)
+        return len(df)
+
+    def write_npy(self, path):
+        """
+        Write a directory of ``.npy`` column files, one block at a time
+
+        ``date.npy`` (UTC ``datetime64[ns]``), ``date.utcoffset.npy``
+        (seconds), ``desc.npy`` (codes into ``desc.categories.npy``),
+        ``amount.npy`` and ``balance.npy``; see :func:`read_frame`.
+
+        Args:
+            path (str): output directory
+        Returns:
+            int: number of rows written
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        dtypes = collections.OrderedDict((
+            ('date', np.dtype('M8[ns]')),
+            ('date.utcoffset', np.dtype(np.int64)),
+            ('desc', np.dtype(np.int32)),
+            ('amount', np.dtype(np.float64)),
+            ('balance', np.dtype(np.float64))))
+        files = collections.OrderedDict(
+            (colname, open(os.path.join(path, colname + '.npy'), 'wb'))
+            for colname in dtypes)
+        count = 0
+        try:
+            for f in files.values():
+                f.write(b'\0' * NPY_HEADER_BYTES)
+            for arrays in iter(self.generate_arrays, None):
+                dates, utcoffsets = encode_dates(arrays['date'], self.tz)
+                columns = {
+                    'date': dates,
+                    'date.utcoffset': utcoffsets,
+                    'desc': arrays['desc'],
+                    'amount': arrays['amount'] / 100.,
+                    'balance': arrays['balance'] / 100.}
+                for colname, f in files.items():
+                    f.write(np.ascontiguousarray(
+                        columns[colname], dtype=dtypes[colname]).tobytes())
+                count += len(arrays['date'])
+            for colname, f in files.items():
+                f.seek(0)
+                write_npy_header(f, dtypes[colname], count)
+        finally:
+            for f in files.values():
+                f.close()
+        np.save(os.path.join(path, 'desc.categories.npy'),
+                self.categories.astype(np.unicode_))
+        return count
+
+
+def generate_shard(task):
+    """
+    Draw the rows of a shard (see :class:`ParallelDataGenerator`)
+
+    Args:
+        task (tuple): ``(seed, shard, nrows, statement_code, debit_codes,
+            credit_codes)``
+    Returns:
+        tuple: ``(amount_cents, desc_codes, amount_cents.cumsum())``
+    """
+    seed, shard, nrows, statement_code, debit_codes, credit_codes = task
+    amount, desc = draw_transactions(
+        np.random.RandomState(seed), nrows, debit_codes, credit_codes)
+    if shard == 0:
+        amount[0] = 0
+        desc[0] = statement_code
+    return amount, desc, amount.cumsum()
+
+
+class ParallelDataGenerator(BulkDataGenerator):
+    """
+    Generate transactions in shards, in a worker pool
+
+    The rows are split into shards of ``shardsize`` consecutive rows
+    (consecutive date ranges). Shard ``i`` is drawn from
+    ``RandomState(seed + [i])``, so the shards are independent of each
+    other and of the number of workers. The balances are stitched
+    together in order: each shard's cumulative sums are added to the
+    balance at the end of the previous shard, and the stopping
+    conditions of :class:`BulkDataGenerator` are applied. The output is
+    reproducible for a given ``seed`` and ``shardsize``.
+
+    A ``seed`` sequence (e.g. ``(seed, account_number)``) gives
+    independent ledgers for multiple accounts.
+    """
+    def __init__(self, scheduler=None, shardsize=2 ** 20, **kwargs):
+        """
+        Args:
+            scheduler (pypfi.scheduler.ReportScheduler): worker pool
+                (default: serial)
+            shardsize (int): number of rows per shard
+            kwargs (dict): :class:`BulkDataGenerator` arguments
+                (``blocksize`` is ``shardsize``; if ``seed`` is None, a
+                random seed is drawn and stored as ``self.seed``)
+        """
+        if kwargs.get('seed') is None:
+            kwargs['seed'] = np.random.randint(0, 2 ** 31 - 1)
+        kwargs['blocksize'] = shardsize
+        super(ParallelDataGenerator, self).__init__(**kwargs)
+        if scheduler is None:
+            scheduler = _scheduler.ReportScheduler(1, mode='serial')
+        self.scheduler = scheduler
+        self._shards = None
+
+    def get_shard_seed(self, shard):
+        """
+        Returns:
+            list: ``RandomState`` seed of shard number ``shard``
+        """
+        return [int(x) for x in np.atleast_1d(self.seed)] + [shard]
+
+    def get_nrows(self):
+        """
+        Returns:
+            int: maximum number of rows (None if unbounded)
+        """
+        nrows = []
+        if self.max_count:
+            nrows.append(max(self.max_count, 2))
+        if self._end_ns is not None:
+            # ceiling: the first row at or after date_end is the last row
+            nrows.append(
+                max(-(-(self._end_ns - self._start_ns) // STEP_NS) + 2, 2))
+        return min(nrows) if nrows else None
+
+    def get_shard_tasks(self):
+        """
+        Yields:
+            tuple: :func:`generate_shard` tasks
+        """
+        nrows = self.get_nrows()
+        for shard in itertools.count():
+            start = shard * self.blocksize
+            if nrows is not None and start >= nrows:
+                break
+            size = self.blocksize
+            if nrows is not None:
+                size = min(size, nrows - start)
+            yield (self.get_shard_seed(shard), shard, size,
+                   self._statement_code, self._debit_codes, self._credit_codes)
+
+    def generate_arrays(self):
+        """
+        Returns:
+            collections.OrderedDict: the next shard of rows
+                (see :meth:`BulkDataGenerator.generate_arrays`)
+        """
+        if self.done:
+            return None
+        if self._shards is None:
+            self._shards = self.scheduler.imap(generate_shard,
+                                               self.get_shard_tasks())
+        shard = next(self._shards, None)
+        if shard is None:
+            self.done = True
+            return None
+        arrays = self.stitch_arrays(*shard)
+        if self.done:
+            self._shards.close()
+        return arrays
+
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'feather', 'npy')
+
+OUTPUT_EXTENSIONS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.npy': 'npy',
+}
+
+NPY_HEADER_BYTES = 128
+
+
+def get_output_format(path, default=None):
+    """
+    Args:
+        path (str): output path
+        default (str): format of paths with another (or no) extension
+            (``None``: raise ``ValueError``)
+    Returns:
+        str: one of ``OUTPUT_FORMATS``, from the extension of ``path``
+            (``npy``: a directory, e.g. ``transactions.npy/``)
+    """
+    ext = os.path.splitext(path.rstrip('/' + os.sep))[1].lower()
+    if ext not in OUTPUT_EXTENSIONS:
+        if default is not None:
+            return default
+        raise ValueError('unknown output format: %r' % path)
+    return OUTPUT_EXTENSIONS[ext]
+
+
+def encode_dates(date_ns, tz):
+    """
+    Encode dates like :func:`pypfi.cache.encode_columns`
+
+    Args:
+        date_ns (numpy.ndarray): UTC nanoseconds
+        tz (datetime.tzinfo): timezone of the dates
+    Returns:
+        tuple: ``(utc_datetime64, utcoffset_seconds)`` arrays
+    """
+    utc = np.asarray(date_ns).view('M8[ns]')
+    if tz is None:
+        return utc, np.zeros(len(utc), dtype=np.int64)
+    wall = pd.to_datetime(date_ns, utc=True).tz_convert(tz).tz_localize(None)
+    return utc, (wall.asi8 - date_ns) // 10 ** 9
+
+
+def write_npy_header(f, dtype, length, size=NPY_HEADER_BYTES):
+    """
+    Write a ``.npy`` (version 1.0) header, padded to ``size`` bytes
+
+    (A fixed size header can be written after the data, when the number
+    of rows is known.)
+
+    Args:
+        f (file-like): output, at the start of the file
+        dtype (numpy.dtype): array dtype
+        length (int): number of rows
+        size (int): header size in bytes
+    """
+    prefix = np.lib.format.magic(1, 0)
+    header_len = size - len(prefix) - 2
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype),
+                   'fortran_order': False,
+                   'shape': (length,)})
+    f.write(prefix + struct.pack('<H', header_len) +
+            (header.ljust(header_len - 1) + '\n').encode('latin1'))
+
+
+def read_frame(path, format=None, tz=None, mmap_mode='r'):
+    """
+    Read a frame written by :meth:`BulkDataGenerator.write`
+    (``parquet``, ``feather`` or ``npy``)
+
+    Args:
+        path (str): input path
+        format (str): one of ``OUTPUT_FORMATS``
+            (default: :func:`get_output_format`)
+        tz (str): convert dates to this timezone (otherwise, like
+            :func:`pypfi.pypfi.read_transactions_tsv`, ``date`` is an
+            object column of datetimes with their UTC offsets)
+        mmap_mode (str): ``numpy.load`` mode for ``npy`` columns
+    Returns:
+        pandas.DataFrame: ``date,desc,amount,balance`` frame
+    """
+    format = format or get_output_format(path)
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        df = pq.read_table(path).to_pandas()
+    elif format == 'feather':
+        import pyarrow.feather as feather
+        df = feather.read_feather(path)
+    elif format == 'npy':
+        def load(colname):
+            return np.load(os.path.join(path, colname + '.npy'),
+                           mmap_mode=mmap_mode)
+        df = pd.DataFrame(collections.OrderedDict((
+            ('date', load('date')),
+            ('date.utcoffset', load('date.utcoffset')),
+            ('desc', pd.Categorical.from_codes(
+                load('desc'), load('desc.categories').astype(object))),
+            ('amount', load('amount')),
+            ('balance', load('balance')))))
+    else:
+        raise ValueError(format)
+    if tz is not None:
+        df.pop('date.utcoffset')
+        df['date'] = pd.DatetimeIndex(df['date']).tz_localize(
+            'UTC').tz_convert(tz)
+        return df
+    return _cache.decode_columns(df, ['date'])
+
+
 def datagenerator2do():
     """
+    (see :class:`pypfi.simulation.ScheduleDataGenerator`)
+
     Daily cycle:
-        - [ ] sleep/wake (weekday)
-        - [ ] sleep/wake (weekend)
-        - [ ] meals
+        - [x] sleep/wake (weekday)
+        - [x] sleep/wake (weekend)
+        - [x] meals
 
     Recurring events:
-        - [ ] paid on fridays
-        - [ ] monthly bills
+        - [x] paid on fridays
+        - [x] monthly bills
     Constraints:
-        - [ ] sleep/wake
-        - [ ] no overdrafts (if balance < 0, not until payday)
+        - [x] sleep/wake
+        - [x] no overdrafts (if balance < 0, not until payday)
 
     """
 
@@ -239,6 +856,146 @@ class Test_datagenerator(unittest.TestCase):
             self.assertEqual(dg.count, MAX_COUNT) # +1
 
 
+    def test_300_BulkDataGenerator(self):
+        date_start = arrow.get('2014-12-18T10:57:00-06:00')
+        kwargs = dict(initial_balance=10000, date_start=date_start,
+                      max_count=50, seed=1, blocksize=16)
+        dg = BulkDataGenerator(**kwargs)
+        df = dg.to_frame()
+        self.assertEqual(len(df), 50)
+        self.assertEqual(dg.count, 50)
+        self.assertTrue(dg.done)
+        self.assertEqual(list(df.columns), ['date', 'desc', 'amount', 'balance'])
+        self.assertEqual(df['desc'][0], u"Account Statement")
+        self.assertEqual(df['amount'][0], 0)
+        self.assertEqual(df['date'][0], df['date'][1])
+        self.assertEqual(df['date'][1], date_start.replace(hours=+2).datetime)
+        self.assertTrue((df['date'].diff()[2:] == datetime.timedelta(0, 7200)).all())
+        np.testing.assert_allclose(df['balance'],
+                                   10000 + df['amount'].cumsum())
+        self.assertEqual(round(dg.balance, 2), round(df['balance'].iloc[-1], 2))
+        debits = df['amount'][1:] < 0
+        self.assertTrue(df['amount'][1:][debits].between(-100, -0.5).all())
+        self.assertTrue(df['amount'][1:][~debits].between(10, 2002).all())
+        self.assertTrue(df['desc'][1:][debits].str.match(
+            '^(ABC|XYZ|example.com) [a-zA-Z]{10}$').all())
+
+        # reproducible from a seed
+        pd.util.testing.assert_frame_equal(
+            df, BulkDataGenerator(**kwargs).to_frame())
+
+    def test_310_BulkDataGenerator_stop(self):
+        date_start = arrow.get('2014-12-18T10:57:00-06:00')
+        # overdraft: the overdrawing row is the last row
+        df = BulkDataGenerator(initial_balance=1, date_start=date_start,
+                               seed=1, blocksize=7).to_frame()
+        self.assertLessEqual(df['balance'].iloc[-1], 0)
+        self.assertTrue((df['balance'].iloc[:-1] > 0).all())
+        # date_end: the first row on or after date_end is the last row
+        date_end = date_start.replace(days=+1)
+        dg = BulkDataGenerator(initial_balance=10000, date_start=date_start,
+                               date_end=date_end, seed=1, blocksize=7)
+        df = dg.to_frame()
+        self.assertEqual(df['date'].iloc[-1], date_end.datetime)
+        self.assertIsNone(dg.generate_block())
+
+    def test_320_format_isoformat(self):
+        dates = pd.DatetimeIndex(['2014-03-09 07:00', '2014-03-09 09:00'],
+                                 tz='UTC').tz_convert('US/Central')
+        self.assertEqual(list(format_isoformat(dates)),
+                         ['2014-03-09 01:00:00-06:00',
+                          '2014-03-09 04:00:00-05:00'])
+        self.assertEqual(list(format_isoformat(dates.tz_localize(None))),
+                         ['2014-03-09 01:00:00', '2014-03-09 04:00:00'])
+
+    def test_330_write_read(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            kwargs = dict(initial_balance=10000, max_count=100, seed=1,
+                          blocksize=32,
+                          date_start=arrow.get('2014-12-18T10:57:00').replace(
+                              tzinfo='US/Central'))
+            expected = BulkDataGenerator(**kwargs).to_frame()
+            expected['date'] = expected['date'].dt.tz_convert('US/Central')
+            formats = ['npy']
+            if _cache.get_default_format() == 'feather':  # pyarrow
+                formats += ['parquet', 'feather']
+            for format in formats:
+                path = os.path.join(tmpdir, 'transactions.' + format)
+                self.assertEqual(get_output_format(path), format)
+                count = BulkDataGenerator(**kwargs).write(path)
+                self.assertEqual(count, 100)
+                df = read_frame(path, tz='US/Central')
+                df['desc'] = df['desc'].astype(object)
+                pd.util.testing.assert_frame_equal(df, expected)
+                df = read_frame(path)
+                self.assertEqual(
+                    [x.utcoffset() for x in df['date']],
+                    [x.utcoffset() for x in expected['date']])
+            path = os.path.join(tmpdir, 'transactions.npy', 'date.npy')
+            self.assertEqual(len(np.load(path)), 100)
+            self.assertRaises(ValueError, get_output_format, 'x.json')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_335_main_csv_extensions(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for filename in ('transactions.tsv', 'transactions.txt',
+                             'transactions'):
+                path = os.path.join(tmpdir, filename)
+                self.assertEqual(main('-o', path, '-c', '5', '-q'), 0)
+                df = pd.read_csv(path, header=None)
+                self.assertEqual(df.shape, (5, 4))
+                self.assertEqual(df[1][0], 'Account Statement')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_340_ParallelDataGenerator(self):
+        date_start = arrow.get('2014-12-18T10:57:00-06:00')
+        kwargs = dict(initial_balance=10000, date_start=date_start,
+                      max_count=50, seed=1, shardsize=8)
+        expected = ParallelDataGenerator(**kwargs).to_frame()
+        self.assertEqual(len(expected), 50)
+        self.assertEqual(expected['desc'][0], u"Account Statement")
+        np.testing.assert_allclose(expected['balance'],
+                                   10000 + expected['amount'].cumsum())
+        self.assertTrue((expected['date'].diff()[2:] ==
+                         datetime.timedelta(0, 7200)).all())
+        for mode in ('thread', 'process'):
+            with _scheduler.ReportScheduler(2, mode=mode) as scheduler:
+                df = ParallelDataGenerator(scheduler=scheduler,
+                                           **kwargs).to_frame()
+            pd.util.testing.assert_frame_equal(df, expected)
+
+        # shards are independent: the first shard of a longer ledger
+        kwargs['max_count'] = 100
+        df = ParallelDataGenerator(**kwargs).to_frame()
+        pd.util.testing.assert_frame_equal(df[:8], expected[:8])
+
+        # stop in a later shard
+        df = ParallelDataGenerator(initial_balance=300, date_start=date_start,
+                                   seed=1, shardsize=4).to_frame()
+        self.assertLessEqual(df['balance'].iloc[-1], 0)
+        self.assertTrue((df['balance'].iloc[:-1] > 0).all())
+        date_end = date_start.replace(days=+2)
+        dg = ParallelDataGenerator(initial_balance=10000, date_start=date_start,
+                                   date_end=date_end, seed=1, shardsize=5)
+        self.assertEqual(dg.to_frame()['date'].iloc[-1], date_end.datetime)
+        self.assertEqual(dg.get_shard_seed(3), [1, 3])
+
+        # date_end off the 2-hour grid: stop at the first row after it
+        for hours in (3, 5):
+            date_end = date_start.replace(hours=+hours)
+            kwargs = dict(initial_balance=10000, date_start=date_start,
+                          date_end=date_end, seed=1)
+            df = ParallelDataGenerator(shardsize=2, **kwargs).to_frame()
+            bulk = BulkDataGenerator(**kwargs).to_frame()
+            self.assertEqual(len(df), len(bulk))
+            self.assertGreaterEqual(df['date'].iloc[-1], date_end.datetime)
+            self.assertLess(df['date'].iloc[-2], date_end.datetime)
+
+
 def main(*args):
     import logging
     import optparse
@@ -265,6 +1022,34 @@ def main(*args):
                    type=int,
                    default=None)
 
+    prs.add_option('--bulk',
+                   help='Generate rows in NumPy blocks (BulkDataGenerator)',
+                   dest='bulk',
+                   action='store_true')
+    prs.add_option('-f', '--format',
+                   help=('Output format: %s (default: from the -o extension;'
+                         ' formats other than csv imply --bulk)'
+                         % ', '.join(OUTPUT_FORMATS)),
+                   dest='format',
+                   choices=OUTPUT_FORMATS,
+                   default=None)
+    prs.add_option('-j', '--jobs',
+                   help=('Generate shards in this many processes'
+                         ' (ParallelDataGenerator; implies --bulk)'),
+                   dest='jobs',
+                   type=int,
+                   default=None)
+    prs.add_option('--shardsize',
+                   help='Number of rows per shard (with -j)',
+                   dest='shardsize',
+                   type=int,
+                   default=2 ** 20)
+    prs.add_option('--seed',
+                   help='Random seed (with --bulk)',
+                   dest='seed',
+                   type=int,
+                   default=None)
+
     prs.add_option('-v', '--verbose',
                     dest='verbose',
                     action='store_true',)
@@ -302,6 +1087,31 @@ def main(*args):
         kwargs['date_end'] = date_end
 
 
+    format = opts.format
+    if format is None:
+        # e.g. transactions.tsv, transactions.txt: csv
+        format = get_output_format(opts.output_file or '', default='csv')
+    if format != 'csv' and not opts.output_file:
+        prs.error('-f %s requires an output file (-o)' % format)
+    if opts.jobs or opts.bulk or format != 'csv':
+        scheduler = None
+        if opts.jobs:
+            scheduler = _scheduler.ReportScheduler(opts.jobs)
+            generator = ParallelDataGenerator(scheduler=scheduler,
+                                              shardsize=opts.shardsize,
+                                              seed=opts.seed, **kwargs)
+        else:
+            generator = BulkDataGenerator(seed=opts.seed, **kwargs)
+        try:
+            if opts.output_file:
+                generator.write(opts.output_file, format=format)
+            else:
+                generator.write_csv(sys.stdout)
+        finally:
+            if scheduler is not None:
+                scheduler.close()
+        return 0
+
     import csv
     if opts.output_file:
         with codecs.open(opts.output_file, 'w', encoding='utf-8') as f:
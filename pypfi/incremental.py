@@ -0,0 +1,490 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.incremental
+==================
+
+Incremental report updates for append-only transactions files.
+
+The aggregate state of the streaming reports (per-key counts, sums and
+moments; see :class:`pypfi.pypfi.StreamingReports`) is persisted with a
+high-water mark: the byte offset and row count read so far, the last
+(UTC) date, and a fingerprint of the first and of the last
+:data:`FINGERPRINT_BYTES` bytes before the offset. The next run reads
+only the rows after the offset (in blocks of :data:`TAIL_BLOCKSIZE`
+bytes) and folds them into the state, so an update takes time
+proportional to the appended rows (and the number of groups), not to the
+size of the file.
+
+If the file was truncated, rewritten from the start, or changed just
+before the offset (the fingerprint does not match), or the read options
+changed, the state is rebuilt from the start of the file. Rows edited in
+place between the fingerprinted bytes are not detected; delete the state
+file to rebuild the reports after such an edit.
+
+Usage::
+
+    python -m pypfi.incremental -i transactions.csv -o report.html
+
+"""
+import hashlib
+import io
+import logging
+import os
+import pickle
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+try:
+    from . import pypfi as _pypfi
+except (ImportError, ValueError):  # python ./pypfi/incremental.py
+    import pypfi as _pypfi
+
+log = logging.getLogger('pypfi.incremental')
+
+
+STATE_VERSION = 3
+
+INCREMENTAL_AGGFUNCS = ('sum', 'count', 'mean', 'std')
+
+FINGERPRINT_BYTES = 4096
+
+TAIL_BLOCKSIZE = 2 ** 24
+
+
+def get_default_state_file(input_file):
+    """
+    Returns:
+        str: ``<input_file>.pypfi-state.pkl``
+    """
+    return input_file + '.pypfi-state.pkl'
+
+
+def get_fingerprint(path, offset, size=FINGERPRINT_BYTES):
+    """
+    Args:
+        path (str): path to the input file
+        offset (int): byte offset
+        size (int): number of bytes to hash at the start of the file and
+            before ``offset``
+    Returns:
+        str: hex digest of the first ``size`` bytes and of the ``size``
+        bytes before ``offset``
+    """
+    with open(path, 'rb') as f:
+        sha = hashlib.sha1(f.read(min(size, offset)))
+        start = max(0, offset - size)
+        f.seek(start)
+        sha.update(f.read(offset - start))
+        return sha.hexdigest()
+
+
+def read_tail(path, offset, blocksize=TAIL_BLOCKSIZE):
+    """
+    Read the complete lines after ``offset`` in blocks
+
+    A trailing line without a newline (a row which is still being
+    written) is not read.
+
+    Args:
+        path (str): path to the input file
+        offset (int): byte offset to read from
+        blocksize (int): number of bytes to read at a time
+    Yields:
+        tuple: ``(data, end_offset)``: complete lines of (about)
+        ``blocksize`` bytes, and the byte offset after them
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        rest = b''
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            data = rest + block
+            end = data.rfind(b'\n') + 1
+            if end:
+                offset += end
+                yield data[:end], offset
+            rest = data[end:]
+
+
+class IncrementalState(object):
+    """
+    Persisted streaming report state and high-water mark of an input file
+    """
+
+    def __init__(self, options=None):
+        """
+        Args:
+            options (dict): read options (a different value rebuilds the
+                state)
+        """
+        self.version = STATE_VERSION
+        self.options = dict(options or {})
+        self.offset = 0
+        self.nrows = 0
+        self.last_date = None
+        self.fingerprint = None
+        self.reports = _pypfi.StreamingReports(aggfuncs=INCREMENTAL_AGGFUNCS)
+
+    @classmethod
+    def load(cls, state_file):
+        """
+        Args:
+            state_file (str): path to a pickled state
+        Returns:
+            IncrementalState: the state (None if there is no state file,
+            or if it cannot be read)
+        """
+        if not os.path.exists(state_file):
+            return None
+        try:
+            with open(state_file, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            # truncated, or written by an incompatible version
+            log.warning('%s: unreadable state file (%r); rebuilding',
+                        state_file, e)
+            return None
+
+    def save(self, state_file):
+        """
+        Write the state (atomically)
+
+        Args:
+            state_file (str): path to the state file
+        """
+        tmp_path = state_file + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, state_file)
+
+    def is_valid_for(self, path, options):
+        """
+        Args:
+            path (str): path to the input file
+            options (dict): read options
+        Returns:
+            bool: True if ``path`` is this state's file, with rows appended
+        """
+        if self.version != STATE_VERSION or self.options != dict(options):
+            return False
+        if os.path.getsize(path) < self.offset:
+            return False
+        return get_fingerprint(path, self.offset) == self.fingerprint
+
+    def update(self, path, chunksize=100000, blocksize=TAIL_BLOCKSIZE):
+        """
+        Read the rows after the high-water mark and fold them in
+
+        Args:
+            path (str): path to the input file
+            chunksize (int): number of rows to parse at a time
+            blocksize (int): number of bytes to read at a time
+        Returns:
+            int: number of rows read
+        """
+        end_offset = self.offset
+        nrows = 0
+        for data, end_offset in read_tail(path, self.offset, blocksize):
+            chunks = _pypfi.read_transactions_tsv(
+                io.BytesIO(data), chunksize=chunksize, **self.options)
+            for chunk in chunks:
+                dates = pd.to_datetime(chunk['date'], utc=True)
+                if self.last_date is not None and dates.min() < self.last_date:
+                    log.warning('%s: appended rows before %s', path,
+                                self.last_date)
+                self.last_date = max(dates.max(), self.last_date or dates.max())
+                self.reports.update(chunk)
+                nrows += len(chunk)
+        self.offset = end_offset
+        self.nrows += nrows
+        self.fingerprint = get_fingerprint(path, self.offset)
+        return nrows
+
+
+def update_reports(input_file, state_file=None, chunksize=100000,
+                   **read_kwargs):
+    """
+    Update the persisted report state of ``input_file`` with its new rows
+
+    Args:
+        input_file (str): path to the (append-only) transactions file
+        state_file (str): path to the state file
+            (default: :func:`get_default_state_file`)
+        chunksize (int): number of rows to parse at a time
+        read_kwargs (dict): :func:`pypfi.pypfi.read_transactions_tsv`
+            arguments (``date_format``, ``tz``, ``engine``)
+    Returns:
+        tuple: ``(report_dict, state, nrows_read)``
+    """
+    state_file = state_file or get_default_state_file(input_file)
+    state = IncrementalState.load(state_file)
+    if state is None or not state.is_valid_for(input_file, read_kwargs):
+        if state is not None:
+            log.info('%s: file or options changed; rebuilding', input_file)
+        state = IncrementalState(read_kwargs)
+    nrows = state.update(input_file, chunksize=chunksize)
+    state.save(state_file)
+    log.debug('%s: read %d new rows (%d total)', input_file, nrows,
+              state.nrows)
+
+    report_dict = _pypfi.ReportDict(headingchar='=', headinghtml='h2')
+    reports = state.reports.to_report_dict()
+    for name in ('build_groupby_reports', 'build_pivot_reports', 'ingest'):
+        report_dict[name] = reports[name]
+    report_dict['ingest']['new_rows'] = nrows
+    report_dict['ingest']['last_date'] = str(state.last_date)
+    return report_dict, state, nrows
+
+
+def pypfi_incremental(input_file, output_file, state_file=None,
+                      chunksize=100000, debug=False, output=sys.stdout,
+                      date_format=None, tz=None, engine='c', max_rows=None,
+                      compress=None, lazy=False):
+    """
+    Update the report of an append-only transactions file
+
+    Args:
+        input_file (str): path to the transactions file
+        output_file (str): path to the output HTML file
+        state_file (str): path to the state file
+            (default: :func:`get_default_state_file`)
+    Returns:
+        int: 0
+    """
+    report_dict, _, _ = update_reports(
+        input_file, state_file=state_file, chunksize=chunksize,
+        date_format=date_format, tz=tz, engine=engine)
+    if debug:
+        report_dict.print_str(output=output)
+    _pypfi.write_report(input_file, output_file, report_dict,
+                        max_rows=max_rows, compress=compress, lazy=lazy)
+    return 0
+
+
+class Test_incremental(unittest.TestCase):
+    def setUp(self):
+        self.INPUT_FILE = os.path.join(os.path.dirname(__file__),
+                                       '..', 'tests', 'testdata.csv')
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'transactions.csv')
+        with open(self.INPUT_FILE, 'rb') as f:
+            self.lines = f.readlines()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, lines, mode='wb'):
+        with open(self.path, mode) as f:
+            f.writelines(lines)
+
+    def assertReportsEqual(self, report_dict, expected):
+        for name in ('build_groupby_reports', 'build_pivot_reports'):
+            for key, value in expected[name]._dict.iteritems():
+                pd.util.testing.assert_almost_equal(
+                    report_dict[name][key], value)
+
+    def test_010_append(self):
+        self.write(self.lines[:1000])
+        report_dict, state, nrows = update_reports(self.path)
+        self.assertEqual(nrows, 1000)
+        # a partially written row is not read
+        self.write(self.lines[1000:1200] + [self.lines[1200][:10]], 'ab')
+        report_dict, state, nrows = update_reports(self.path)
+        self.assertEqual(nrows, 200)
+        self.write([self.lines[1200][10:]] + self.lines[1201:], 'ab')
+        report_dict, state, nrows = update_reports(self.path)
+        self.assertEqual(nrows, len(self.lines) - 1200)
+        self.assertEqual(state.nrows, len(self.lines))
+        self.assertEqual(report_dict['ingest']['rows'], len(self.lines))
+
+        expected = _pypfi.StreamingReports(aggfuncs=INCREMENTAL_AGGFUNCS)
+        expected.update(_pypfi.read_transactions_tsv(self.INPUT_FILE))
+        self.assertReportsEqual(report_dict, expected.to_report_dict())
+
+    def test_015_blocks(self):
+        self.write(self.lines + [self.lines[0][:10]])
+        state = IncrementalState()
+        # blocks smaller than a line are joined
+        blocks = list(read_tail(self.path, 0, blocksize=7))
+        self.assertEqual(b''.join(data for data, _ in blocks),
+                         b''.join(self.lines))
+        self.assertEqual(blocks[-1][1], os.path.getsize(self.path) - 10)
+        self.assertEqual(state.update(self.path, blocksize=4096),
+                         len(self.lines))
+        self.assertEqual(state.offset, blocks[-1][1])
+
+        expected = _pypfi.StreamingReports(aggfuncs=INCREMENTAL_AGGFUNCS)
+        expected.update(_pypfi.read_transactions_tsv(self.INPUT_FILE))
+        self.assertReportsEqual(state.reports.to_report_dict(),
+                                expected.to_report_dict())
+
+    def test_020_rewrite(self):
+        self.write(self.lines[:1000])
+        update_reports(self.path)
+        self.write(self.lines[500:])
+        report_dict, state, nrows = update_reports(self.path)
+        self.assertEqual(nrows, len(self.lines) - 500)
+        self.assertEqual(state.nrows, len(self.lines) - 500)
+        _, _, nrows = update_reports(self.path, tz='UTC')
+        self.assertEqual(nrows, len(self.lines) - 500)
+
+    def test_030_rewrite_early_row(self):
+        self.write(self.lines[:1000])
+        update_reports(self.path)
+        # same size, edited amount in the second row
+        lines = list(self.lines)
+        lines[1] = lines[1].replace(b'-80.09', b'-90.09')
+        self.assertNotEqual(lines[1], self.lines[1])
+        self.write(lines[:1000])
+        report_dict, state, nrows = update_reports(self.path)
+        self.assertEqual(nrows, 1000)
+        self.assertEqual(state.nrows, 1000)
+
+        expected = _pypfi.StreamingReports(aggfuncs=INCREMENTAL_AGGFUNCS)
+        expected.update(_pypfi.read_transactions_tsv(self.path))
+        self.assertReportsEqual(report_dict, expected.to_report_dict())
+
+    def test_040_empty(self):
+        for lines in ([], [self.lines[0][:10]]):
+            self.write(lines)
+            report_dict, state, nrows = update_reports(self.path)
+            self.assertEqual((nrows, state.nrows, state.offset), (0, 0, 0))
+            self.assertEqual(report_dict['ingest']['rows'], 0)
+            self.assertEqual(
+                len(report_dict['build_groupby_reports']['groupby_year']),
+                0)
+            output_file = os.path.join(self.tmpdir, 'report.html')
+            self.assertEqual(pypfi_incremental(self.path, output_file,
+                                               output=StringIO.StringIO()), 0)
+        # then rows are appended
+        self.write([self.lines[0][10:]] + self.lines[1:100], 'ab')
+        report_dict, state, nrows = update_reports(self.path)
+        self.assertEqual(nrows, 100)
+
+    def test_050_unreadable_state(self):
+        self.write(self.lines[:100])
+        update_reports(self.path)
+        state_file = get_default_state_file(self.path)
+        with open(state_file, 'rb') as f:
+            data = f.read()
+        for data in (data[:len(data) // 2], b'not a pickle'):
+            with open(state_file, 'wb') as f:
+                f.write(data)
+            self.assertIsNone(IncrementalState.load(state_file))
+            report_dict, state, nrows = update_reports(self.path)
+            self.assertEqual(nrows, 100)
+
+    def test_900_pypfi_incremental(self):
+        self.write(self.lines)
+        output_file = os.path.join(self.tmpdir, 'report.html')
+        for _ in range(2):
+            output = pypfi_incremental(self.path, output_file,
+                                       output=StringIO.StringIO())
+            self.assertEqual(output, 0)
+        self.assertTrue(os.path.exists(output_file))
+
+    def test_910_main(self):
+        self.write(self.lines)
+        output_file = os.path.join(self.tmpdir, 'report.html')
+        self.assertRaises(SystemExit, main, '-i', self.path, '-q')
+        self.assertRaises(SystemExit, main, '-i', self.path, '-o',
+                          output_file, '--engine', 'pyarrow', '-q')
+        self.assertEqual(main('-i', self.path, '-o', output_file,
+                              '--engine', 'python', '-q'), 0)
+        self.assertTrue(os.path.exists(output_file))
+
+
+def main(*args):
+    import optparse
+
+    prs = optparse.OptionParser(
+        usage="%prog -i <input.tsv> -o <report.html> [--state-file <path>]")
+
+    prs.add_option('-i', '--input-file',
+                   dest='input_file',)
+    prs.add_option('-o', '--output-file',
+                   dest='output_file',)
+    prs.add_option('--state-file',
+                   dest='state_file',
+                   help='Report state (default: INPUT_FILE.pypfi-state.pkl)',
+                   default=None)
+    prs.add_option('--chunksize',
+                   dest='chunksize',
+                   help='Parse new rows in chunks of this many rows',
+                   type=int,
+                   default=100000)
+    prs.add_option('--date-format',
+                   dest='date_format',
+                   help='strptime format of the date column',
+                   default=None)
+    prs.add_option('--tz',
+                   dest='tz',
+                   help='Convert dates to this timezone (e.g. US/Central)',
+                   default=None)
+    prs.add_option('--engine',
+                   dest='engine',
+                   help='pandas.read_csv parser engine (c or python)',
+                   type='choice',
+                   choices=_pypfi.CSV_ENGINES,
+                   default='c')
+    prs.add_option('--max-rows',
+                   dest='max_rows',
+                   help='Truncate HTML tables to this many rows',
+                   type=int,
+                   default=None)
+    prs.add_option('-z', '--gzip',
+                   dest='compress',
+                   help='gzip the HTML report (default: if -o ends with .gz)',
+                   action='store_true',
+                   default=None)
+
+    prs.add_option('-v', '--verbose',
+                    dest='verbose',
+                    action='store_true',)
+    prs.add_option('-q', '--quiet',
+                    dest='quiet',
+                    action='store_true',)
+    prs.add_option('-t', '--test',
+                    dest='run_tests',
+                    action='store_true',)
+
+    args = args and list(args) or sys.argv[1:]
+    (opts, args) = prs.parse_args(args)
+
+    if not opts.quiet:
+        logging.basicConfig()
+
+        if opts.verbose:
+            logging.getLogger().setLevel(logging.DEBUG)
+
+    if opts.run_tests:
+        sys.argv = [sys.argv[0]] + args
+        exit(unittest.main())
+
+    if not (opts.input_file and opts.output_file):
+        prs.error('-i <input.tsv> and -o <report.html> are required')
+
+    return pypfi_incremental(opts.input_file,
+                             opts.output_file,
+                             state_file=opts.state_file,
+                             chunksize=opts.chunksize,
+                             debug=opts.verbose,
+                             output=sys.stdout if opts.verbose else StringIO.StringIO(),
+                             date_format=opts.date_format,
+                             tz=opts.tz,
+                             engine=opts.engine,
+                             max_rows=opts.max_rows,
+                             compress=opts.compress)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
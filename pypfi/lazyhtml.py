@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.lazyhtml
+===============
+
+Lazily loaded HTML reports.
+
+:func:`write_lazy_html_report` writes each table of a report to its own
+data file (``<output_file>.data/<n>.js``) and an HTML page with one
+placeholder per table. A table is loaded when its placeholder is
+scrolled into view, and only the visible rows are rendered (virtual
+scrolling), so page load time does not depend on the number of
+transactions.
+
+The data files are JSONP (``pypfi_report_data(id, rows, meta);``) so
+that they can be loaded with ``<script>`` tags from ``file://`` URLs.
+
+"""
+import cgi
+import codecs
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+
+LAZY_HTML_HEADER = """
+<link rel="stylesheet" href="https://maxcdn.bootstrapcdn.com/bootstrap/3.3.0/css/bootstrap.min.css">
+<link rel="stylesheet" href="https://maxcdn.bootstrapcdn.com/bootstrap/3.3.0/css/bootstrap-theme.min.css">
+<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/jquery.tocify/1.9.0/stylesheets/jquery.tocify.css">
+
+<script src="https://cdnjs.cloudflare.com/ajax/libs/jquery/2.1.1/jquery.min.js"></script>
+<script src="https://maxcdn.bootstrapcdn.com/bootstrap/3.3.0/js/bootstrap.min.js"></script>
+<script src="https://cdnjs.cloudflare.com/ajax/libs/jqueryui/1.11.2/jquery-ui.min.js"></script>
+<script src="https://cdnjs.cloudflare.com/ajax/libs/jquery.tocify/1.9.0/javascripts/jquery.tocify.js"></script>
+
+<script>
+var PYPFI_ROW_HEIGHT = 24;
+var PYPFI_VIEW_ROWS = 25;
+var PYPFI_OVERSCAN = 10;
+
+function pypfi_escape(value) {
+    if (value === null || value === undefined) {
+        return '';
+    }
+    if (typeof value === 'number') {
+        value = String(Math.round(value * 1e6) / 1e6);
+    }
+    return String(value).replace(/&/g, '&amp;').replace(/</g, '&lt;')
+                        .replace(/>/g, '&gt;');
+}
+
+function pypfi_cells(tag, values) {
+    var html = '';
+    for (var i = 0; i < values.length; i++) {
+        html += '<' + tag + '>' + pypfi_escape(values[i]) + '</' + tag + '>';
+    }
+    return html;
+}
+
+function pypfi_row_cells(meta, rows, i) {
+    var nindex = meta.index_names.length;
+    var row = rows[i];
+    if (!meta.sparse || (meta.footer && i === rows.length - 1)) {
+        return row;
+    }
+    var cells = row.slice(0, nindex);
+    var values = new Array(meta.ncolumns);
+    values[row[nindex]] = row[nindex + 1];
+    if (meta.margins) {
+        values[meta.ncolumns - 1] = row[nindex + 1];
+    }
+    return cells.concat(values);
+}
+
+function pypfi_report_data(id, rows, meta) {
+    var el = document.getElementById(id);
+    var nindex = meta.index_names.length;
+    var head = '';
+    for (var i = 0; i < meta.header.length; i++) {
+        head += '<tr>' + new Array(nindex).join('<th></th>') +
+            pypfi_cells('th', meta.header[i]) + '</tr>';
+    }
+    head += '<tr>' + pypfi_cells('th', meta.index_names) +
+        new Array(meta.ncolumns + 1).join('<th></th>') + '</tr>';
+    if (meta.footer) {
+        rows.push(meta.footer);
+    }
+    el.innerHTML = (
+        '<div class="pypfi-vscroll" style="max-height: ' +
+        (PYPFI_VIEW_ROWS + meta.header.length + 1) * PYPFI_ROW_HEIGHT +
+        'px"><table class="table table-condensed table-hover ' +
+        'table-bordered table-striped"><thead>' + head +
+        '</thead><tbody></tbody></table></div>' +
+        (meta.truncated ? '<p class="truncated text-muted">Showing ' +
+         meta.nrows + ' of ' + meta.total_rows + ' rows (truncated)</p>' : ''));
+    var scroller = el.firstChild;
+    var tbody = el.getElementsByTagName('tbody')[0];
+    var drawing = false;
+    function draw() {
+        drawing = false;
+        var first = Math.max(0, Math.floor(
+            scroller.scrollTop / PYPFI_ROW_HEIGHT) - PYPFI_OVERSCAN);
+        var last = Math.min(rows.length,
+                            first + PYPFI_VIEW_ROWS + 2 * PYPFI_OVERSCAN);
+        var html = '<tr style="height: ' + first * PYPFI_ROW_HEIGHT + 'px"></tr>';
+        for (var i = first; i < last; i++) {
+            var cells = pypfi_row_cells(meta, rows, i);
+            html += '<tr>' + pypfi_cells('th', cells.slice(0, nindex)) +
+                pypfi_cells('td', cells.slice(nindex)) + '</tr>';
+        }
+        html += '<tr style="height: ' + (rows.length - last) * PYPFI_ROW_HEIGHT +
+            'px"></tr>';
+        tbody.innerHTML = html;
+    }
+    scroller.onscroll = function() {
+        if (!drawing) {
+            drawing = true;
+            window.requestAnimationFrame(draw);
+        }
+    };
+    draw();
+}
+
+function pypfi_load(el) {
+    if (el.getAttribute('data-loaded')) {
+        return;
+    }
+    el.setAttribute('data-loaded', '1');
+    var script = document.createElement('script');
+    script.src = el.getAttribute('data-src');
+    document.body.appendChild(script);
+}
+
+$(document).ready(function() {
+    var placeholders = $('.pypfi-lazy');
+    if ('IntersectionObserver' in window) {
+        var observer = new IntersectionObserver(function(entries) {
+            entries.forEach(function(entry) {
+                if (entry.isIntersecting) {
+                    observer.unobserve(entry.target);
+                    pypfi_load(entry.target);
+                }
+            });
+        }, {rootMargin: '200px'});
+        placeholders.each(function() { observer.observe(this); });
+    }
+    $('h2,h3,h4,h5,h6').css('display', 'inline-table').after('<a class="headerlink" href="#">^</a>');
+    $("#toc").tocify({
+        selectors: "h2,h3,h4,h5,h6",
+        showAndHide: false,
+        hashGenerator: "pretty",
+        scrollHistory: true,
+        extendPage: false
+        });
+});
+</script>
+
+<style>
+.pypfi-vscroll {
+    overflow-y: auto;
+}
+
+.pypfi-vscroll td,
+.pypfi-vscroll th {
+    height: 24px;
+    padding: 2px !important;
+    white-space: nowrap;
+}
+
+.pypfi-vscroll thead th {
+    position: sticky;
+    top: 0;
+    background-color: #FFF;
+}
+
+.tocify {
+   position: static;
+   margin-left: 0;
+
+   width: inherit;
+   max-height: inherit;
+}
+
+.tocify-subheader {
+    text-indent: 20px;
+    display: inherit !important;
+}
+
+a.headerlink {
+    color: #F2F2F2;
+    padding: 0 4px 0 4px;
+    text-decoration: none;
+}
+
+</style>
+"""
+
+
+def _json_default(value):
+    if hasattr(value, 'item'):  # numpy scalars
+        return value.item()
+    return str(value)
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), default=_json_default)
+
+
+def _index_labels(index):
+    if isinstance(index, pd.MultiIndex):
+        return [index.get_level_values(i).astype(str)
+                for i in range(index.nlevels)]
+    return [index.astype(str)]
+
+
+def _frame_header(df):
+    columns = df.columns
+    if isinstance(columns, pd.MultiIndex):
+        return [[str(name)] + [str(x) for x in columns.get_level_values(i)]
+                for i, name in enumerate(columns.names)]
+    return [[str(columns.name or '')] + [str(x) for x in columns]]
+
+
+def iter_frame_rows(df, chunksize=10000, max_rows=None):
+    """
+    Iterate over chunks of rows of a DataFrame, as JSON-able lists
+
+    Args:
+        df (pandas.DataFrame): frame
+        chunksize (int): number of rows per chunk
+        max_rows (int): maximum number of rows (``None``: all rows)
+    Yields:
+        list: ``[[index_label, ..., value, ...], ...]`` (NaN is None)
+    """
+    nrows = len(df) if max_rows is None else min(len(df), max_rows)
+    for start in range(0, nrows, chunksize):
+        chunk = df.iloc[start:min(start + chunksize, nrows)]
+        labels = _index_labels(chunk.index)
+        values = chunk.astype(object).where(pd.notnull(chunk), None)
+        yield [[l[i] for l in labels] + row
+               for i, row in enumerate(values.values.tolist())]
+
+
+def get_report_data(value, chunksize=10000, max_rows=None):
+    """
+    Get the metadata and (chunks of) rows of a report table
+
+    Args:
+        value (object): DataFrame, Series or ``LongPivot``
+        chunksize (int): number of rows per chunk
+        max_rows (int): maximum number of rows (``None``: all rows)
+    Returns:
+        tuple: ``(meta, row_chunks)``, or None if ``value`` is not a table
+    """
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+    total_rows = len(value) if hasattr(value, '__len__') else None
+    nrows = total_rows if max_rows is None else min(total_rows, max_rows)
+    meta = {
+        'nrows': nrows,
+        'total_rows': total_rows,
+        'truncated': nrows < total_rows,
+        'sparse': False,
+        'margins': False,
+        'footer': None,
+    }
+    if isinstance(value, pd.DataFrame):
+        meta['header'] = _frame_header(value)
+        meta['index_names'] = [str(x or '') for x in value.index.names]
+        meta['ncolumns'] = len(value.columns)
+        return meta, iter_frame_rows(value, chunksize, max_rows)
+    if hasattr(value, 'iter_rows') and hasattr(value, 'get_column_header_rows'):
+        meta['header'] = [[str(name)] + labels
+                          for name, labels in value.get_column_header_rows()]
+        meta['index_names'] = [str(x) for x in value.index_names]
+        meta['ncolumns'] = len(value.columns)
+        meta['sparse'] = True
+        meta['margins'] = value.margins
+
+        def iter_rows():
+            rows = []
+            for index_labels, position, cell in value.iter_rows(
+                    chunksize=chunksize, max_rows=max_rows):
+                if position is None:
+                    meta['footer'] = index_labels + cell
+                    continue
+                rows.append(index_labels + [int(position), cell])
+                if len(rows) >= chunksize:
+                    yield rows
+                    rows = []
+            if rows:
+                yield rows
+        return meta, iter_rows()
+    return None
+
+
+def write_report_data(path, report_id, meta, row_chunks):
+    """
+    Write a JSONP report data file, one chunk of rows at a time
+
+    Args:
+        path (str): output path
+        report_id (str): id of the placeholder element
+        meta (dict): report metadata (see :func:`get_report_data`)
+        row_chunks (iterable): lists of rows
+    """
+    with codecs.open(path, 'w', encoding='utf8') as f:
+        f.write('pypfi_report_data(%s,[' % _dumps(report_id))
+        first = True
+        for rows in row_chunks:
+            text = _dumps(rows)[1:-1]
+            if text:
+                if not first:
+                    f.write(',')
+                f.write(text)
+                first = False
+        # meta is written last: the footer (margins) row follows the rows
+        f.write('],%s);\n' % _dumps(meta))
+
+
+def write_lazy_html_report(input_file, output_file, report_dict,
+                           max_rows=None, chunksize=10000):
+    """
+    Write an HTML report which loads each table on demand
+
+    Args:
+        input_file (str): path to the transactions file (title)
+        output_file (str): path to the output HTML file
+        report_dict (pypfi.pypfi.ReportDict): reports to write
+        max_rows (int): maximum number of rows of each table
+        chunksize (int): number of rows to serialize at a time
+    Returns:
+        str: path of the data directory (``<output_file>.data``)
+    """
+    data_dir = output_file + '.data'
+    if os.path.exists(data_dir):
+        shutil.rmtree(data_dir)
+    os.makedirs(data_dir)
+    data_url = os.path.basename(data_dir)
+
+    with codecs.open(output_file, 'w', encoding='utf8') as f:
+        f.write('<html><head>')
+        f.write('<title>{0}</title>'.format(cgi.escape(input_file)))
+        f.write(LAZY_HTML_HEADER)
+        f.write('</head><body>')
+        f.write('<div class="container">')
+        f.write('<div class="row">')
+
+        f.write('<div class="page-header">')
+        f.write('<h1>{0}</h1>'.format(cgi.escape(input_file)))
+        f.write('</div>')
+
+        f.write('<div id="toc"></div>')
+
+        f.write('<div class="body">')
+        depth = 0
+        for n, (path, headinghtml, value) in enumerate(report_dict.walk()):
+            while depth >= len(path):
+                f.write('</div>\n')
+                depth -= 1
+            key = path[-1]
+            f.write('<div class="{0}">'.format(cgi.escape(key)))
+            f.write('<{0}>{1}</{0}>'.format(headinghtml, cgi.escape(key)))
+            depth += 1
+            if hasattr(value, 'walk'):
+                continue
+            data = get_report_data(value, chunksize=chunksize,
+                                   max_rows=max_rows)
+            if data is None:
+                f.write('<pre class="pandas_str">\n{}\n</pre>'.format(
+                    cgi.escape(str(value))))
+                continue
+            meta, row_chunks = data
+            report_id = 'pypfi-report-%d' % n
+            filename = '%d.js' % n
+            write_report_data(os.path.join(data_dir, filename), report_id,
+                              meta, row_chunks)
+            f.write(
+                '<div class="pypfi-lazy" id="{0}" data-src="{1}/{2}">'
+                '<button class="btn btn-default btn-xs" '
+                'onclick="pypfi_load(this.parentNode)">'
+                'Load {3} rows</button></div>'.format(
+                    report_id, cgi.escape(data_url, quote=True), filename,
+                    meta['nrows']))
+        f.write('</div>\n' * depth)
+        f.write('</div>')
+
+        f.write('</div>')
+        f.write('</div>')
+        f.write('<div class="footer"><div class="container"><div class="row">')
+        f.write('<p class="text-muted">{0}</p>'.format(cgi.escape(input_file)))
+        f.write('<a class="headerlink" href="#">^top^</a>')
+        f.write('</div></div></div>')
+        f.write('</body></html>')
+    return data_dir
+
+
+class Test_lazyhtml(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_010_write_report_data(self):
+        df = pd.DataFrame({'a': [1.5, np.nan, 3], 'b': ['x', 'y', 'z']},
+                          columns=['a', 'b'])
+        meta, row_chunks = get_report_data(df, chunksize=2)
+        path = os.path.join(self.tmpdir, '0.js')
+        write_report_data(path, 'id0', meta, row_chunks)
+        with codecs.open(path, encoding='utf8') as f:
+            text = f.read()
+        prefix = 'pypfi_report_data("id0",'
+        self.assertTrue(text.startswith(prefix))
+        rows, meta = json.loads('[' + text[len(prefix):-3] + ']')
+        self.assertEqual(meta['header'], [['', 'a', 'b']])
+        self.assertEqual(meta['nrows'], 3)
+        self.assertEqual(rows, [['0', 1.5, 'x'], ['1', None, 'y'],
+                                ['2', 3.0, 'z']])
@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.ledger
+=============
+
+Consolidated reports over the transactions of several accounts.
+
+:func:`read_ledger` reads one transactions file per account and tags
+each row with its ``account`` and ``parent_account`` (from a
+:class:`pypfi.accounts.Account` tree). The groupby and pivot reports are
+built once over the combined frame; :func:`build_account_reports` adds
+``account`` as a grouping dimension, with each account's totals rolled
+up from its subaccounts (see :func:`pypfi.aggregates.rollup_hierarchy`).
+
+Usage::
+
+    python -m pypfi.ledger -o ledger.html \\
+        -a checking=checking.csv -a savings=savings.csv \\
+        -p checking=assets -p savings=assets
+
+"""
+import collections
+import os
+import StringIO
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import aggregates
+    from . import pypfi as _pypfi
+    from .accounts import Account
+except (ImportError, ValueError):  # python ./pypfi/ledger.py
+    import aggregates
+    import pypfi as _pypfi
+    from accounts import Account
+
+
+def iter_accounts(account, parent=None, depth=0):
+    """
+    Iterate over an account tree, depth-first
+
+    Args:
+        account (pypfi.accounts.Account): root account
+        parent (pypfi.accounts.Account): parent of ``account``
+        depth (int): depth of ``account``
+    Yields:
+        tuple: ``(account, parent, depth)``
+    """
+    yield account, parent, depth
+    for subaccount in account.subaccounts:
+        for item in iter_accounts(subaccount, account, depth + 1):
+            yield item
+
+
+def build_account_tree(names, parents=None, root_name='All'):
+    """
+    Build an account tree from account names and parent names
+
+    Args:
+        names (iterable): account names
+        parents (dict): ``{name: parent_name}``; accounts without a
+            parent (and parent names which are not ``names``) are
+            subaccounts of the root
+        root_name (str): name of the root account
+    Returns:
+        pypfi.accounts.Account: root account
+    """
+    parents = parents or {}
+    accounts = collections.OrderedDict()
+    for name in list(names) + list(parents.values()):
+        if name not in accounts and name != root_name:
+            accounts[name] = Account(name)
+    root = Account(root_name)
+    for name, account in accounts.items():
+        parent = parents.get(name)
+        parent = accounts[parent] if parent in accounts else root
+        parent.subaccounts.append(account)
+    return root
+
+
+class AccountHierarchy(object):
+    """
+    The accounts of an account tree, in depth-first order
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (pypfi.accounts.Account): root account
+        """
+        self.root = root
+        names, parents, depths = [], [], []
+        for account, parent, depth in iter_accounts(root):
+            if account.name in names:
+                raise ValueError("duplicate account name: %r" % account.name)
+            names.append(account.name)
+            parents.append(parent.name if parent is not None else None)
+            depths.append(depth)
+        self.names = names
+        self.index = pd.Index(names, name='account')
+        self.parents = parents
+        self.depths = np.array(depths, dtype=np.int64)
+        self.parent_positions = np.array(
+            [-1 if p is None else names.index(p) for p in parents],
+            dtype=np.int64)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def get_ancestor_pairs(self):
+        """
+        Returns:
+            tuple: ``(descendants, ancestors)`` position arrays, with one
+            pair for each account and each of its ancestors (and itself),
+            sorted by descendant
+        """
+        descendants, ancestors = [], []
+        for position in range(len(self.names)):
+            ancestor = position
+            while ancestor != -1:
+                descendants.append(position)
+                ancestors.append(ancestor)
+                ancestor = self.parent_positions[ancestor]
+        return (np.array(descendants, dtype=np.int64),
+                np.array(ancestors, dtype=np.int64))
+
+    def rollup(self, state, key='account'):
+        """
+        Roll a grouped state up the account tree
+
+        Args:
+            state (pandas.DataFrame): state with an ``account`` index level
+                (see :meth:`pypfi.aggregates.GroupAccumulator.rollup`)
+            key (str): name of the account index level
+        Returns:
+            pandas.DataFrame: state with each account's subtree totals
+        """
+        descendants, ancestors = self.get_ancestor_pairs()
+        return aggregates.rollup_hierarchy(
+            state, key, self.index, descendants, ancestors)
+
+
+def read_ledger(sources, hierarchy, **read_kwargs):
+    """
+    Read and combine the transactions files of several accounts
+
+    Args:
+        sources (iterable): ``(account_name, path)`` pairs
+        hierarchy (AccountHierarchy): accounts
+        read_kwargs (dict): :func:`pypfi.pypfi.read_transactions_tsv`
+            arguments
+    Returns:
+        pandas.DataFrame: transactions with ``account`` and
+        ``parent_account`` Categorical columns (categories:
+        ``hierarchy.names``) and a unique index
+    """
+    frames, codes = [], []
+    for name, path in sources:
+        if name not in hierarchy:
+            raise KeyError(name)
+        df = _pypfi.read_transactions_tsv(path, **read_kwargs)
+        frames.append(df)
+        codes.append(np.full(len(df), hierarchy.names.index(name),
+                             dtype=np.int64))
+    df = pd.concat(frames, ignore_index=True)
+    codes = np.concatenate(codes)
+    df['account'] = pd.Categorical.from_codes(codes, hierarchy.names)
+    df['parent_account'] = pd.Categorical.from_codes(
+        hierarchy.parent_positions[codes], hierarchy.names)
+    return df
+
+
+@_pypfi.requires_computed_columns(*_pypfi.GROUPBY_KEYS)
+def build_account_reports(df, hierarchy, keys=_pypfi.GROUPBY_KEYS):
+    """
+    Build reports of ``amount`` with ``account`` as a grouping dimension
+
+    One grouped pass over the transactions is rolled up the account tree,
+    so parent accounts include the transactions of their subaccounts.
+
+    Args:
+        df (pandas.DataFrame): transactions (see :func:`read_ledger`)
+        hierarchy (AccountHierarchy): accounts
+        keys (iterable): other grouping keys
+    Returns:
+        pypfi.pypfi.ReportDict: ``accounts`` (parent, depth, count and sum
+        of each account), ``groupby_account_<key>`` (one column per
+        account) and ``pivot_by_account`` reports
+    """
+    output = _pypfi.ReportDict()
+    accumulator = aggregates.aggregate_by_keys(
+        df, ['account'] + list(keys), value='amount')
+
+    totals = hierarchy.rollup(accumulator.rollup(['account']))
+    totals.index = totals.index.get_level_values('account')
+    accounts = pd.DataFrame(collections.OrderedDict((
+        ('parent_account', hierarchy.parents),
+        ('depth', hierarchy.depths))), index=hierarchy.index)
+    accounts['count'] = totals['count'].reindex(hierarchy.index).fillna(0)
+    accounts['sum'] = totals['sum'].reindex(hierarchy.index).fillna(0)
+    output['accounts'] = accounts
+
+    for key in keys:
+        state = hierarchy.rollup(accumulator.rollup(['account', key]))
+        table = state['sum'].unstack('account').reindex(
+            columns=hierarchy.index)
+        name = _pypfi.get_groupby_report_name(key).replace(
+            'groupby_', 'groupby_account_')
+        output[name] = table
+
+    if 'index' not in df.columns:
+        df['index'] = df.index
+    for key, value in _pypfi.build_pivot_report(
+            df, 'account', ['account'])._dict.iteritems():
+        output[key] = value
+    return output
+
+
+def pypfi_ledger(sources, output_file, root=None, debug=False,
+                 output=sys.stdout, date_format=None, tz=None, engine='c',
+                 max_rows=None, compress=None, lazy=False):
+    """
+    Write a consolidated report of the transactions of several accounts
+
+    Args:
+        sources (iterable): ``(account_name, path)`` pairs
+        output_file (str): path to the output HTML file
+        root (pypfi.accounts.Account): account tree (default: the
+            ``sources`` accounts, under an ``All`` account)
+    Returns:
+        int: 0
+    """
+    sources = list(sources)
+    if root is None:
+        root = build_account_tree([name for name, _ in sources])
+    hierarchy = AccountHierarchy(root)
+    df = read_ledger(sources, hierarchy, date_format=date_format, tz=tz,
+                     engine=engine)
+    df = _pypfi.prepare_frame(df, _pypfi.REPORT_BUILDERS)
+
+    report_dict = _pypfi.ReportDict(headingchar='=', headinghtml='h2')
+    report_dict['df'] = df[
+        _pypfi.TRANSACTION_COLUMNS + ['account', 'parent_account']].copy()
+    report_dict['build_groupby_reports'] = _pypfi.build_groupby_reports(
+        df, _output=output)
+    report_dict['build_pivot_reports'] = _pypfi.build_pivot_reports(
+        df, _output=output)
+    report_dict['build_account_reports'] = build_account_reports(
+        df, hierarchy)
+
+    if debug:
+        report_dict.print_str(output=output)
+
+    title = ', '.join('%s=%s' % (name, path) for name, path in sources)
+    _pypfi.write_report(title, output_file, report_dict,
+                        max_rows=max_rows, compress=compress, lazy=lazy)
+    return 0
+
+
+class Test_ledger(unittest.TestCase):
+    def setUp(self):
+        self.INPUT_FILE = os.path.join(os.path.dirname(__file__),
+                                       '..', 'tests', 'testdata.csv')
+        self.BUILDDIR = os.path.join(os.path.dirname(__file__),
+                                     '..', 'build')
+        if not os.path.exists(self.BUILDDIR):
+            os.mkdir(self.BUILDDIR)
+        self.root = Account('All', [
+            Account('assets', [Account('checking'), Account('savings')]),
+            Account('credit')])
+        self.hierarchy = AccountHierarchy(self.root)
+        self.sources = [('checking', self.INPUT_FILE),
+                        ('savings', self.INPUT_FILE),
+                        ('credit', self.INPUT_FILE)]
+
+    def test_010_build_account_tree(self):
+        root = build_account_tree(['checking', 'savings', 'credit'],
+                                  {'checking': 'assets', 'savings': 'assets'})
+        self.assertEqual(AccountHierarchy(root).names,
+                         ['All', 'credit', 'assets', 'checking', 'savings'])
+        self.assertEqual(AccountHierarchy(root).parents,
+                         [None, 'All', 'All', 'assets', 'assets'])
+
+    def test_020_read_ledger(self):
+        df = read_ledger(self.sources, self.hierarchy)
+        self.assertEqual(len(df), 3 * 1436)
+        self.assertTrue(df.index.is_unique)
+        self.assertEqual(list(df['account'].cat.categories),
+                         self.hierarchy.names)
+        self.assertEqual(df['parent_account'].iloc[0], 'assets')
+        self.assertEqual(df['parent_account'].iloc[-1], 'All')
+        self.assertRaises(KeyError, read_ledger,
+                          [('unknown', self.INPUT_FILE)], self.hierarchy)
+
+    def test_030_build_account_reports(self):
+        df = _pypfi.prepare_frame(read_ledger(self.sources, self.hierarchy),
+                                  _pypfi.REPORT_BUILDERS)
+        output = build_account_reports(df, self.hierarchy)
+        accounts = output['accounts']
+        total = df['amount'].sum()
+        self.assertEqual(list(accounts['count']), [4308, 2872, 1436, 1436, 1436])
+        self.assertAlmostEqual(accounts.loc['All', 'sum'], total)
+        self.assertAlmostEqual(accounts.loc['assets', 'sum'], total * 2 / 3)
+        by_year = output['groupby_account_year']
+        self.assertEqual(list(by_year.columns), self.hierarchy.names)
+        expected = df[df['account'] == 'checking'].groupby('year')['amount'].sum()
+        np.testing.assert_allclose(by_year['checking'].values, expected.values)
+        np.testing.assert_allclose(by_year['assets'].values,
+                                   2 * expected.values)
+        self.assertIn('pivot_by_account.sum()', output._dict)
+
+    def test_900_pypfi_ledger(self):
+        output_file = os.path.join(self.BUILDDIR, 'testoutput.ledger.html')
+        output = pypfi_ledger(self.sources, output_file, root=self.root,
+                              output=StringIO.StringIO())
+        self.assertEqual(output, 0)
+        self.assertTrue(os.path.exists(output_file))
+
+
+def main(*args):
+    import logging
+    import optparse
+
+    prs = optparse.OptionParser(
+        usage="%prog -o <report.html> -a <account>=<input.tsv> [...]")
+
+    prs.add_option('-a', '--account',
+                   dest='accounts',
+                   help='An account name and its transactions file: NAME=PATH',
+                   action='append',
+                   default=[])
+    prs.add_option('-p', '--parent',
+                   dest='parents',
+                   help='An account and its parent account: NAME=PARENT',
+                   action='append',
+                   default=[])
+    prs.add_option('-o', '--output-file',
+                   dest='output_file',
+                   default='ledger.html')
+    prs.add_option('--date-format',
+                   dest='date_format',
+                   help='strptime format of the date column',
+                   default=None)
+    prs.add_option('--tz',
+                   dest='tz',
+                   help='Convert dates to this timezone (e.g. US/Central)',
+                   default=None)
+    prs.add_option('--max-rows',
+                   dest='max_rows',
+                   help='Truncate HTML tables to this many rows',
+                   type=int,
+                   default=None)
+    prs.add_option('--lazy',
+                   dest='lazy',
+                   help='Write a lazily loaded HTML report',
+                   action='store_true',)
+
+    prs.add_option('-v', '--verbose',
+                    dest='verbose',
+                    action='store_true',)
+    prs.add_option('-q', '--quiet',
+                    dest='quiet',
+                    action='store_true',)
+    prs.add_option('-t', '--test',
+                    dest='run_tests',
+                    action='store_true',)
+
+    args = args and list(args) or sys.argv[1:]
+    (opts, args) = prs.parse_args(args)
+
+    if not opts.quiet:
+        logging.basicConfig()
+
+        if opts.verbose:
+            logging.getLogger().setLevel(logging.DEBUG)
+
+    if opts.run_tests:
+        sys.argv = [sys.argv[0]] + args
+        exit(unittest.main())
+
+    if not opts.accounts:
+        prs.error('at least one -a NAME=PATH is required')
+    sources = [tuple(x.split('=', 1)) for x in opts.accounts]
+    parents = dict(x.split('=', 1) for x in opts.parents)
+    root = build_account_tree([name for name, _ in sources], parents)
+
+    return pypfi_ledger(sources,
+                        opts.output_file,
+                        root=root,
+                        debug=opts.verbose,
+                        output=sys.stdout if opts.verbose else StringIO.StringIO(),
+                        date_format=opts.date_format,
+                        tz=opts.tz,
+                        max_rows=opts.max_rows,
+                        lazy=opts.lazy)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.pivots
+=============
+
+Long-form pivot tables.
+
+A ``pd.pivot_table(index=['date', 'index'], columns=...)`` of
+transactions has one row per transaction and one column per key value,
+with exactly one non-NA cell per row. :class:`LongPivot` keeps the long
+data (one value and one column code per row) instead; its statistics
+and margins are computed from the long data, and the wide table is only
+rendered (row by row) or built (:meth:`LongPivot.to_frame`) on request.
+
+"""
+import cgi
+import collections
+import unittest
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import aggregates
+except (ImportError, ValueError):  # python ./pypfi/pivots.py
+    import aggregates
+
+
+def add_margins_label(columns, margins_name='All'):
+    """
+    Append the margins label to pivot column labels
+
+    Args:
+        columns (pandas.Index): column labels (Index or MultiIndex)
+        margins_name (str): label of the margins column
+    Returns:
+        pandas.Index: ``columns`` and ``margins_name`` (or
+        ``(margins_name, '', ...)``), as in ``pd.pivot_table``
+    """
+    if isinstance(columns, pd.MultiIndex):
+        return columns.append(pd.MultiIndex.from_tuples(
+            [(margins_name,) + ('',) * (columns.nlevels - 1)],
+            names=columns.names))
+    return columns.append(pd.Index([margins_name], name=columns.name))
+
+
+class LongPivot(object):
+    """
+    A sparse ``index`` x ``columns`` pivot of one value per row
+    """
+
+    def __init__(self, df, columns, values='amount', index=('date', 'index'),
+                 margins=True, margins_name='All', float_format='%.2f'):
+        """
+        Args:
+            df (pandas.DataFrame): long data (one row per pivot row)
+            columns (list): names of the column key columns
+            values (str): name of the value column
+            index (list): names of the row index columns (unique per row)
+            margins (bool): whether to add the ``margins_name`` row/column
+            margins_name (str): label of the margins row and column
+            float_format (str): %-format of values in rendered output
+        """
+        if isinstance(columns, str):
+            columns = [columns]
+        self.column_names = list(columns)
+        self.index_names = list(index)
+        self.values_name = values
+        self.margins = margins
+        self.margins_name = margins_name
+        self.float_format = float_format
+
+        codes_list, levels = [], []
+        for key in self.column_names:
+            codes, level, _ = aggregates.factorize_key(df[key], name=key)
+            codes_list.append(codes)
+            levels.append(level)
+        mask = np.ones(len(df), dtype=bool)
+        for codes in codes_list:
+            mask &= codes != -1
+        group_ids, group_codes = aggregates.combine_codes(
+            [codes[mask] for codes in codes_list],
+            [len(level) for level in levels])
+
+        # columns are sorted by label (as in pd.pivot_table)
+        order = np.lexsort(group_codes[::-1])
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        self.column_codes = rank[group_ids]
+        labels = [level.take(codes[order])
+                  for level, codes in zip(levels, group_codes)]
+        if len(labels) == 1:
+            self.key_columns = pd.Index(labels[0], name=self.column_names[0])
+        else:
+            self.key_columns = pd.MultiIndex.from_arrays(
+                labels, names=self.column_names)
+
+        data = df.loc[mask, self.index_names + [values]]
+        data = data.assign(_column=self.column_codes)
+        self.data = data.sort_values(self.index_names)
+        self._stats_cache = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def columns(self):
+        """
+        Returns:
+            pandas.Index: column labels (with the margins column)
+        """
+        if not self.margins:
+            return self.key_columns
+        return add_margins_label(self.key_columns, self.margins_name)
+
+    def _stats(self, percentiles=aggregates.PERCENTILES):
+        """
+        Args:
+            percentiles (iterable): percentiles (0-1) to compute
+        Returns:
+            pandas.DataFrame: one row per column (and margins) of
+            :func:`pypfi.aggregates.describe_by_group` statistics
+        """
+        percentiles = tuple(percentiles)
+        if percentiles in self._stats_cache:
+            return self._stats_cache[percentiles]
+        values = self.data[self.values_name].values
+        stats = aggregates.describe_by_group(
+            values, self.data['_column'].values, len(self.key_columns),
+            percentiles=percentiles)
+        if self.margins:
+            stats = stats.append(aggregates.describe_by_group(
+                values, np.zeros(len(values), dtype=np.int64), 1,
+                percentiles=percentiles), ignore_index=True)
+        stats.index = self.columns
+        self._stats_cache[percentiles] = stats
+        return stats
+
+    def sum(self):
+        """
+        Returns:
+            pandas.Series: sum of the values in each column
+                (the margins row is not counted)
+        """
+        return self._stats()['sum'].rename(None)
+
+    def describe(self, percentiles=aggregates.PERCENTILES):
+        """
+        Args:
+            percentiles (iterable): percentiles (0-1) to include
+        Returns:
+            pandas.DataFrame: ``count, mean, std, min, 25%, 50%, 75%, max``
+                of the values in each column
+                (the margins row is not counted)
+        """
+        return self._stats(percentiles).drop('sum', axis=1).T
+
+    def to_frame(self):
+        """
+        Build the wide (dense) pivot table
+
+        Returns:
+            pandas.DataFrame: same as ``pd.pivot_table(..., margins=True)``
+        """
+        data = self.data.drop('_column', axis=1)
+        labels = self.key_columns.take(self.data['_column'].values)
+        if isinstance(labels, pd.MultiIndex):
+            for i, name in enumerate(self.column_names):
+                data[name] = labels.get_level_values(i)
+        else:
+            data[self.column_names[0]] = np.asarray(labels)
+        return pd.pivot_table(data,
+                              index=self.index_names,
+                              columns=self.column_names,
+                              values=self.values_name,
+                              aggfunc=np.sum,
+                              margins=self.margins,
+                              margins_name=self.margins_name)
+
+    def _format(self, value):
+        if value is None or value != value:
+            return ''
+        return self.float_format % value
+
+    def iter_rows(self, chunksize=10000, max_rows=None):
+        """
+        Iterate over the rows of the wide table, without building it
+
+        Args:
+            chunksize (int): number of rows to format at a time
+            max_rows (int): maximum number of rows (``None``: all rows)
+        Yields:
+            tuple: ``(index_labels, column_position, formatted_value)``;
+            the margins row is yielded last, with ``column_position``
+            ``None`` and a list of formatted column sums
+        """
+        nrows = len(self.data)
+        if max_rows is not None:
+            nrows = min(nrows, max_rows)
+        for start in range(0, nrows, chunksize):
+            chunk = self.data.iloc[start:min(start + chunksize, nrows)]
+            index_labels = [
+                pd.Index(chunk[name].values).astype(str)
+                for name in self.index_names]
+            positions = chunk['_column'].values
+            formatted = [self._format(v) for v in chunk[self.values_name].values]
+            for i in range(len(chunk)):
+                yield ([labels[i] for labels in index_labels],
+                       positions[i],
+                       formatted[i])
+        if self.margins:
+            yield ([self.margins_name] + [''] * (len(self.index_names) - 1),
+                   None,
+                   [self._format(v) for v in self.sum().values])
+
+    def get_column_header_rows(self):
+        """
+        Returns:
+            list: ``(column_name, [str(label), ...])`` for each level of
+            the column labels
+        """
+        columns = self.columns
+        if isinstance(columns, pd.MultiIndex):
+            return [(name, [str(x) for x in columns.get_level_values(i)])
+                    for i, name in enumerate(self.column_names)]
+        return [(self.column_names[0], [str(x) for x in columns])]
+
+    def to_html_iter(self, classes=None, chunksize=10000, max_rows=None,
+                     **kwargs):
+        """
+        Render the wide table as HTML, one row at a time
+
+        Args:
+            classes (str): CSS classes of the ``<table>``
+            chunksize (int): number of rows to format at a time
+            max_rows (int): maximum number of rows (``None``: all rows)
+        Yields:
+            str: HTML fragments
+        """
+        ncolumns = len(self.key_columns)
+        nindex = len(self.index_names)
+        yield '<table border="1" class="dataframe{0}">'.format(
+            ' ' + classes if classes else '')
+        yield '<thead>'
+        for name, labels in self.get_column_header_rows():
+            # merge repeated labels of the outer levels (as to_html does)
+            merge = name != self.column_names[-1]
+            cells = []
+            for label in labels:
+                if merge and cells and cells[-1][0] == label:
+                    cells[-1][1] += 1
+                else:
+                    cells.append([label, 1])
+            yield '<tr>{0}<th>{1}</th>{2}</tr>'.format(
+                '<th></th>' * (nindex - 1),
+                cgi.escape(str(name)),
+                ''.join(
+                    '<th>{0}</th>'.format(cgi.escape(label)) if span == 1 else
+                    '<th colspan="{1}" halign="left">{0}</th>'.format(
+                        cgi.escape(label), span)
+                    for label, span in cells))
+        yield '<tr>{0}{1}</tr>'.format(
+            ''.join('<th>{0}</th>'.format(cgi.escape(str(name)))
+                    for name in self.index_names),
+            '<th></th>' * len(self.columns))
+        yield '</thead>'
+        yield '<tbody>'
+        empty = ['<td></td>' * n for n in range(ncolumns)]
+        for index_labels, position, value in self.iter_rows(
+                chunksize=chunksize, max_rows=max_rows):
+            row = ''.join('<th>{0}</th>'.format(cgi.escape(label))
+                          for label in index_labels)
+            if position is None:
+                cells = ''.join('<td>{0}</td>'.format(v) for v in value)
+            else:
+                cells = ''.join((
+                    empty[position],
+                    '<td>', value, '</td>',
+                    empty[ncolumns - 1 - position],
+                    '<td>' + value + '</td>' if self.margins else ''))
+            yield '<tr>{0}{1}</tr>'.format(row, cells)
+        yield '</tbody>'
+        yield '</table>'
+
+    def to_html(self, **kwargs):
+        """
+        Returns:
+            str: HTML table (see :meth:`to_html_iter`)
+        """
+        return u'\n'.join(self.to_html_iter(**kwargs))
+
+    def to_str_iter(self, chunksize=10000, max_rows=None, **kwargs):
+        """
+        Render the wide table as fixed-width text, one row at a time
+
+        Yields:
+            str: lines of text
+        """
+        ncolumns = len(self.columns)
+        values = self.data[self.values_name].values
+        width = max([len(self._format(v)) for v in
+                     (np.nanmin(values), np.nanmax(values), values.sum())]
+                    if len(values) else [0])
+        header_rows = self.get_column_header_rows()
+        widths = [max([width] + [len(labels[i]) for _, labels in header_rows])
+                  for i in range(ncolumns)]
+        index_widths = [
+            max([len(str(name))] +
+                [len(str(x)) for x in self.data[name].iloc[[0, -1]]]
+                if len(self.data) else [len(str(name))])
+            for name in self.index_names]
+        prefix = sum(index_widths) + len(index_widths) - 1
+        for name, labels in header_rows:
+            yield '{0} {1}'.format(
+                str(name).ljust(prefix),
+                ' '.join(l.rjust(w) for l, w in zip(labels, widths)))
+        yield ' '.join(str(name).ljust(w)
+                       for name, w in zip(self.index_names, index_widths))
+        for index_labels, position, value in self.iter_rows(
+                chunksize=chunksize, max_rows=max_rows):
+            if position is None:
+                cells = value
+            else:
+                cells = [''] * ncolumns
+                cells[position] = value
+                if self.margins:
+                    cells[-1] = value
+            yield '{0} {1}'.format(
+                ' '.join(l.ljust(w) for l, w in zip(index_labels, index_widths)),
+                ' '.join(c.rjust(w) for c, w in zip(cells, widths)))
+
+    def to_string(self, **kwargs):
+        """
+        Returns:
+            str: fixed-width text table (see :meth:`to_str_iter`)
+        """
+        return u'\n'.join(self.to_str_iter(**kwargs))
+
+
+class Test_pivots(unittest.TestCase):
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        n = 200
+        self.df = pd.DataFrame(collections.OrderedDict((
+            ('date', pd.date_range('2014-12-01', periods=n, freq='7H')),
+            ('year', None),
+            ('month', None),
+            ('amount', np.round(rs.uniform(-100, 100, n), 2)))))
+        self.df['year'] = self.df['date'].dt.year
+        self.df['month'] = self.df['date'].dt.month
+        self.df['index'] = self.df.index
+
+    def wide(self, columns):
+        return pd.pivot_table(self.df, index=['date', 'index'],
+                              columns=columns, values='amount',
+                              aggfunc=np.sum, margins=True)
+
+    def test_010_to_frame(self):
+        for columns in (['year'], ['year', 'month']):
+            pivot = LongPivot(self.df, columns)
+            pd.util.testing.assert_frame_equal(
+                pivot.to_frame(), self.wide(columns))
+            pd.util.testing.assert_index_equal(
+                pivot.columns, self.wide(columns).columns)
+
+    def test_020_describe_sum(self):
+        for columns in (['year'], ['year', 'month']):
+            pivot = LongPivot(self.df, columns)
+            wide = self.wide(columns).iloc[:-1]  # without the margins row
+            pd.util.testing.assert_frame_equal(
+                pivot.describe(), wide.describe())
+            pd.util.testing.assert_series_equal(pivot.sum(), wide.sum())
+
+    def test_030_to_html_iter(self):
+        pivot = LongPivot(self.df, ['year', 'month'])
+        html = pivot.to_html(classes='table')
+        self.assertEqual(html.count('<tr>'), len(self.df) + 1 + 3)
+        self.assertIn('<th>All</th>', html)
+        output = list(pivot.to_html_iter(max_rows=10))
+        self.assertEqual(sum(x.startswith('<tr>') for x in output), 10 + 1 + 3)
+        lines = pivot.to_string().splitlines()
+        self.assertEqual(len(lines), len(self.df) + 1 + 3)
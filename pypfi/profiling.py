@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.profiling
+================
+
+Stage-level timing of the report pipeline.
+
+A :class:`StageProfiler` records the wall time, CPU time, row count and
+peak memory of each stage (``with profiler.stage(name) as record:``).
+The records can be written as a JSON timing report
+(:meth:`StageProfiler.write_json`), reported as a table
+(:meth:`StageProfiler.to_frame`), or passed to a callback as each stage
+ends.
+
+Peak memory is the peak resident set size of the process at the end of
+a stage (``peak_rss_mb``); ``peak_rss_delta_mb`` is how much the stage
+raised it.
+
+"""
+import collections
+import contextlib
+import json
+import os
+import sys
+import time
+import unittest
+
+import pandas as pd
+
+
+def get_peak_rss():
+    """
+    Returns:
+        int: peak resident set size of this process in bytes
+            (None if the ``resource`` module is not available)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def get_cpu_time():
+    """
+    Returns:
+        float: user + system CPU time of this process, in seconds
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+
+def _mb(nbytes):
+    return None if nbytes is None else round(nbytes / 2.0 ** 20, 1)
+
+
+class StageProfiler(object):
+    """
+    Record the wall time, CPU time, rows and peak memory of each stage
+    """
+
+    COLUMNS = ('stage', 'wall_s', 'cpu_s', 'rows', 'peak_rss_mb',
+               'peak_rss_delta_mb')
+
+    def __init__(self, enabled=True, callback=None):
+        """
+        Args:
+            enabled (bool): if False, :meth:`stage` records nothing
+            callback (callable): called with each stage record (a dict)
+                when the stage ends
+        """
+        self.enabled = enabled
+        self.callback = callback
+        self.records = []
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """
+        Time a stage
+
+        Args:
+            name (str): stage name (e.g. ``build_groupby_reports``)
+            rows (int): number of rows processed (or set
+                ``record['rows']`` in the ``with`` block)
+        Yields:
+            collections.OrderedDict: the stage record
+        """
+        record = collections.OrderedDict((
+            ('stage', name),
+            ('wall_s', None),
+            ('cpu_s', None),
+            ('rows', rows),
+            ('peak_rss_mb', None),
+            ('peak_rss_delta_mb', None)))
+        if not self.enabled:
+            yield record
+            return
+        peak_rss = get_peak_rss()
+        cpu = get_cpu_time()
+        start = time.time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = round(time.time() - start, 6)
+            record['cpu_s'] = round(get_cpu_time() - cpu, 6)
+            end_peak_rss = get_peak_rss()
+            record['peak_rss_mb'] = _mb(end_peak_rss)
+            if peak_rss is not None:
+                record['peak_rss_delta_mb'] = _mb(end_peak_rss - peak_rss)
+            self.records.append(record)
+            if self.callback is not None:
+                self.callback(record)
+
+    def to_frame(self):
+        """
+        Returns:
+            pandas.DataFrame: one row per stage, and a ``total`` row
+        """
+        df = pd.DataFrame(self.records, columns=self.COLUMNS)
+        df = df.set_index('stage')
+        if len(df):
+            df.loc['total'] = [df['wall_s'].sum(), df['cpu_s'].sum(), None,
+                               df['peak_rss_mb'].max(),
+                               df['peak_rss_delta_mb'].sum()]
+        return df
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: ``{'stages': [record, ...]}`` (see :meth:`stage`)
+        """
+        return {'stages': self.records}
+
+    def write_json(self, path):
+        """
+        Write the JSON timing report
+
+        Args:
+            path (str): output path
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+class Test_profiling(unittest.TestCase):
+    def test_010_stage(self):
+        records = []
+        profiler = StageProfiler(callback=records.append)
+        with profiler.stage('a', rows=10):
+            sum(range(10000))
+        with profiler.stage('b') as record:
+            record['rows'] = 5
+        self.assertEqual(records, profiler.records)
+        self.assertEqual([r['stage'] for r in records], ['a', 'b'])
+        self.assertEqual([r['rows'] for r in records], [10, 5])
+        self.assertGreaterEqual(records[0]['wall_s'], 0)
+        df = profiler.to_frame()
+        self.assertEqual(list(df.index), ['a', 'b', 'total'])
+        self.assertEqual(json.loads(json.dumps(profiler.to_dict())),
+                         {'stages': records})
+
+    def test_020_disabled(self):
+        profiler = StageProfiler(enabled=False)
+        with profiler.stage('a') as record:
+            record['rows'] = 1
+        self.assertEqual(profiler.records, [])
+        self.assertEqual(len(profiler.to_frame()), 0)
@@ -0,0 +1,802 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.projection
+=================
+
+Project recurring expenses and incomes into dated cashflows, and
+forecast balances.
+
+Each item of an :class:`pypfi.accounts.ExpenseTable` or
+:class:`pypfi.accounts.IncomeTable` recurs from an anchor date (by
+default, the start of the projection):
+
+* ``daily``: every day
+* ``weekly``: every 7 days (the anchor's weekday)
+* ``monthly``: on the anchor's day of the month (or the last day of
+  shorter months)
+* ``yearly``: on the anchor's month and day (Feb 29: Feb 28)
+* ``onetime``: on the anchor date
+
+:func:`expand_schedule` computes the occurrences of all of the items of
+a frequency at once, with ``datetime64`` day and month arithmetic
+(:func:`get_cashflows`: one row per occurrence).
+:func:`project_cashflows` sums the cashflows per day or month without
+expanding the occurrences: each amount is added at its first
+occurrence, and repeated with a strided cumulative sum; so its cost is
+``O(items + accounts * days)``, not ``O(occurrences)``.
+:func:`forecast_balance` appends the projection to a ledger (see
+:func:`pypfi.pypfi.read_transactions_tsv`).
+
+Expense amounts are positive (as in :class:`pypfi.accounts.Expense`) and
+are projected as negative cashflows; income amounts are projected as
+positive cashflows.
+
+Usage::
+
+    python -m pypfi.projection -i transactions.csv --end 2045-01-01 \\
+        -e expenses.csv -n incomes.csv -o forecast.html
+
+(``expenses.csv`` and ``incomes.csv``: see
+:meth:`pypfi.accounts.ExpenseTable.from_csv`; an optional ``start``
+column sets the anchor date of each item.)
+
+"""
+import collections
+import os
+import StringIO
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import pypfi as _pypfi
+    from .accounts import (FREQUENCIES, Expense, ExpenseTable, Income,
+                           IncomeTable)
+except (ImportError, ValueError):  # python ./pypfi/projection.py
+    import pypfi as _pypfi
+    from accounts import (FREQUENCIES, Expense, ExpenseTable, Income,
+                          IncomeTable)
+
+
+PROJECTION_FREQS = ('D', 'M')
+
+# days (daily, weekly) or months (monthly, yearly) between occurrences
+FREQUENCY_STEPS = {
+    'daily': ('D', 1),
+    'weekly': ('D', 7),
+    'monthly': ('M', 1),
+    'yearly': ('M', 12),
+}
+
+
+def to_day(value):
+    """
+    Args:
+        value (str, datetime.date or numpy.datetime64): a date
+    Returns:
+        int: days since 1970-01-01
+    """
+    return int(np.datetime64(pd.Timestamp(value).date(), 'D').astype(np.int64))
+
+
+def to_days(values):
+    """
+    Args:
+        values (array-like): dates (tz-aware dates: their local dates)
+    Returns:
+        numpy.ndarray: days since 1970-01-01 (int64)
+    """
+    dates = _pypfi.get_local_datetimes(pd.Series(values))
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    return dates.values.astype('M8[D]').astype(np.int64)
+
+
+def get_months(days):
+    """
+    Args:
+        days (array-like): days since 1970-01-01
+    Returns:
+        numpy.ndarray: months since 1970-01 (int64)
+    """
+    return np.asarray(days, dtype='M8[D]').astype('M8[M]').astype(np.int64)
+
+
+def get_month_starts(months):
+    """
+    Args:
+        months (array-like): months since 1970-01
+    Returns:
+        numpy.ndarray: day of the first day of each month (int64)
+    """
+    return np.asarray(months, dtype='M8[M]').astype('M8[D]').astype(np.int64)
+
+
+def _ragged_arange(counts):
+    """
+    Args:
+        counts (numpy.ndarray): non-negative ints
+    Returns:
+        numpy.ndarray: ``0..count-1`` for each count, concatenated
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    return (np.arange(counts.sum(), dtype=np.int64) -
+            np.repeat(np.cumsum(counts) - counts, counts))
+
+
+def _expand_steps(anchors, first, end, step):
+    """
+    Returns:
+        tuple: ``(positions, values)``: ``first[i] + k * step`` for each
+        ``i`` and each ``k >= 0`` with a value ``< end``
+    """
+    counts = np.maximum(0, -((first - end) // step))
+    positions = np.repeat(np.arange(len(anchors)), counts)
+    values = first[positions] + _ragged_arange(counts) * step
+    return positions, values
+
+
+def expand_schedule(freq_codes, anchors, start, end):
+    """
+    Compute the dates of each occurrence of recurring items
+
+    Args:
+        freq_codes (array-like): frequency codes
+            (indexes of ``pypfi.accounts.FREQUENCIES``)
+        anchors (array-like): anchor days (days since 1970-01-01)
+        start (int): first day (inclusive)
+        end (int): last day (exclusive)
+    Returns:
+        tuple: ``(positions, days)`` arrays: the item position and the
+        day of each occurrence in ``[start, end)`` (and on or after the
+        item's anchor), by frequency and item
+    """
+    freq_codes = np.asarray(freq_codes)
+    anchors = np.asarray(anchors, dtype=np.int64)
+    positions, days = [], []
+    for code, freq in enumerate(FREQUENCIES):
+        items = np.flatnonzero(freq_codes == code)
+        if not len(items):
+            continue
+        item_anchors = anchors[items]
+        if freq == 'onetime':
+            occurs = (item_anchors >= start) & (item_anchors < end)
+            positions.append(items[occurs])
+            days.append(item_anchors[occurs])
+            continue
+        unit, step = FREQUENCY_STEPS[freq]
+        if unit == 'D':
+            # the first occurrence on or after start
+            first = item_anchors + np.maximum(
+                0, -((item_anchors - start) // step)) * step
+            item_positions, item_days = _expand_steps(
+                item_anchors, first, end, step)
+        else:
+            anchor_months = get_months(item_anchors)
+            anchor_mdays = item_anchors - get_month_starts(anchor_months)
+            start_month = get_months([start])[0]
+            first = anchor_months + np.maximum(
+                0, -((anchor_months - start_month) // step)) * step
+            item_positions, months = _expand_steps(
+                item_anchors, first, get_months([end - 1])[0] + 1, step)
+            month_starts = get_month_starts(months)
+            month_lengths = get_month_starts(months + 1) - month_starts
+            item_days = month_starts + np.minimum(
+                anchor_mdays[item_positions], month_lengths - 1)
+            # the start month's occurrence may be before start
+            occurs = (item_days >= start) & (item_days < end)
+            item_positions, item_days = (
+                item_positions[occurs], item_days[occurs])
+        positions.append(items[item_positions])
+        days.append(item_days)
+    if not positions:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(positions), np.concatenate(days)
+
+
+def get_cashflow_items(expenses=None, incomes=None):
+    """
+    Combine expense and income tables
+
+    Args:
+        expenses (pypfi.accounts.ExpenseTable): expenses (positive
+            amounts are outflows)
+        incomes (pypfi.accounts.IncomeTable): incomes
+    Returns:
+        pandas.DataFrame: ``name``, ``freq`` (Categorical) and signed
+        ``amount`` (NaN: 0) of each expense, then of each income
+    """
+    frames = []
+    for table, sign in ((expenses, -1), (incomes, 1)):
+        if table is None:
+            continue
+        frames.append(pd.DataFrame(collections.OrderedDict((
+            ('name', table['name']),
+            ('freq', table['freq']),
+            ('amount', sign * np.nan_to_num(table['amount']))))))
+    if not frames:
+        return pd.DataFrame(collections.OrderedDict((
+            ('name', np.array([], dtype=object)),
+            ('freq', pd.Categorical([], categories=FREQUENCIES)),
+            ('amount', np.array([], dtype=np.float64)))))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _get_anchors(items, start, anchors):
+    if anchors is None:
+        return np.full(len(items), start, dtype=np.int64)
+    anchors = to_days(anchors)
+    if len(anchors) != len(items):
+        raise ValueError('expected %d anchors, got %d' % (
+            len(items), len(anchors)))
+    return anchors
+
+
+def get_cashflows(start, end, expenses=None, incomes=None, anchors=None):
+    """
+    Expand recurring items into itemized, dated cashflows
+
+    Args:
+        start (str or datetime.date): first day (inclusive)
+        end (str or datetime.date): last day (exclusive)
+        expenses (pypfi.accounts.ExpenseTable): expenses
+        incomes (pypfi.accounts.IncomeTable): incomes
+        anchors (array-like): the anchor date of each expense, then of
+            each income (default: ``start``)
+    Returns:
+        pandas.DataFrame: ``date``, ``name``, ``freq`` and signed
+        ``amount`` of each occurrence, sorted by date
+    """
+    start, end = to_day(start), to_day(end)
+    items = get_cashflow_items(expenses, incomes)
+    anchors = _get_anchors(items, start, anchors)
+    positions, days = expand_schedule(
+        items['freq'].cat.codes.values, anchors, start, end)
+    order = np.argsort(days, kind='mergesort')
+    positions, days = positions[order], days[order]
+    df = items.take(positions).reset_index(drop=True)
+    df.insert(0, 'date', pd.DatetimeIndex(days.astype('M8[D]')))
+    return df
+
+
+def get_period_index(start, end, freq='D'):
+    """
+    Args:
+        start (int): first day (inclusive)
+        end (int): last day (exclusive)
+        freq (str): ``D`` (days) or ``M`` (months)
+    Returns:
+        pandas.DatetimeIndex: the first day of each period
+    """
+    if freq == 'D':
+        days = np.arange(start, end, dtype=np.int64)
+    elif freq == 'M':
+        days = get_month_starts(np.arange(
+            get_months([start])[0], get_months([end - 1])[0] + 1))
+    else:
+        raise KeyError(freq)
+    return pd.DatetimeIndex(days.astype('M8[D]'), name='date')
+
+
+def _add_step_recurrences(output, accounts, first, amounts, step):
+    """
+    Add cashflows which recur every ``step`` periods to ``output``
+
+    Each amount is added at its first period in a difference grid of
+    ``step`` columns; a cumulative sum down the grid's rows repeats it
+    every ``step`` periods.
+
+    Args:
+        output (numpy.ndarray): ``(n_accounts, n_periods)`` cashflows
+        accounts (numpy.ndarray): account code of each item
+        first (numpy.ndarray): first period of each item
+            (``>= n_periods``: none)
+        amounts (numpy.ndarray): amount of each item
+        step (int): periods between occurrences
+    """
+    naccounts, nperiods = output.shape
+    nrows = -(-nperiods // step)
+    occurs = first < nperiods
+    grid = np.bincount(
+        accounts[occurs] * (nrows * step) + first[occurs],
+        weights=amounts[occurs], minlength=naccounts * nrows * step)
+    grid = np.cumsum(grid.reshape(naccounts, nrows, step), axis=1)
+    output += grid.reshape(naccounts, nrows * step)[:, :nperiods]
+
+
+def project_cashflows(start, end, expenses=None, incomes=None,
+                      anchors=None, accounts=None, freq='D'):
+    """
+    Project recurring items into net cashflows per day or month
+
+    The items are not expanded into occurrences: the amounts of each
+    frequency are added to a difference grid at their first occurrence
+    and repeated with a strided cumulative sum (days for daily and
+    weekly items; months and days of the month for monthly and yearly
+    items), so the cost is ``O(items + accounts * days)``.
+
+    Args:
+        start (str or datetime.date): first day (inclusive)
+        end (str or datetime.date): last day (exclusive)
+        expenses (pypfi.accounts.ExpenseTable): expenses
+        incomes (pypfi.accounts.IncomeTable): incomes
+        anchors (array-like): the anchor date of each expense, then of
+            each income (default: ``start``)
+        accounts (array-like): the account of each expense, then of each
+            income
+        freq (str): ``D`` (per day) or ``M`` (per month; the first and
+            last months may be partial)
+    Returns:
+        pandas.Series or pandas.DataFrame: net cashflow of each period
+        (indexed by its first day); one column per account if
+        ``accounts`` is set
+    """
+    if freq not in PROJECTION_FREQS:
+        raise KeyError(freq)
+    start, end = to_day(start), to_day(end)
+    end = max(start, end)
+    items = get_cashflow_items(expenses, incomes)
+    anchors = _get_anchors(items, start, anchors)
+    if accounts is not None:
+        account_codes, account_labels = pd.factorize(
+            np.asarray(accounts, dtype=object), sort=True)
+        if len(account_codes) != len(items):
+            raise ValueError('expected %d accounts, got %d' % (
+                len(items), len(account_codes)))
+    else:
+        account_codes = np.zeros(len(items), dtype=np.int64)
+        account_labels = [None]
+    freq_codes = items['freq'].cat.codes.values
+    amounts = items['amount'].values
+
+    ndays = end - start
+    output = np.zeros((len(account_labels), ndays))
+    start_month = get_months([start])[0]
+    nmonths = get_months([end - 1])[0] + 1 - start_month if ndays else 0
+    month_starts = get_month_starts(start_month + np.arange(nmonths + 1))
+    month_lengths = np.diff(month_starts)
+    for code, item_freq in enumerate(FREQUENCIES):
+        selected = freq_codes == code
+        if not selected.any():
+            continue
+        item_accounts = account_codes[selected]
+        item_anchors = anchors[selected]
+        item_amounts = amounts[selected]
+        if item_freq == 'onetime':
+            occurs = (item_anchors >= start) & (item_anchors < end)
+            output += np.bincount(
+                item_accounts[occurs] * ndays + item_anchors[occurs] - start,
+                weights=item_amounts[occurs],
+                minlength=output.size).reshape(output.shape)
+            continue
+        unit, step = FREQUENCY_STEPS[item_freq]
+        if unit == 'D':
+            first = item_anchors + np.maximum(
+                0, -((item_anchors - start) // step)) * step
+            _add_step_recurrences(output, item_accounts, first - start,
+                                  item_amounts, step)
+            continue
+        # a (month, day of the month) grid per account
+        anchor_months = get_months(item_anchors)
+        mdays = item_anchors - get_month_starts(anchor_months)
+        first = anchor_months + np.maximum(
+            0, -((anchor_months - start_month) // step)) * step
+        first_days = get_month_starts(first) + np.minimum(
+            mdays, get_month_starts(first + 1) - get_month_starts(first) - 1)
+        first = np.where(first_days < start, first + step, first)
+        grid = np.zeros((len(account_labels) * 31, nmonths))
+        _add_step_recurrences(grid, item_accounts * 31 + mdays,
+                              first - start_month, item_amounts, step)
+        grid_days = (month_starts[:-1][None, :] - start + np.minimum(
+            np.arange(31)[:, None], month_lengths[None, :] - 1))
+        valid = (grid_days >= 0) & (grid_days < ndays)
+        grid = grid.reshape(len(account_labels), 31, nmonths)
+        output += np.bincount(
+            (np.arange(len(account_labels))[:, None] * ndays +
+             grid_days[valid][None, :]).ravel(),
+            weights=grid[:, valid].ravel(),
+            minlength=output.size).reshape(output.shape)
+
+    index = get_period_index(start, end, freq) if ndays else pd.DatetimeIndex(
+        [], name='date')
+    if freq == 'M' and ndays:
+        output = np.add.reduceat(
+            output, np.maximum(month_starts[:-1] - start, 0), axis=1)
+    if accounts is None:
+        return pd.Series(output[0], index=index, name='cashflow')
+    return pd.DataFrame(output.T, index=index,
+                        columns=pd.Index(account_labels, name='account'))
+
+
+FORECAST_COLUMNS = ('actual', 'projected', 'net', 'balance', 'forecast')
+
+
+def forecast_balance(df, end, expenses=None, incomes=None, anchors=None,
+                     freq='D'):
+    """
+    Forecast the balance of a ledger
+
+    The projection starts the day after the last transaction, from its
+    balance.
+
+    Args:
+        df (pandas.DataFrame): transactions
+            (see :func:`pypfi.pypfi.read_transactions_tsv`)
+        end (str or datetime.date): last day of the forecast (exclusive)
+        expenses (pypfi.accounts.ExpenseTable): expenses
+        incomes (pypfi.accounts.IncomeTable): incomes
+        anchors (array-like): see :func:`project_cashflows`
+            (default: the day after the last transaction)
+        freq (str): ``D`` (per day) or ``M`` (per month)
+    Returns:
+        pandas.DataFrame: ``FORECAST_COLUMNS`` of each period: the
+        ``actual`` transactions, the ``projected`` cashflows, their sum
+        (``net``), the ``balance`` at the end of the period and whether
+        it is a ``forecast``
+    Raises:
+        ValueError: if ``df`` has no transactions (there is no balance
+            to start the projection from)
+    """
+    if freq not in PROJECTION_FREQS:
+        raise KeyError(freq)
+    if not len(df):
+        raise ValueError('cannot forecast the balance of a ledger '
+                         'without transactions')
+    days = to_days(df['date'])
+    order = np.argsort(days, kind='mergesort')
+    first_day, last_day = days[order[0]], days[order[-1]]
+    start, end = last_day + 1, max(to_day(end), last_day + 1)
+
+    index = get_period_index(first_day, end)
+    actual = np.bincount(days - first_day,
+                         weights=np.nan_to_num(df['amount'].values),
+                         minlength=len(index))
+    # the balance after the last transaction of each day
+    balances = pd.Series(df['balance'].values[order],
+                         index=days[order] - first_day)
+    balance = np.full(len(index), np.nan)
+    balances = balances[~balances.index.duplicated(keep='last')]
+    balance[balances.index.values] = balances.values
+    balance = pd.Series(balance).ffill().values
+
+    projected = np.zeros(len(index))
+    if start < end:
+        projection = project_cashflows(
+            np.datetime64(int(start), 'D'), np.datetime64(int(end), 'D'),
+            expenses=expenses, incomes=incomes, anchors=anchors)
+        projected[start - first_day:] = projection.values
+        balance[start - first_day:] = (
+            balance[start - first_day - 1] + np.cumsum(projection.values))
+
+    output = pd.DataFrame(collections.OrderedDict((
+        ('actual', actual),
+        ('projected', projected),
+        ('net', actual + projected),
+        ('balance', balance),
+        ('forecast', index.values.astype('M8[D]').astype(np.int64) >= start),
+    )), index=index)
+    if freq == 'M':
+        output = output.groupby(output.index.to_period('M')).agg(
+            collections.OrderedDict((
+                ('actual', 'sum'),
+                ('projected', 'sum'),
+                ('net', 'sum'),
+                ('balance', 'last'),
+                ('forecast', 'any'))))
+        output.index = output.index.to_timestamp().rename('date')
+    return output
+
+
+def read_items(path, table_class):
+    """
+    Args:
+        path (str): CSV file (see :meth:`pypfi.accounts.ExpenseTable.from_csv`)
+            with an optional ``start`` column (anchor dates)
+        table_class (type): ``ExpenseTable`` or ``IncomeTable``
+    Returns:
+        tuple: ``(table, anchors)`` (``anchors`` is None if there is no
+        ``start`` column)
+    """
+    df = pd.read_csv(path, dtype={'freq': 'category'})
+    anchors = df['start'].values if 'start' in df.columns else None
+    return table_class.from_frame(df), anchors
+
+
+def pypfi_forecast(input_file, output_file, end, expenses=None,
+                   incomes=None, anchors=None, debug=False,
+                   output=sys.stdout, date_format=None, tz=None,
+                   max_rows=None, compress=None, lazy=False):
+    """
+    Write a balance forecast report of a transactions file
+
+    Args:
+        input_file (str): path to the transactions file
+        output_file (str): path to the output HTML file
+        end (str or datetime.date): last day of the forecast (exclusive)
+        expenses (pypfi.accounts.ExpenseTable): expenses
+        incomes (pypfi.accounts.IncomeTable): incomes
+        anchors (array-like): see :func:`project_cashflows`
+    Returns:
+        int: 0
+    """
+    df = _pypfi.read_transactions_tsv(input_file, date_format=date_format,
+                                      tz=tz)
+    report_dict = _pypfi.ReportDict(headingchar='=', headinghtml='h2')
+    reports = _pypfi.ReportDict()
+    for freq, name in (('M', 'forecast_by_month'), ('D', 'forecast_by_day')):
+        reports[name] = forecast_balance(
+            df, end, expenses=expenses, incomes=incomes, anchors=anchors,
+            freq=freq)
+    report_dict['forecast_balance'] = reports
+
+    if debug:
+        report_dict.print_str(output=output)
+
+    _pypfi.write_report(input_file, output_file, report_dict,
+                        max_rows=max_rows, compress=compress, lazy=lazy)
+    return 0
+
+
+class Test_projection(unittest.TestCase):
+    def setUp(self):
+        self.INPUT_FILE = os.path.join(os.path.dirname(__file__),
+                                       '..', 'tests', 'testdata.csv')
+        self.BUILDDIR = os.path.join(os.path.dirname(__file__),
+                                     '..', 'build')
+        if not os.path.exists(self.BUILDDIR):
+            os.mkdir(self.BUILDDIR)
+        self.expenses = ExpenseTable.from_records([
+            Expense('rent', 'monthly', 1200, 'Landlord'),
+            Expense('coffee', 'daily', 3, 'Cafe'),
+            Expense('insurance', 'yearly', 600, None),
+            Expense('laptop', 'onetime', 1000, 'Shop'),
+            Expense('groceries', 'weekly', 100, None)])
+        self.incomes = IncomeTable.from_records([
+            Income('salary', 'monthly', 3000, 'ACME')])
+
+    def test_010_expand_schedule(self):
+        start, end = to_day('2016-01-01'), to_day('2017-01-01')
+        anchors = [to_day(x) for x in (
+            '2015-12-31', '2016-01-31', '2016-02-29', '2016-01-06',
+            '2016-03-01', '2016-03-02', '2015-03-01')]
+        codes = [FREQUENCIES.index(x) for x in (
+            'monthly', 'monthly', 'yearly', 'weekly', 'onetime', 'daily',
+            'onetime')]
+        positions, days = expand_schedule(codes, anchors, start, end)
+        dates = pd.Series(pd.DatetimeIndex(days.astype('M8[D]'))).groupby(
+            positions).apply(list)
+        fmt = lambda values: [x.strftime('%Y-%m-%d') for x in values]
+        self.assertEqual(fmt(dates[0])[:3],
+                         ['2016-01-31', '2016-02-29', '2016-03-31'])
+        self.assertEqual(fmt(dates[0])[-1], '2016-12-31')
+        self.assertEqual(fmt(dates[1]), fmt(dates[0]))
+        self.assertEqual(fmt(dates[2]), ['2016-02-29'])
+        self.assertEqual(len(dates[3]), 52)
+        self.assertEqual(set(x.weekday() for x in dates[3]), set([2]))
+        self.assertEqual(fmt(dates[4]), ['2016-03-01'])
+        self.assertEqual(len(dates[5]), 366 - 31 - 29 - 1)
+        self.assertNotIn(6, dates.index)
+
+        # next year: Feb 28; an anchor after the horizon: no occurrences
+        positions, days = expand_schedule(
+            codes[2:3] * 2, [anchors[2], to_day('2018-01-01')],
+            to_day('2017-01-01'), to_day('2018-01-01'))
+        self.assertEqual(list(positions), [0])
+        self.assertEqual(fmt(pd.DatetimeIndex(days.astype('M8[D]'))),
+                         ['2017-02-28'])
+
+    def test_020_get_cashflows(self):
+        df = get_cashflows('2016-01-01', '2016-02-01', self.expenses,
+                           self.incomes)
+        self.assertEqual(list(df.columns), ['date', 'name', 'freq', 'amount'])
+        self.assertTrue(df['date'].is_monotonic)
+        counts = df['name'].value_counts()
+        self.assertEqual(counts['coffee'], 31)
+        self.assertEqual(counts['groceries'], 5)
+        self.assertEqual(counts['rent'], 1)
+        self.assertEqual(counts['salary'], 1)
+        self.assertEqual(df['amount'].sum(),
+                         3000 - 1200 - 31 * 3 - 600 - 1000 - 5 * 100)
+
+    def test_030_project_cashflows(self):
+        start, end = '2016-01-01', '2046-01-01'
+        expected = get_cashflows(start, end, self.expenses, self.incomes)
+        daily = project_cashflows(start, end, self.expenses, self.incomes)
+        self.assertEqual(len(daily), 10958)
+        np.testing.assert_allclose(
+            daily.values,
+            expected.groupby('date')['amount'].sum().reindex(
+                daily.index).fillna(0).values)
+        monthly = project_cashflows(start, end, self.expenses, self.incomes,
+                                    freq='M')
+        self.assertEqual(len(monthly), 360)
+        np.testing.assert_allclose(monthly.sum(), daily.sum())
+
+        # the same items in two accounts, anchored on the 15th
+        accounts = ['a'] * 5 + ['b'] + ['b'] * 5 + ['a']
+        expenses = ExpenseTable.from_frame(pd.concat(
+            [self.expenses.to_frame()] * 2, ignore_index=True))
+        incomes = IncomeTable.from_frame(pd.concat(
+            [self.incomes.to_frame()] * 2, ignore_index=True))
+        anchors = ['2016-01-15'] * 12
+        by_account = project_cashflows(
+            start, end, expenses, incomes, anchors=anchors,
+            accounts=accounts, freq='M')
+        self.assertEqual(list(by_account.columns), ['a', 'b'])
+        expected = project_cashflows(start, end, self.expenses, self.incomes,
+                                     anchors=anchors[:6], freq='M')
+        np.testing.assert_allclose(by_account['a'].values, expected.values)
+        np.testing.assert_allclose(by_account['b'].values, expected.values)
+        self.assertEqual(expected.iloc[0], 3000 - 1200 - 17 * 3 - 600 - 1000
+                         - 3 * 100)
+
+    def test_035_project_cashflows_random(self):
+        rs = np.random.RandomState(0)
+        n = 500
+        expenses = ExpenseTable(
+            ['e%d' % i for i in range(n)], rs.choice(FREQUENCIES, n),
+            rs.randint(1, 100, n))
+        anchors = pd.Timestamp('2015-01-01') + pd.to_timedelta(
+            rs.randint(0, 4 * 365, n), 'D')
+        accounts = rs.choice(['a', 'b', 'c'], n)
+        start, end = '2016-02-10', '2020-03-03'
+        output = project_cashflows(start, end, expenses, anchors=anchors,
+                                   accounts=accounts)
+        cashflows = get_cashflows(start, end, expenses, anchors=anchors)
+        cashflows['account'] = accounts[
+            cashflows['name'].str[1:].astype(int).values]
+        expected = cashflows.pivot_table(
+            index='date', columns='account', values='amount',
+            aggfunc='sum').reindex(output.index).fillna(0)
+        np.testing.assert_allclose(output.values, expected.values)
+
+        monthly = project_cashflows(start, end, expenses, anchors=anchors,
+                                    accounts=accounts, freq='M')
+        self.assertEqual(str(monthly.index[0].date()), '2016-02-01')
+        self.assertEqual(str(monthly.index[-1].date()), '2020-03-01')
+        np.testing.assert_allclose(
+            monthly.values,
+            output.groupby(output.index.to_period('M')).sum().values)
+
+    def test_040_forecast_balance(self):
+        df = _pypfi.read_transactions_tsv(self.INPUT_FILE)
+        output = forecast_balance(df, '2016-01-01', self.expenses,
+                                  self.incomes)
+        self.assertEqual(list(output.columns), list(FORECAST_COLUMNS))
+        history = output[~output['forecast']]
+        self.assertEqual(str(history.index[0].date()), '2014-12-18')
+        self.assertEqual(str(history.index[-1].date()), '2015-04-16')
+        self.assertAlmostEqual(history['actual'].sum(), df['amount'].sum())
+        self.assertEqual(history['projected'].sum(), 0)
+        last_balance = df['balance'].iloc[-1]
+        self.assertAlmostEqual(history['balance'].iloc[-1], last_balance)
+        forecast = output[output['forecast']]
+        self.assertEqual(str(forecast.index[0].date()), '2015-04-17')
+        self.assertEqual(str(forecast.index[-1].date()), '2015-12-31')
+        self.assertAlmostEqual(forecast['balance'].iloc[-1],
+                               last_balance + forecast['projected'].sum())
+
+        monthly = forecast_balance(df, '2016-01-01', self.expenses,
+                                   self.incomes, freq='M')
+        self.assertEqual(len(monthly), 13)
+        self.assertAlmostEqual(monthly['net'].sum(), output['net'].sum())
+        self.assertAlmostEqual(monthly['balance'].iloc[-1],
+                               output['balance'].iloc[-1])
+        self.assertEqual(list(monthly['forecast'])[3:5], [False, True])
+
+        self.assertRaises(ValueError, forecast_balance, df[:0],
+                          '2016-01-01', self.expenses, self.incomes)
+
+    def test_900_pypfi_forecast(self):
+        output_file = os.path.join(self.BUILDDIR, 'testoutput.forecast.html')
+        output = pypfi_forecast(self.INPUT_FILE, output_file, '2016-01-01',
+                                expenses=self.expenses, incomes=self.incomes,
+                                output=StringIO.StringIO())
+        self.assertEqual(output, 0)
+        self.assertTrue(os.path.exists(output_file))
+
+
+def main(*args):
+    import logging
+    import optparse
+
+    prs = optparse.OptionParser(
+        usage="%prog -i <input.tsv> --end <YYYY-MM-DD> "
+              "-e <expenses.csv> -n <incomes.csv> -o <forecast.html>")
+
+    prs.add_option('-i', '--input-file',
+                   dest='input_file')
+    prs.add_option('-o', '--output-file',
+                   dest='output_file',
+                   default='forecast.html')
+    prs.add_option('--end',
+                   dest='end',
+                   help='Last day of the forecast (exclusive): YYYY-MM-DD')
+    prs.add_option('-e', '--expenses',
+                   dest='expenses',
+                   help='CSV file: name,freq,amount,payee[,start]')
+    prs.add_option('-n', '--incomes',
+                   dest='incomes',
+                   help='CSV file: name,freq,amount,source[,start]')
+    prs.add_option('--date-format',
+                   dest='date_format',
+                   help='strptime format of the date column',
+                   default=None)
+    prs.add_option('--tz',
+                   dest='tz',
+                   help='Convert dates to this timezone (e.g. US/Central)',
+                   default=None)
+    prs.add_option('--max-rows',
+                   dest='max_rows',
+                   help='Truncate HTML tables to this many rows',
+                   type=int,
+                   default=None)
+    prs.add_option('--lazy',
+                   dest='lazy',
+                   help='Write a lazily loaded HTML report',
+                   action='store_true',)
+
+    prs.add_option('-v', '--verbose',
+                    dest='verbose',
+                    action='store_true',)
+    prs.add_option('-q', '--quiet',
+                    dest='quiet',
+                    action='store_true',)
+    prs.add_option('-t', '--test',
+                    dest='run_tests',
+                    action='store_true',)
+
+    args = args and list(args) or sys.argv[1:]
+    (opts, args) = prs.parse_args(args)
+
+    if not opts.quiet:
+        logging.basicConfig()
+
+        if opts.verbose:
+            logging.getLogger().setLevel(logging.DEBUG)
+
+    if opts.run_tests:
+        sys.argv = [sys.argv[0]] + args
+        exit(unittest.main())
+
+    if not (opts.input_file and opts.end):
+        prs.error('-i <input.tsv> and --end <YYYY-MM-DD> are required')
+
+    expenses, incomes, anchors = None, None, []
+    for path, table_class in ((opts.expenses, ExpenseTable),
+                              (opts.incomes, IncomeTable)):
+        if not path:
+            continue
+        table, table_anchors = read_items(path, table_class)
+        if table_class is ExpenseTable:
+            expenses = table
+        else:
+            incomes = table
+        anchors.append(table_anchors)
+    if all(x is None for x in anchors):
+        anchors = None
+    elif any(x is None for x in anchors):
+        prs.error('set a start column in all or none of -e and -n')
+    else:
+        anchors = np.concatenate(anchors)
+
+    return pypfi_forecast(opts.input_file,
+                          opts.output_file,
+                          opts.end,
+                          expenses=expenses,
+                          incomes=incomes,
+                          anchors=anchors,
+                          debug=opts.verbose,
+                          output=sys.stdout if opts.verbose else StringIO.StringIO(),
+                          date_format=opts.date_format,
+                          tz=opts.tz,
+                          max_rows=opts.max_rows,
+                          lazy=opts.lazy)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
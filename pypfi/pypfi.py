@@ -8,11 +8,30 @@ import calendar
 import cgi
 import codecs
 import collections
+import contextlib
+import functools
 import sys
 import StringIO
 import numpy as np
 import pandas as pd
 
+try:
+    from . import aggregates
+    from . import cache as _cache
+    from . import categorize as _categorize
+    from . import lazyhtml
+    from . import pivots
+    from . import profiling
+    from . import scheduler as _scheduler
+except (ImportError, ValueError):  # python ./pypfi/pypfi.py
+    import aggregates
+    import cache as _cache
+    import categorize as _categorize
+    import lazyhtml
+    import pivots
+    import profiling
+    import scheduler as _scheduler
+
 
 def configure_pandas_print_options():
     pd.set_option('display.max_rows', 500)
@@ -22,6 +41,42 @@ def configure_pandas_print_options():
 configure_pandas_print_options()
 
 
+HTML_TABLE_CLASSES = 'table table-condensed table-hover table-bordered table-striped'
+
+HTML_CHUNKSIZE = 10000
+
+
+def iter_html_table(df, chunksize=HTML_CHUNKSIZE, max_rows=None, **kwargs):
+    """
+    Render a DataFrame as an HTML table, ``chunksize`` rows at a time
+
+    Each chunk is rendered with ``DataFrame.to_html``, so a frame with up
+    to ``chunksize`` rows renders the same as ``df.to_html(**kwargs)``;
+    larger frames are never rendered into one string.
+
+    Args:
+        df (pandas.DataFrame): frame to render
+        chunksize (int): number of rows to render at a time
+        max_rows (int): maximum number of rows (``None``: all rows)
+        kwargs (dict): ``DataFrame.to_html`` arguments
+    Yields:
+        str: HTML fragments
+    """
+    nrows = len(df) if max_rows is None else min(len(df), max_rows)
+    tail = '</tbody>\n</table>'
+    for start in range(0, max(nrows, 1), chunksize):
+        html = df.iloc[start:min(start + chunksize, nrows)].to_html(**kwargs)
+        if '<tbody>' not in html:
+            yield html
+            return
+        head, body = html.split('<tbody>', 1)
+        body, tail = body.rsplit('</tbody>', 1)
+        if start == 0:
+            yield head + '<tbody>'
+        yield body
+    yield '</tbody>' + tail
+
+
 class ReportDict(object):
     def __init__(self, headingchar='-', headinghtml='h3'):
         self.headingchar = headingchar
@@ -38,11 +93,30 @@ class ReportDict(object):
     def __getitem__(self, key):
         return self._dict.__getitem__(key)
 
-    def to_str_iter(self):
+    def walk(self, path=()):
+        """
+        Iterate over the reports, depth-first
+
+        Args:
+            path (tuple): names of the enclosing ReportDicts
+        Yields:
+            tuple: ``(path, headinghtml, value)`` for each report; a
+            nested ReportDict is yielded before its reports
+        """
+        for key, value in self._dict.iteritems():
+            yield path + (key,), self.headinghtml, value
+            if isinstance(value, ReportDict):
+                for item in value.walk(path + (key,)):
+                    yield item
+
+    def to_str_iter(self, **kwargs):
         for key, value in self._dict.iteritems():
             yield key
             yield self.headingchar * len(key)
-            if hasattr(value, 'to_string'):
+            if hasattr(value, 'to_str_iter'):
+                for line in value.to_str_iter(na_rep=''):
+                    yield line
+            elif hasattr(value, 'to_string'):
                 yield value.to_string(na_rep='')
             else:
                 yield str(value)
@@ -55,37 +129,155 @@ class ReportDict(object):
         for line in self.to_str_iter():
             print(line, file=output)
 
-    def to_html_iter(self):
+    def to_html_iter(self, max_rows=None, chunksize=HTML_CHUNKSIZE):
+        """
+        Render the reports as HTML
+
+        Args:
+            max_rows (int): maximum number of rows of each table
+                (``None``: all rows); truncated tables are followed by a
+                ``<p class="truncated">`` marker
+            chunksize (int): number of table rows to render at a time
+        Yields:
+            str: HTML fragments
+        """
         for key, value in self._dict.iteritems():
             yield '<div class="{0}">'.format(cgi.escape(key))
             yield '<{0}>{1}</{0}>'.format(self.headinghtml, cgi.escape(key))
             if isinstance(value, ReportDict):
-                for line in value.to_html_iter():
+                for line in value.to_html_iter(max_rows=max_rows,
+                                               chunksize=chunksize):
                     yield line
             else:
-                if hasattr(value, 'to_html'):
+                if hasattr(value, 'to_html_iter'):
+                    lines = value.to_html_iter(na_rep='', classes=HTML_TABLE_CLASSES, max_rows=max_rows, chunksize=chunksize)
+                elif isinstance(value, pd.DataFrame):
+                    lines = iter_html_table(value, na_rep='', classes=HTML_TABLE_CLASSES, max_rows=max_rows, chunksize=chunksize)
+                elif hasattr(value, 'to_html'):
+                    lines = [value.to_html(na_rep='', classes=HTML_TABLE_CLASSES)]
+                else:
+                    lines = None
+                if lines is not None:
                     yield '<div class="table-responsive">'
-                    yield value.to_html(na_rep='', classes='table table-condensed table-hover table-bordered table-striped')
+                    for line in lines:
+                        yield line
                     yield '</div>'
+                    if max_rows is not None and len(value) > max_rows:
+                        yield ('<p class="truncated text-muted">'
+                               'Showing {0} of {1} rows (truncated)</p>'
+                               .format(max_rows, len(value)))
                 else:
                     yield '<pre class="pandas_str">\n{}\n</pre>'.format(cgi.escape(value))
             yield '</div>'
 
-    def print_html(self, output=sys.stdout):
-        for line in self.to_html_iter():
+    def print_html(self, output=sys.stdout, max_rows=None,
+                   chunksize=HTML_CHUNKSIZE):
+        for line in self.to_html_iter(max_rows=max_rows, chunksize=chunksize):
             print(line, file=output)
 
 
 
-def read_transactions_tsv(path):
-    df = pd.read_csv(path,
-                    #index_col=0,
-                    parse_dates=['date'],
-                    names=['date', 'desc', 'amount', 'balance'],
-                    thousands=',')
+TRANSACTION_COLUMNS = ['date', 'desc', 'amount', 'balance']
+
+CSV_ENGINES = ('c', 'python')
+
+
+def parse_transaction_dates(values, date_format=None, tz=None):
+    """
+    Parse a column of date strings
+
+    Args:
+        values (pandas.Series): date strings
+        date_format (str): ``strftime`` format of the dates
+            (``None``: ISO 8601, with the fast ISO parser)
+        tz (str): if not None, convert the dates to this timezone
+            (e.g. ``America/Chicago``); dates with varying UTC offsets
+            (e.g. across a DST change) are then a tz-aware datetime64
+            column instead of an object column of ``datetime.datetime``
+    Returns:
+        pandas.Series: parsed dates
+    """
+    if tz is not None:
+        return pd.to_datetime(values, format=date_format,
+                              utc=True).dt.tz_convert(tz)
+    # pd.to_datetime falls back to parsing each string with dateutil when
+    # the UTC offsets vary, so parse the dates for each offset separately
+    offsets = values.str.extract(r'([+-]\d\d:?\d\d|Z)$', expand=False)
+    codes, uniques = pd.factorize(offsets)
+    if len(uniques) <= 1:
+        return pd.to_datetime(values, format=date_format)
+    output = np.empty(len(values), dtype=object)
+    for code in range(-1, len(uniques)):
+        mask = codes == code
+        if mask.any():
+            output[mask] = pd.to_datetime(
+                values[mask], format=date_format).astype(object).values
+    return pd.Series(output, index=values.index, name=values.name)
+
+
+def convert_transactions(df, date_format=None, tz=None, cents=False):
+    """
+    Convert the columns of a transactions frame read with string dates
+
+    Args:
+        df (pandas.DataFrame): transactions (as read by
+            :func:`read_transactions_tsv`)
+        date_format (str): see :func:`parse_transaction_dates`
+        tz (str): see :func:`parse_transaction_dates`
+        cents (bool): convert ``amount`` and ``balance`` to int64 cents
+    Returns:
+        pandas.DataFrame: ``df`` (modified in place)
+    """
+    df['date'] = parse_transaction_dates(
+        df['date'], date_format=date_format, tz=tz)
+    if cents:
+        for colname in ('amount', 'balance'):
+            df[colname] = np.round(df[colname].values * 100).astype(np.int64)
     return df
 
 
+def read_transactions_tsv(path, chunksize=None, date_format=None, tz=None,
+                          cents=False, desc_dtype=object, engine='c'):
+    """
+    Read a ``date,desc,amount,balance`` transactions file
+
+    The column dtypes are declared (``amount`` and ``balance`` are
+    float64) instead of inferred, and dates are parsed after reading
+    (see :func:`parse_transaction_dates`).
+
+    Args:
+        path (str): path to the transactions file
+        chunksize (int): if not None, return an iterator of DataFrames
+            of ``chunksize`` rows (see :func:`build_streaming_reports`)
+        date_format (str): see :func:`parse_transaction_dates`
+        tz (str): see :func:`parse_transaction_dates`
+        cents (bool): read ``amount`` and ``balance`` as int64 cents
+        desc_dtype (str): dtype of ``desc`` (``object`` or ``category``)
+        engine (str): ``pd.read_csv`` engine (see :data:`CSV_ENGINES`)
+    Returns:
+        pandas.DataFrame: transactions
+    """
+    kwargs = dict(
+        #index_col=0,
+        names=TRANSACTION_COLUMNS,
+        dtype={'date': object,
+               'desc': desc_dtype,
+               'amount': np.float64,
+               'balance': np.float64},
+        thousands=',',
+        engine=engine,
+        chunksize=chunksize)
+    df = pd.read_csv(path, **kwargs)
+    convert = functools.partial(
+        convert_transactions, date_format=date_format, tz=tz, cents=cents)
+    if chunksize:
+        return (convert(chunk) for chunk in df)
+    return convert(df)
+
+
+get_peak_rss = profiling.get_peak_rss
+
+
 DAY_ABBRS = dict(enumerate(calendar.day_abbr))
 
 
@@ -99,18 +291,162 @@ def get_weekday_name(n):
     return "%d-%s" % (n, DAY_ABBRS.get(n))
 
 
-def add_computed_columns(df, colname='date'):
+COMPUTED_COLUMNS = (
+    'year',
+    'yearmonth',
+    'month',
+    'weekday',
+    'weekday_abbr',
+    'hour',
+)
+
+
+def get_local_datetimes(values):
+    """
+    Convert a column of dates to a DatetimeIndex of local (wall clock) times
+
+    Args:
+        values (pandas.Series): datetime64 (naive or tz-aware) or object
+            column of ``datetime.datetime`` instances
+    Returns:
+        pandas.DatetimeIndex: index whose ``.year``, ``.hour`` (etc.)
+        attributes are the local wall clock fields of ``values``
+
+    .. note:: ``read_csv(parse_dates=...)`` returns an object column of
+       tz-aware datetimes when the UTC offsets vary (e.g. across a DST
+       change); for those, the tzinfo is dropped in a single pass.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        try:
+            values = pd.to_datetime(values)
+        except ValueError:
+            # mixed UTC offsets
+            values = pd.to_datetime(
+                [x.replace(tzinfo=None) for x in values])
+    return pd.DatetimeIndex(values)
+
+
+def to_int_categorical(values, labeler):
+    """
+    Build a Categorical from integer codes, labeling only observed values
+
+    Args:
+        values (array-like): integer values (e.g. ``year * 12 + month``)
+        labeler (callable): function from an integer value to a str label
+    Returns:
+        pandas.Categorical: sorted categories, one per unique value
+    """
+    codes, uniques = pd.factorize(values, sort=True)
+    return pd.Categorical.from_codes(
+        codes, [labeler(x) for x in uniques])
+
+
+def get_yearmonth_label(n):
+    """
+    Args:
+        n (int): ``year * 12 + (month - 1)``
+    Returns:
+        str: naturally-sortable string: ``2014-01``
+    """
+    return "%d-%02d" % (n // 12, n % 12 + 1)
+
+
+def add_computed_columns(df, colname='date', columns=COMPUTED_COLUMNS):
     """
     Add computed columns to a dataframe for date-based calculations
 
+    The requested columns are computed from one DatetimeIndex with
+    vectorized field accessors;
+    ``yearmonth`` and ``weekday_abbr`` are Categoricals.
+
     Args:
         df (pandas.DataFrame): DataFrame to augment
+        colname (str): name of the date column
+        columns (iterable): names of the ``COMPUTED_COLUMNS`` to add
     Returns:
         df (pandas.DataFrame): dataframe with columns added
 
     .. note:: This method modifies the ``df`` argument
        (does not do ``df.copy()`` before adding computed columns)
 
+    """
+    columns = [c for c in COMPUTED_COLUMNS if c in columns]
+    if not columns:
+        return df
+    dates = get_local_datetimes(df[colname])
+    for column in columns:
+        if column == 'year':
+            df['year'] = np.asarray(dates.year)
+        elif column == 'yearmonth':
+            df['yearmonth'] = to_int_categorical(
+                np.asarray(dates.year) * 12 + (np.asarray(dates.month) - 1),
+                get_yearmonth_label)
+        elif column == 'month':
+            df['month'] = np.asarray(dates.month)
+        elif column == 'weekday':
+            df['weekday'] = np.asarray(dates.weekday)
+        elif column == 'weekday_abbr':
+            df['weekday_abbr'] = to_int_categorical(
+                np.asarray(dates.weekday), get_weekday_name)
+        elif column == 'hour':
+            df['hour'] = np.asarray(dates.hour)
+    return df
+
+
+def prepare_frame(df, builders=None, columns=None, colname='date'):
+    """
+    Add the computed columns needed by report builders, once
+
+    Args:
+        df (pandas.DataFrame): DataFrame to augment
+        builders (iterable): report builder functions with a
+            ``computed_columns`` attribute
+            (see :func:`requires_computed_columns`)
+        columns (iterable): additional computed column names
+        colname (str): name of the date column
+    Returns:
+        df (pandas.DataFrame): dataframe with the missing columns added
+
+    .. note:: This method modifies the ``df`` argument
+       (does not do ``df.copy()`` before adding computed columns)
+    """
+    required = set(columns or ())
+    for builder in (builders or ()):
+        required.update(getattr(builder, 'computed_columns', ()))
+    missing = [c for c in COMPUTED_COLUMNS
+               if c in required and c not in df.columns]
+    return add_computed_columns(df, colname=colname, columns=missing)
+
+
+def requires_computed_columns(*columns):
+    """
+    Declare the computed columns that a report builder reads
+
+    The decorated builder adds any of ``columns`` which are not already
+    in its ``df`` argument; so a frame passed through
+    :func:`prepare_frame` is not recomputed.
+
+    Args:
+        columns (str): names of ``COMPUTED_COLUMNS``
+    Returns:
+        callable: decorator which sets ``func.computed_columns``
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(df, *args, **kwargs):
+            df = prepare_frame(df, columns=columns)
+            return func(df, *args, **kwargs)
+        wrapper.computed_columns = columns
+        return wrapper
+    return decorator
+
+
+def _add_computed_columns_apply(df, colname='date'):
+    """
+    Add computed columns with a per-row ``Series.apply`` for each column
+
+    This is the previous implementation of :func:`add_computed_columns`;
+    it is kept as a reference for tests and benchmarks.
     """
     df['year'] = df[colname].apply(lambda x: x.year)
     df['yearmonth'] = df[colname].apply(lambda x: "%d-%02d" % (x.year, x.month))
@@ -121,103 +457,350 @@ def add_computed_columns(df, colname='date'):
     return df
 
 
-def build_groupby_reports(df, _output=sys.stdout):
+GROUPBY_KEYS = (
+    'year',
+    'yearmonth',
+    'month',
+    'weekday_abbr',
+    'hour',
+)
+
+# columns added by other stages (e.g. ``category``, see
+# :func:`pypfi.categorize.add_category_column`): reported as groupby keys
+# and pivot columns if the frame has them
+OPTIONAL_KEYS = (
+    'category',
+)
+
+
+def get_groupby_keys(df):
+    """
+    Args:
+        df (pandas.DataFrame or iterable): transactions (or column names)
+    Returns:
+        tuple: GROUPBY_KEYS and the OPTIONAL_KEYS of ``df``
+    """
+    columns = getattr(df, 'columns', df)
+    return GROUPBY_KEYS + tuple(k for k in OPTIONAL_KEYS if k in columns)
+
+
+@requires_computed_columns(*GROUPBY_KEYS)
+def build_groupby_reports(df, _output=sys.stdout, aggfuncs=('sum',)):
+    """
+    Build ``groupby_<key>`` reports of ``amount`` for each of GROUPBY_KEYS
+    (and OPTIONAL_KEYS, see :func:`get_groupby_keys`)
+
+    All of the keys are aggregated in one pass
+    (see :func:`pypfi.aggregates.aggregate_by_keys`).
+
+    Args:
+        df (pandas.DataFrame): transactions
+        aggfuncs (iterable): ``pypfi.aggregates.AGGFUNCS`` to report;
+            reports other than ``sum`` are named
+            ``groupby_<key>.<aggfunc>()``
+    Returns:
+        ReportDict: ``groupby_year``, ``groupby_yearmonth``, ...
+    """
     output = ReportDict()
 
-    df = add_computed_columns(df)
     # output['df'] = df
 
-    by_year = df.groupby(df['year'], as_index=True)['amount'].sum()
-    output['groupby_year'] = by_year
+    keys = get_groupby_keys(df)
+    accumulator = aggregates.aggregate_by_keys(
+        df, keys, value='amount', aggfuncs=aggfuncs)
+    for key in keys:
+        for aggfunc in aggfuncs:
+            output[get_groupby_report_name(key, aggfunc)] = (
+                accumulator.aggregate(key, aggfunc))
+
+    return output
+
+
+def get_groupby_report_name(key, aggfunc='sum'):
+    """
+    Args:
+        key (str): one of GROUPBY_KEYS (or OPTIONAL_KEYS)
+        aggfunc (str): one of ``pypfi.aggregates.AGGFUNCS``
+    Returns:
+        str: ``groupby_weekday``, ``groupby_hour.count()``
+    """
+    name = 'groupby_%s' % key.replace('_abbr', '')
+    if aggfunc != 'sum':
+        name = '%s.%s()' % (name, aggfunc)
+    return name
+
 
-    by_yearmonth = df.groupby(df['yearmonth'], as_index=True)['amount'].sum()
-    output['groupby_yearmonth'] = by_yearmonth
+PIVOT_COLUMNS = (
+    ('year', ['year']),
+    ('yearmonth', ['year', 'month']),
+    ('weekday', ['weekday_abbr']),
+    ('hour', ['hour']),
+)
 
-    by_month = df.groupby(df['month'], as_index=True)['amount'].sum()
-    output['groupby_month'] = by_month
 
-    by_weekday = df.groupby(df['weekday_abbr'], as_index=True)['amount'].sum()
-    output['groupby_weekday'] = by_weekday
+def get_pivot_columns(df):
+    """
+    Args:
+        df (pandas.DataFrame or iterable): transactions (or column names)
+    Returns:
+        tuple: PIVOT_COLUMNS and a pivot for each OPTIONAL_KEYS of ``df``
+    """
+    columns = getattr(df, 'columns', df)
+    return PIVOT_COLUMNS + tuple(
+        (k, [k]) for k in OPTIONAL_KEYS if k in columns)
 
-    by_hour = df.groupby(df['hour'], as_index=True)['amount'].sum()
-    output['groupby_hour'] = by_hour
 
-    return output
+@requires_computed_columns('year', 'month', 'weekday_abbr', 'hour')
+def build_pivot_reports(df, _output=sys.stdout, wide=False, profiler=None):
+    """
+    Build ``pivot_by_<name>`` reports of ``amount`` for each of PIVOT_COLUMNS
+    (and OPTIONAL_KEYS, see :func:`get_pivot_columns`)
 
+    Each pivot is a :class:`pypfi.pivots.LongPivot` (one row per
+    transaction, rendered row by row);
+    ``.describe()`` and ``.sum()`` are computed from the long data.
 
-def build_pivot_reports(df, _output=sys.stdout):
+    Args:
+        df (pandas.DataFrame): transactions
+        wide (bool): if True, report the wide ``pd.pivot_table`` frames
+            (``LongPivot.to_frame()``) instead of the LongPivots
+        profiler (pypfi.profiling.StageProfiler): if set, time each pivot
+            (see :func:`build_pivot_report`)
+    Returns:
+        ReportDict: ``pivot_by_year``, ``pivot_by_year.describe()``, ...
+    """
     output = ReportDict()
 
-    df = add_computed_columns(df)
     # create a unique index
     #df['index'] = df['date'].apply(str) + ',' + df.index.astype('str')
 
     df['index'] = df.index
     # output['df-'] = df  # see: footer
 
+    for name, columns in get_pivot_columns(df):
+        for key, value in build_pivot_report(
+                df, name, columns, wide=wide,
+                profiler=profiler)._dict.iteritems():
+            output[key] = value
 
-    df_year = pd.pivot_table(df,
-                             index=['date', 'index'],
-                             columns='year',
-                             values='amount',
-                             aggfunc=np.sum,
-                             margins=True)
-    output['pivot_by_year'] = df_year
+    output['df-'] = df
 
-    df_year_describe = df_year.describe()
-    output['pivot_by_year.describe()'] = df_year_describe
+    return output
 
-    df_year_sum = df_year.sum()
-    output['pivot_by_year.sum()'] = df_year_sum
 
+def build_pivot_report(df, name, columns, wide=False, profiler=None):
+    """
+    Build the ``pivot_by_<name>`` reports for one of PIVOT_COLUMNS
 
-    df_yearmonth = pd.pivot_table(df,
-                                  index=['date', 'index'],
-                                  columns=['year','month'],
-                                  values='amount',
-                                  aggfunc=np.sum,
-                                  margins=True)
-    output['pivot_by_yearmonth'] = df_yearmonth
+    Args:
+        df (pandas.DataFrame): transactions with ``index`` and ``columns``
+        name (str): pivot name
+        columns (list): column names to pivot on
+        wide (bool): see :func:`build_pivot_reports`
+        profiler (pypfi.profiling.StageProfiler): if set, time the
+            ``pivot_by_<name>``, ``.describe()`` and ``.sum()`` stages
+    Returns:
+        ReportDict: ``pivot_by_<name>``, ``pivot_by_<name>.describe()``,
+        ``pivot_by_<name>.sum()``
+    """
+    profiler = profiler or profiling.StageProfiler(enabled=False)
+    output = ReportDict()
+    key = 'pivot_by_%s' % name
+    with profiler.stage(key, rows=len(df)):
+        pivot = pivots.LongPivot(df,
+                                 index=['date', 'index'],
+                                 columns=columns,
+                                 values='amount',
+                                 margins=True)
+        output[key] = pivot.to_frame() if wide else pivot
+    with profiler.stage(key + '.describe()', rows=len(df)):
+        output[key + '.describe()'] = pivot.describe()
+    with profiler.stage(key + '.sum()', rows=len(df)):
+        output[key + '.sum()'] = pivot.sum()
+    return output
 
-    df_yearmonth_describe = df_yearmonth.describe()
-    output['pivot_by_yearmonth.describe()'] = df_yearmonth_describe
 
-    df_yearmonth_sum = df_yearmonth.sum()
-    output['pivot_by_yearmonth.sum()'] = df_yearmonth_sum
+REPORT_BUILDERS = (
+    build_groupby_reports,
+    build_pivot_reports,
+)
 
 
-    df_weekday = pd.pivot_table(df,
-                                index=['date', 'index'],
-                                columns='weekday_abbr',
-                                values='amount',
-                                aggfunc=np.sum,
-                                margins=True)
-    output['pivot_by_weekday'] = df_weekday
+def get_report_tasks(wide=False, columns=()):
+    """
+    Split REPORT_BUILDERS into independent tasks
 
-    by_weekday_describe = df_weekday.describe()
-    output['pivot_by_weekday.describe()'] = by_weekday_describe
+    Args:
+        wide (bool): see :func:`build_pivot_reports`
+        columns (iterable): column names of the frame
+            (its OPTIONAL_KEYS are reported too)
+    Returns:
+        list: :class:`pypfi.scheduler.ReportTask` s: one for the groupby
+        reports, and one for each of PIVOT_COLUMNS
+    """
+    columns = list(columns)
+    tasks = [_scheduler.ReportTask(
+        'build_groupby_reports', build_groupby_reports,
+        list(get_groupby_keys(columns)) + ['amount'], {})]
+    for name, columns in get_pivot_columns(columns):
+        tasks.append(_scheduler.ReportTask(
+            'build_pivot_reports', build_pivot_report,
+            ['date', 'index', 'amount'] + columns,
+            dict(name=name, columns=columns, wide=wide)))
+    return tasks
+
+
+def build_reports_parallel(df, scheduler, wide=False):
+    """
+    Build the REPORT_BUILDERS reports with a report scheduler
 
-    by_weekday_sum = df_weekday.sum()
-    output['pivot_by_weekday.sum()'] = by_weekday_sum
+    The reports are the same (and in the same order) as those of
+    :func:`build_groupby_reports` and :func:`build_pivot_reports`.
 
+    Args:
+        df (pandas.DataFrame): prepared transactions
+            (see :func:`prepare_frame`)
+        scheduler (pypfi.scheduler.ReportScheduler): task scheduler
+        wide (bool): see :func:`build_pivot_reports`
+    Returns:
+        ReportDict: ``build_groupby_reports``, ``build_pivot_reports``
+    """
+    df = prepare_frame(df, REPORT_BUILDERS)
+    df['index'] = df.index
+    results = scheduler.run(
+        df, get_report_tasks(wide=wide, columns=df.columns))
+    output = ReportDict()
+    for group, reports in results.items():
+        output[group] = ReportDict()
+        for report in reports:
+            for key, value in report._dict.iteritems():
+                output[group][key] = value
+    output['build_pivot_reports']['df-'] = df
+    return output
 
-    df_hour = pd.pivot_table(df,
-                             index=['date', 'index'],
-                             columns='hour',
-                             values='amount',
-                             aggfunc=np.sum,
-                             margins=True)
-    output['pivot_by_hour'] = df_hour
 
-    df_hour_describe = df_hour.describe()
-    output['pivot_by_hour.describe()'] = df_hour_describe
+class StreamingReports(object):
+    """
+    Accumulate the streaming reports, one chunk of rows at a time
 
-    df_hour_sum = df_hour.sum()
-    output['pivot_by_hour.sum()'] = df_hour_sum
+    The state (:class:`pypfi.aggregates.GroupAccumulator` instances and
+    row counts) is small and picklable, so it can be persisted and
+    updated later (see :mod:`pypfi.incremental`).
+    """
 
-    output['df-'] = df
+    def __init__(self, aggfuncs=('sum',), categorizer=None):
+        """
+        Args:
+            aggfuncs (iterable): ``pypfi.aggregates.AGGFUNCS`` to report
+                for each of GROUPBY_KEYS (see
+                :func:`get_groupby_report_name`)
+            categorizer (pypfi.categorize.Categorizer): if set, add a
+                ``category`` column to each chunk, and report it
+        """
+        self.aggfuncs = tuple(aggfuncs)
+        self.categorizer = categorizer
+        columns = ['category'] if categorizer is not None else []
+        self.keys = get_groupby_keys(columns)
+        self.groupby = aggregates.GroupAccumulator(
+            self.keys, value='amount', aggfuncs=self.aggfuncs)
+        self.pivot_stats = collections.OrderedDict(
+            (name, aggregates.GroupAccumulator(
+                columns, value='amount', percentiles=aggregates.PERCENTILES))
+            for name, columns in get_pivot_columns(columns))
+        self.nrows = 0
+        self.nchunks = 0
+
+    def update(self, chunk):
+        """
+        Fold a chunk of transactions into the accumulated state
+
+        Args:
+            chunk (pandas.DataFrame): transactions
+        Returns:
+            StreamingReports: self
+        """
+        chunk = prepare_frame(chunk, REPORT_BUILDERS)
+        if self.categorizer is not None:
+            chunk = _categorize.add_category_column(chunk, self.categorizer)
+        self.groupby.update(chunk)
+        for accumulator in self.pivot_stats.values():
+            accumulator.update(chunk)
+        self.nrows += len(chunk)
+        self.nchunks += 1
+        return self
+
+    def to_report_dict(self):
+        """
+        Returns:
+            ReportDict: ``build_groupby_reports``, ``build_pivot_reports``
+            and ``ingest`` (rows, chunks, peak RSS) reports (empty, if no
+            rows were accumulated)
+        """
+        output = ReportDict()
+
+        groupby_reports = ReportDict()
+        for key in self.keys:
+            for aggfunc in self.aggfuncs:
+                if self.groupby.state is None:
+                    report = pd.Series([], index=pd.Index([], name=key),
+                                       name='amount', dtype=np.float64)
+                else:
+                    report = self.groupby.aggregate(key, aggfunc)
+                groupby_reports[get_groupby_report_name(key, aggfunc)] = (
+                    report)
+        output['build_groupby_reports'] = groupby_reports
+
+        pivot_reports = ReportDict()
+        for name, accumulator in self.pivot_stats.items():
+            if accumulator.state is None:
+                pivot_reports['pivot_by_%s.describe()' % name] = (
+                    pd.DataFrame())
+                pivot_reports['pivot_by_%s.sum()' % name] = pd.Series(
+                    [], dtype=np.float64)
+                continue
+            stats = accumulator.describe_groups(margins_name='All')
+            if stats.index.nlevels == 1:
+                stats.index = stats.index.get_level_values(0)
+            pivot_reports['pivot_by_%s.describe()' % name] = (
+                stats.drop('sum', axis=1).T)
+            pivot_reports['pivot_by_%s.sum()' % name] = (
+                stats['sum'].rename(None))
+        output['build_pivot_reports'] = pivot_reports
+
+        output['ingest'] = pd.Series(collections.OrderedDict((
+            ('rows', self.nrows),
+            ('chunks', self.nchunks),
+            ('peak_rss_mb',
+             round((get_peak_rss() or np.nan) / 2.0 ** 20, 1)))),
+            dtype=object)
+        return output
+
+
+def build_streaming_reports(chunks, _output=sys.stdout, categorizer=None):
+    """
+    Build the groupby and pivot statistics reports from chunks of rows
 
-    return output
+    Each chunk is folded into :class:`pypfi.aggregates.GroupAccumulator`
+    instances and then released, so memory use is bounded by the chunk
+    size (and the number of groups), not by the number of transactions.
+    The per-transaction pivot tables and ``df`` dumps are not reported;
+    pivot percentiles are exact up to 2000 values per column and
+    approximate (TDigest) above.
+
+    Args:
+        chunks (iterable): DataFrames of transactions
+            (e.g. ``read_transactions_tsv(path, chunksize=100000)``)
+        categorizer (pypfi.categorize.Categorizer): if set, report a
+            ``category`` dimension (descriptions are matched once, and
+            cached across chunks)
+    Returns:
+        ReportDict: ``build_groupby_reports``, ``build_pivot_reports``
+        and ``ingest`` (rows, chunks, peak RSS) reports
+    """
+    reports = StreamingReports(categorizer=categorizer)
+    for chunk in chunks:
+        reports.update(chunk)
+    return reports.to_report_dict()
 
 
 HTML_HEADER="""
@@ -284,8 +867,40 @@ a.headerlink {
 """
 
 
-def write_html_report(input_file, output_file, report_dict):
-    with codecs.open(output_file, 'w', encoding='utf8') as f:
+def open_html_report(output_file, compress=None):
+    """
+    Open a (utf8) HTML report file for writing
+
+    Args:
+        output_file (str): path to the output file
+        compress (bool): gzip the output
+            (``None``: if ``output_file`` ends with ``.gz``)
+    Returns:
+        file-like: writable file
+    """
+    if compress is None:
+        compress = output_file.endswith('.gz')
+    if compress:
+        import gzip
+        return codecs.getwriter('utf8')(gzip.open(output_file, 'wb'))
+    return codecs.open(output_file, 'w', encoding='utf8')
+
+
+def write_html_report(input_file, output_file, report_dict, max_rows=None,
+                      compress=None, chunksize=HTML_CHUNKSIZE):
+    """
+    Write an HTML report, one table chunk at a time
+
+    Args:
+        input_file (str): path to the transactions file (title)
+        output_file (str): path to the output file
+        report_dict (ReportDict): reports to write
+        max_rows (int): maximum number of rows of each table
+        compress (bool): gzip the output
+            (``None``: if ``output_file`` ends with ``.gz``)
+        chunksize (int): number of table rows to render at a time
+    """
+    with contextlib.closing(open_html_report(output_file, compress)) as f:
         f.write('<html><head>')
         f.write('<title>{0}</title>'.format(cgi.escape(input_file)))
         f.write(HTML_HEADER)
@@ -300,7 +915,8 @@ def write_html_report(input_file, output_file, report_dict):
         f.write('<div id="toc"></div>')
 
         f.write('<div class="body">')
-        report_dict.print_html(output=f)
+        report_dict.print_html(output=f, max_rows=max_rows,
+                               chunksize=chunksize)
         f.write('</div>')
 
         f.write('</div>')
@@ -312,23 +928,148 @@ def write_html_report(input_file, output_file, report_dict):
         f.write('</body></html>')
 
 
-def pypfi(input_file, output_file, debug=False, output=sys.stdout):
+def read_prepared_transactions(input_file, builders=REPORT_BUILDERS,
+                               cache=None, profiler=None, **read_kwargs):
+    """
+    Read transactions and add the computed columns needed by ``builders``
+
+    Args:
+        input_file (str): path to the transactions file
+        builders (iterable): report builders (see :func:`prepare_frame`)
+        cache (pypfi.cache.TransactionCache): if not None, load the
+            prepared frame from (or store it in) this cache
+        profiler (pypfi.profiling.StageProfiler): if set, time the
+            ``cache.load``, ``read_transactions_tsv``,
+            ``add_computed_columns`` and ``cache.store`` stages
+        read_kwargs (dict): :func:`read_transactions_tsv` arguments
+    Returns:
+        pandas.DataFrame: transactions with computed columns
+    """
+    profiler = profiler or profiling.StageProfiler(enabled=False)
+    if cache is not None:
+        columns = [c for c in COMPUTED_COLUMNS if c in set().union(
+            *[getattr(b, 'computed_columns', ()) for b in builders])]
+        with profiler.stage('cache.load') as record:
+            key = cache.get_key(input_file, columns=columns, **read_kwargs)
+            df = cache.load(key)
+            record['rows'] = None if df is None else len(df)
+        if df is not None:
+            return df
+    with profiler.stage('read_transactions_tsv') as record:
+        df = read_transactions_tsv(input_file, **read_kwargs)
+        record['rows'] = len(df)
+    with profiler.stage('add_computed_columns', rows=len(df)):
+        df = prepare_frame(df, builders)
+    if cache is not None:
+        with profiler.stage('cache.store', rows=len(df)):
+            cache.store(key, df)
+    return df
 
-    df = read_transactions_tsv(input_file)
+
+def build_report_dict(input_file, debug=False, output=sys.stdout,
+                      wide_pivots=False, chunksize=None, date_format=None,
+                      tz=None, engine='c', cache=None, scheduler=None,
+                      profiler=None, categorizer=None):
+    """
+    Read transactions and build the reports
+
+    Args:
+        input_file (str): path to the transactions file
+        chunksize (int): if set, build the streaming reports
+            (see :func:`build_streaming_reports`)
+        scheduler (pypfi.scheduler.ReportScheduler): if set, build the
+            reports concurrently (see :func:`build_reports_parallel`)
+        profiler (pypfi.profiling.StageProfiler): if set, time each stage
+        categorizer (pypfi.categorize.Categorizer): if set, add a
+            ``category`` column and report it as a dimension
+    Returns:
+        ReportDict: ``df`` (or ``ingest``), ``build_groupby_reports``,
+        ``build_pivot_reports``
+    """
+    profiler = profiler or profiling.StageProfiler(enabled=False)
+    read_kwargs = dict(date_format=date_format, tz=tz, engine=engine)
+    report_dict = ReportDict(headingchar='=', headinghtml='h2')
+    if chunksize:
+        with profiler.stage('build_streaming_reports') as record:
+            reports = build_streaming_reports(
+                read_transactions_tsv(input_file, chunksize=chunksize,
+                                      **read_kwargs),
+                _output=output, categorizer=categorizer)
+            record['rows'] = reports['ingest']['rows']
+        for name in ('build_groupby_reports', 'build_pivot_reports', 'ingest'):
+            report_dict[name] = reports[name]
+        if debug:
+            report_dict.print_str(output=output)
+        return report_dict
+
+    df = read_prepared_transactions(input_file, REPORT_BUILDERS,
+                                    cache=cache, profiler=profiler,
+                                    **read_kwargs)
+    if categorizer is not None:
+        with profiler.stage('categorize', rows=len(df)):
+            df = _categorize.add_category_column(df, categorizer)
     if debug:
         print(df, file=output)
         print(df.dtypes, file=output)
 
-    report_dict = ReportDict(headingchar='=', headinghtml='h2')
-    report_dict['df'] = df.copy()
+    report_dict['df'] = df[
+        TRANSACTION_COLUMNS + [k for k in OPTIONAL_KEYS if k in df.columns]
+    ].copy()
 
-    report_dict['build_groupby_reports'] = build_groupby_reports(df, _output=output)
-    report_dict['build_pivot_reports'] = build_pivot_reports(df, _output=output)
+    if scheduler is not None:
+        with profiler.stage('build_reports_parallel', rows=len(df)):
+            reports = build_reports_parallel(df, scheduler, wide=wide_pivots)
+        for name in ('build_groupby_reports', 'build_pivot_reports'):
+            report_dict[name] = reports[name]
+    else:
+        with profiler.stage('build_groupby_reports', rows=len(df)):
+            report_dict['build_groupby_reports'] = build_groupby_reports(df, _output=output)
+        report_dict['build_pivot_reports'] = build_pivot_reports(
+            df, _output=output, wide=wide_pivots, profiler=profiler)
 
     if debug:
         report_dict.print_str(output=output)
+    return report_dict
 
-    write_html_report(input_file, output_file, report_dict)
+
+def write_report(input_file, output_file, report_dict, max_rows=None,
+                 compress=None, lazy=False):
+    """
+    Write an HTML report (see :func:`write_html_report`), or a lazily
+    loaded HTML report (see :func:`pypfi.lazyhtml.write_lazy_html_report`)
+    """
+    if lazy:
+        lazyhtml.write_lazy_html_report(input_file, output_file,
+                                        report_dict, max_rows=max_rows)
+    else:
+        write_html_report(input_file, output_file, report_dict,
+                          max_rows=max_rows, compress=compress)
+
+
+def pypfi(input_file, output_file, debug=False, output=sys.stdout,
+          wide_pivots=False, chunksize=None, date_format=None, tz=None,
+          engine='c', cache=None, max_rows=None, compress=None, lazy=False,
+          scheduler=None, profiler=None, profile_file=None,
+          profile_html=False, categorizer=None):
+
+    profiler = profiler or profiling.StageProfiler(enabled=False)
+
+    report_dict = build_report_dict(
+        input_file, debug=debug, output=output, wide_pivots=wide_pivots,
+        chunksize=chunksize, date_format=date_format, tz=tz, engine=engine,
+        cache=cache, scheduler=scheduler, profiler=profiler,
+        categorizer=categorizer)
+
+    if profile_html:
+        # the write_report stage is only in the JSON timing report
+        report_dict['profile'] = profiler.to_frame()
+
+    with profiler.stage('write_report'):
+        write_report(input_file, output_file, report_dict,
+                     max_rows=max_rows, compress=compress, lazy=lazy)
+
+    if profile_file:
+        profiler.write_json(profile_file)
 
     return 0
 
@@ -352,6 +1093,223 @@ class Test_pypfi(unittest.TestCase):
         output = read_transactions_tsv(self.INPUT_FILE)
         self.assertTrue(isinstance(output, pd.DataFrame))
 
+    def test_read_transactions_tsv_options(self):
+        df = read_transactions_tsv(self.INPUT_FILE)
+        legacy = pd.read_csv(self.INPUT_FILE,
+                             parse_dates=['date'],
+                             names=['date', 'desc', 'amount', 'balance'],
+                             thousands=',')
+        pd.util.testing.assert_frame_equal(df, legacy)
+
+        output = read_transactions_tsv(self.INPUT_FILE, tz='America/Chicago',
+                                       cents=True, desc_dtype='category')
+        self.assertEqual(str(output['date'].dtype),
+                         'datetime64[ns, America/Chicago]')
+        self.assertEqual(output['desc'].dtype.name, 'category')
+        self.assertEqual(output['amount'].dtype, np.int64)
+        self.assertEqual(output['amount'].sum(),
+                         int(round(df['amount'].sum() * 100)))
+        self.assertTrue((output['date'].dt.tz_convert('UTC') ==
+                         pd.to_datetime(df['date'], utc=True)).all())
+
+    def test_read_prepared_transactions_cache(self):
+        import shutil
+        import tempfile
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache = _cache.TransactionCache(tmpdir)
+            expected = read_prepared_transactions(self.INPUT_FILE, cache=cache)
+            self.assertEqual(len(cache.entries()), 1)
+            output = read_prepared_transactions(self.INPUT_FILE, cache=cache)
+            pd.util.testing.assert_frame_equal(output, expected)
+            self.assertEqual(len(cache.entries()), 1)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_add_computed_columns(self):
+        df = read_transactions_tsv(self.INPUT_FILE)
+        expected = _add_computed_columns_apply(df.copy())
+        output = add_computed_columns(df.copy())
+        for colname in ('yearmonth', 'weekday_abbr'):
+            self.assertEqual(output[colname].dtype.name, 'category')
+            output[colname] = output[colname].astype(object)
+        pd.util.testing.assert_frame_equal(output, expected,
+                                           check_dtype=False)
+
+    def test_prepare_frame(self):
+        df = read_transactions_tsv(self.INPUT_FILE)
+        output = prepare_frame(df, REPORT_BUILDERS)
+        self.assertIs(output, df)
+        self.assertEqual(
+            list(output.columns[4:]),
+            ['year', 'yearmonth', 'month', 'weekday_abbr', 'hour'])
+        # already-computed columns are not recomputed by the builders
+        output['year'] = 0
+        reports = build_groupby_reports(output)
+        self.assertEqual(list(reports['groupby_year'].index), [0])
+
+    def test_build_groupby_reports(self):
+        df = prepare_frame(read_transactions_tsv(self.INPUT_FILE),
+                           REPORT_BUILDERS)
+        output = build_groupby_reports(df, aggfuncs=('sum', 'count'))
+        for key in GROUPBY_KEYS:
+            name = 'groupby_%s' % key.replace('_abbr', '')
+            pd.util.testing.assert_series_equal(
+                output[name], df.groupby(df[key])['amount'].sum())
+            pd.util.testing.assert_series_equal(
+                output[name + '.count()'],
+                df.groupby(df[key])['amount'].count())
+
+    def test_build_pivot_reports(self):
+        df = prepare_frame(read_transactions_tsv(self.INPUT_FILE),
+                           REPORT_BUILDERS)
+        output = build_pivot_reports(df)
+        wide = build_pivot_reports(df.copy(), wide=True)
+        for name, _ in PIVOT_COLUMNS:
+            name = 'pivot_by_%s' % name
+            self.assertTrue(isinstance(output[name], pivots.LongPivot))
+            self.assertTrue(isinstance(wide[name], pd.DataFrame))
+            pd.util.testing.assert_frame_equal(
+                output[name + '.describe()'],
+                wide[name].iloc[:-1].describe())
+
+    def test_build_streaming_reports(self):
+        df = prepare_frame(read_transactions_tsv(self.INPUT_FILE),
+                           REPORT_BUILDERS)
+        output = build_streaming_reports(
+            read_transactions_tsv(self.INPUT_FILE, chunksize=100))
+        self.assertEqual(output['ingest']['rows'], len(df))
+        self.assertEqual(output['ingest']['chunks'], 15)
+        expected = build_groupby_reports(df)
+        for key in GROUPBY_KEYS:
+            name = get_groupby_report_name(key)
+            pd.util.testing.assert_series_equal(
+                output['build_groupby_reports'][name], expected[name])
+        expected = build_pivot_reports(df)
+        for name, _ in PIVOT_COLUMNS:
+            for report in ('pivot_by_%s.describe()', 'pivot_by_%s.sum()'):
+                report = report % name
+                pd.util.testing.assert_almost_equal(
+                    output['build_pivot_reports'][report], expected[report])
+
+    def test_build_reports_category(self):
+        categorizer = _categorize.Categorizer([
+            ('groceries', 'ABC', 'prefix'),
+            ('online', '.com', 'contains'),
+            ('salary', r'^Paycheck\b', 'regex')])
+        df = prepare_frame(read_transactions_tsv(self.INPUT_FILE),
+                           REPORT_BUILDERS)
+        self.assertEqual(get_groupby_keys(df), GROUPBY_KEYS)
+        df = _categorize.add_category_column(df, categorizer)
+        self.assertEqual(get_groupby_keys(df), GROUPBY_KEYS + ('category',))
+
+        output = build_groupby_reports(df)
+        pd.util.testing.assert_series_equal(
+            output['groupby_category'],
+            df.groupby('category')['amount'].sum())
+        output = build_pivot_reports(df)
+        self.assertEqual(list(output['pivot_by_category.sum()'].index),
+                         list(categorizer.categories) + ['All'])
+        tasks = get_report_tasks(columns=df.columns)
+        self.assertIn('category', tasks[0].columns)
+        self.assertEqual(tasks[-1].kwargs['columns'], ['category'])
+
+        streaming = build_streaming_reports(
+            read_transactions_tsv(self.INPUT_FILE, chunksize=500),
+            categorizer=categorizer)
+        pd.util.testing.assert_series_equal(
+            streaming['build_groupby_reports']['groupby_category'],
+            df.groupby('category')['amount'].sum())
+        pd.util.testing.assert_almost_equal(
+            streaming['build_pivot_reports']['pivot_by_category.sum()'],
+            output['pivot_by_category.sum()'])
+
+    def test_910_pypfi_chunksize(self):
+        output = pypfi(self.INPUT_FILE, self.OUTPUT_FILE, chunksize=500)
+        self.assertEqual(output, 0)
+
+    def test_iter_html_table(self):
+        df = read_transactions_tsv(self.INPUT_FILE)
+        kwargs = dict(na_rep='', classes=HTML_TABLE_CLASSES)
+        self.assertEqual(
+            ''.join(iter_html_table(df, chunksize=len(df), **kwargs)),
+            df.to_html(**kwargs))
+        html = ''.join(iter_html_table(df, chunksize=100, **kwargs))
+        self.assertEqual(html.count('<tr>'), len(df))
+        self.assertEqual(html.count('</tbody>'), 1)
+        html = ''.join(iter_html_table(df, chunksize=100, max_rows=150))
+        self.assertEqual(html.count('<tr>'), 150)
+        self.assertEqual(''.join(iter_html_table(df.iloc[:0])),
+                         df.iloc[:0].to_html())
+
+    def test_920_pypfi_max_rows_gzip(self):
+        import gzip
+        output_file = self.OUTPUT_FILE + '.gz'
+        output = pypfi(self.INPUT_FILE, output_file, max_rows=10)
+        self.assertEqual(output, 0)
+        with contextlib.closing(gzip.open(output_file)) as f:
+            html = f.read().decode('utf8')
+        self.assertIn('Showing 10 of 1436 rows (truncated)', html)
+        self.assertTrue(html.endswith('</body></html>'))
+
+    def test_930_pypfi_lazy(self):
+        import glob
+        import os
+        output_file = self.OUTPUT_FILE.replace('.html', '.lazy.html')
+        output = pypfi(self.INPUT_FILE, output_file, lazy=True)
+        self.assertEqual(output, 0)
+        with codecs.open(output_file, encoding='utf8') as f:
+            html = f.read()
+        data_files = glob.glob(os.path.join(output_file + '.data', '*.js'))
+        self.assertEqual(html.count('class="pypfi-lazy"'), len(data_files))
+        self.assertIn('Load 1436 rows', html)
+        self.assertNotIn('<td>', html)
+
+    def test_build_reports_parallel(self):
+        df = read_prepared_transactions(self.INPUT_FILE)
+        expected = ReportDict()
+        expected['build_groupby_reports'] = build_groupby_reports(df.copy())
+        expected['build_pivot_reports'] = build_pivot_reports(df.copy())
+        for mode in ('process', 'thread'):
+            with _scheduler.ReportScheduler(2, mode=mode) as scheduler:
+                output = build_reports_parallel(df.copy(), scheduler)
+            self.assertEqual([path for path, _, _ in output.walk()],
+                             [path for path, _, _ in expected.walk()])
+            for (path, _, value), (_, _, expected_value) in zip(
+                    output.walk(), expected.walk()):
+                if isinstance(value, pivots.LongPivot):
+                    value, expected_value = (value.to_frame(),
+                                             expected_value.to_frame())
+                if isinstance(value, (pd.DataFrame, pd.Series)):
+                    pd.util.testing.assert_almost_equal(
+                        value.values, expected_value.values)
+
+    def test_940_pypfi_scheduler(self):
+        with _scheduler.ReportScheduler(2) as scheduler:
+            output = pypfi(self.INPUT_FILE, self.OUTPUT_FILE,
+                           scheduler=scheduler)
+        self.assertEqual(output, 0)
+
+    def test_950_pypfi_profile(self):
+        import json
+        profile_file = self.OUTPUT_FILE + '.profile.json'
+        profiler = profiling.StageProfiler()
+        output = pypfi(self.INPUT_FILE, self.OUTPUT_FILE, profiler=profiler,
+                       profile_file=profile_file, profile_html=True)
+        self.assertEqual(output, 0)
+        stages = [r['stage'] for r in profiler.records]
+        self.assertEqual(stages[:3], ['read_transactions_tsv',
+                                      'add_computed_columns',
+                                      'build_groupby_reports'])
+        self.assertIn('pivot_by_hour.describe()', stages)
+        self.assertEqual(stages[-1], 'write_report')
+        self.assertEqual(profiler.records[0]['rows'], 1436)
+        with open(profile_file) as f:
+            self.assertEqual(
+                [r['stage'] for r in json.load(f)['stages']], stages)
+        with codecs.open(self.OUTPUT_FILE, encoding='utf8') as f:
+            self.assertIn('<h2>profile</h2>', f.read())
+
     def test_900_pypfi(self):
         output = pypfi(self.INPUT_FILE, self.OUTPUT_FILE)
 
@@ -370,6 +1328,85 @@ def main(*args):
     prs.add_option('-o', '--output-file',
                    dest='output_file',)
 
+    prs.add_option('--date-format',
+                   dest='date_format',
+                   help='strftime format of the dates (default: ISO 8601)',
+                   default=None)
+    prs.add_option('--tz',
+                   dest='tz',
+                   help='Convert dates to this timezone (e.g. America/Chicago)',
+                   default=None)
+    prs.add_option('--engine',
+                   dest='engine',
+                   help='CSV parser engine: c or python',
+                   type='choice',
+                   choices=CSV_ENGINES,
+                   default='c')
+    prs.add_option('--chunksize',
+                   dest='chunksize',
+                   help='Read and aggregate this many rows at a time',
+                   type=int,
+                   default=None)
+    prs.add_option('--cache',
+                   dest='cache',
+                   help='Cache parsed transactions (in --cache-dir)',
+                   action='store_true',)
+    prs.add_option('--cache-dir',
+                   dest='cache_dir',
+                   help='Cache directory (default: ~/.cache/pypfi)',
+                   default=None)
+    prs.add_option('--cache-max-mb',
+                   dest='cache_max_mb',
+                   help='Evict cache entries above this size',
+                   type=int,
+                   default=_cache.DEFAULT_MAX_BYTES // 2 ** 20)
+    prs.add_option('--max-rows',
+                   dest='max_rows',
+                   help='Truncate HTML tables to this many rows',
+                   type=int,
+                   default=None)
+    prs.add_option('-z', '--gzip',
+                   dest='compress',
+                   help='gzip the HTML report (default: if -o ends with .gz)',
+                   action='store_true',
+                   default=None)
+    prs.add_option('--lazy',
+                   dest='lazy',
+                   help=('Write tables to OUTPUT_FILE.data/ and load them '
+                         'on demand (for large reports)'),
+                   action='store_true',)
+    prs.add_option('-j', '--jobs',
+                   dest='jobs',
+                   help='Build reports in this many worker processes',
+                   type=int,
+                   default=None)
+    prs.add_option('--threads',
+                   dest='threads',
+                   help='Use worker threads instead of processes (with -j)',
+                   action='store_true',)
+    prs.add_option('--profile',
+                   dest='profile',
+                   help=('Time each stage; write a JSON timing report to '
+                         'PROFILE_FILE'),
+                   action='store_true',)
+    prs.add_option('--profile-file',
+                   dest='profile_file',
+                   help='JSON timing report path (default: OUTPUT_FILE.profile.json)',
+                   default=None)
+    prs.add_option('--profile-html',
+                   dest='profile_html',
+                   help='Add the stage timings to the HTML report (with --profile)',
+                   action='store_true',)
+    prs.add_option('-r', '--rules',
+                   dest='rules',
+                   help=('Add a category column from a CSV file of '
+                         'category,kind,pattern rules'),
+                   default=None)
+    prs.add_option('--wide-pivots',
+                   dest='wide_pivots',
+                   help='Report dense pivot tables (uses more memory)',
+                   action='store_true',)
+
     prs.add_option('-v', '--verbose',
                     dest='verbose',
                     action='store_true',)
@@ -401,10 +1438,51 @@ def main(*args):
         debug = False
         output = StringIO.StringIO()
 
-    return pypfi(opts.input_file,
-                 opts.output_file,
-                 debug=debug,
-                 output=output)
+    cache = None
+    if opts.cache or opts.cache_dir:
+        cache = _cache.TransactionCache(opts.cache_dir,
+                                        max_bytes=opts.cache_max_mb * 2 ** 20)
+
+    scheduler = None
+    if opts.jobs:
+        scheduler = _scheduler.ReportScheduler(
+            opts.jobs, mode='thread' if opts.threads else 'process')
+
+    categorizer = None
+    if opts.rules:
+        categorizer = _categorize.Categorizer.from_csv(opts.rules)
+
+    profiler = None
+    profile_file = None
+    if opts.profile:
+        profiler = profiling.StageProfiler()
+        profile_file = (opts.profile_file or
+                        '%s.profile.json' % opts.output_file)
+
+    try:
+        return pypfi(opts.input_file,
+                     opts.output_file,
+                     debug=debug,
+                     output=output,
+                     wide_pivots=opts.wide_pivots,
+                     chunksize=opts.chunksize,
+                     date_format=opts.date_format,
+                     tz=opts.tz,
+                     engine=opts.engine,
+                     cache=cache,
+                     max_rows=opts.max_rows,
+                     compress=opts.compress,
+                     lazy=opts.lazy,
+                     scheduler=scheduler,
+                     profiler=profiler,
+                     profile_file=profile_file,
+                     profile_html=opts.profile_html,
+                     categorizer=categorizer)
+    finally:
+        if scheduler is not None:
+            scheduler.close()
+        if profiler is not None:
+            print(profiler.to_frame().to_string(na_rep=''), file=sys.stderr)
 
 
 if __name__ == "__main__":
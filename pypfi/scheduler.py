@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.scheduler
+================
+
+Run independent report builders concurrently.
+
+A :class:`ReportScheduler` runs report tasks in a pool of processes (or
+threads). Process workers read the prepared frame from a
+:class:`SharedFrame` (a directory of memory-mapped ``.npy`` column files)
+instead of receiving a pickled copy of it; each worker maps only the
+columns that its task reads. Results are collected in task order, so
+the report order does not depend on which worker finishes first.
+
+"""
+import collections
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.pool
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import cache as _cache
+except (ImportError, ValueError):  # python ./pypfi/scheduler.py
+    import cache as _cache
+
+log = logging.getLogger('pypfi.scheduler')
+
+
+class SharedFrame(object):
+    """
+    The columns of a DataFrame, as memory-mapped ``.npy`` files
+
+    Categorical columns are stored as their codes; object columns of
+    tz-aware datetimes are stored as UTC ``datetime64`` values and UTC
+    offsets (see :func:`pypfi.cache.encode_columns`). Other object
+    columns (e.g. ``desc``) and the categories of categorical columns
+    are pickled to files, and are not memory-mapped. The index is not
+    stored.
+
+    A SharedFrame pickles as its directory and column metadata, so it can
+    be passed to process workers cheaply; a worker reads only the files
+    of the columns that it loads.
+    """
+
+    def __init__(self, df, directory=None):
+        """
+        Args:
+            df (pandas.DataFrame): frame to share
+            directory (str): parent directory of the column files
+                (default: ``tempfile.gettempdir()``)
+        """
+        self.directory = tempfile.mkdtemp(prefix='pypfi-shared-',
+                                          dir=directory)
+        self.nrows = len(df)
+        self.columns = collections.OrderedDict()
+        encoded_df, self.encoded = _cache.encode_columns(df)
+        for n, colname in enumerate(encoded_df.columns):
+            values = encoded_df[colname]
+            meta = {'path': os.path.join(self.directory, '%d' % n)}
+            if values.dtype.name == 'category':
+                meta['kind'] = 'category'
+                meta['categories_path'] = meta['path'] + '.categories.pkl'
+                meta['ordered'] = values.cat.ordered
+                with open(meta['categories_path'], 'wb') as f:
+                    pickle.dump(values.cat.categories, f,
+                                pickle.HIGHEST_PROTOCOL)
+                values = values.cat.codes
+            elif getattr(values.dtype, 'tz', None) is not None:
+                meta['kind'] = 'datetimetz'
+                meta['tz'] = values.dtype.tz
+            elif values.dtype == object:
+                meta['kind'] = 'object'
+            else:
+                meta['kind'] = 'array'
+            if meta['kind'] == 'object':
+                meta['path'] += '.pkl'
+                with open(meta['path'], 'wb') as f:
+                    pickle.dump(values.values, f, pickle.HIGHEST_PROTOCOL)
+            else:
+                meta['path'] += '.npy'
+                np.save(meta['path'], np.asarray(values.values))
+            self.columns[colname] = meta
+
+    def load(self, columns=None):
+        """
+        Args:
+            columns (iterable): names of the columns to load
+                (``None``: all columns)
+        Returns:
+            pandas.DataFrame: a frame of (memory-mapped) columns
+
+        Only the files of ``columns`` are read. The columns are joined
+        with ``pd.concat(copy=False)``; pandas may still copy columns of
+        the same dtype when it consolidates them.
+        """
+        if columns is None:
+            columns = [c for c in self.columns
+                       if not c.endswith('.utcoffset')]
+        columns = list(columns)
+        index = pd.RangeIndex(self.nrows)
+        if not columns:
+            return pd.DataFrame(index=index)
+        series = []
+        for colname in columns:
+            if colname in self.encoded:
+                values = _cache.decode_columns(pd.DataFrame(
+                    collections.OrderedDict((
+                        (colname, self._load_column(colname)),
+                        ('%s.utcoffset' % colname,
+                         self._load_column('%s.utcoffset' % colname))))),
+                    [colname])[colname].values
+            else:
+                values = self._load_column(colname)
+            series.append(pd.Series(values, index=index, name=colname,
+                                    copy=False))
+        return pd.concat(series, axis=1, copy=False)
+
+    def _load_column(self, colname):
+        """
+        Args:
+            colname (str): name of a stored column
+        Returns:
+            numpy.ndarray or pandas.Categorical or pandas.DatetimeIndex:
+            the (memory-mapped) column values
+        """
+        meta = self.columns[colname]
+        if meta['kind'] == 'object':
+            with open(meta['path'], 'rb') as f:
+                return pickle.load(f)
+        values = np.load(meta['path'], mmap_mode='r')
+        if meta['kind'] == 'category':
+            with open(meta['categories_path'], 'rb') as f:
+                categories = pickle.load(f)
+            return pd.Categorical.from_codes(
+                values, categories, ordered=meta['ordered'])
+        if meta['kind'] == 'datetimetz':
+            return pd.DatetimeIndex(values).tz_localize(
+                'UTC').tz_convert(meta['tz'])
+        return values
+
+    def close(self):
+        """
+        Remove the column files
+        """
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ReportTask(collections.namedtuple(
+        'ReportTask', ('group', 'func', 'columns', 'kwargs'))):
+    """
+    A report builder call
+
+    Args:
+        group (str): name of the report group which the result is added to
+        func (callable): ``func(df, **kwargs)``, returns a ReportDict
+            (a module-level function, for process workers)
+        columns (iterable): columns of ``df`` which ``func`` reads
+        kwargs (dict): keyword arguments for ``func``
+    """
+    __slots__ = ()
+
+
+def run_report_task(source, task):
+    """
+    Run ``task`` with a frame (or a :class:`SharedFrame`)
+
+    Args:
+        source (pandas.DataFrame or SharedFrame): prepared transactions
+        task (ReportTask): task to run
+    Returns:
+        object: ``task.func(df, **task.kwargs)``
+    """
+    if isinstance(source, SharedFrame):
+        df = source.load(task.columns)
+    else:
+        df = source
+    return task.func(df, **(task.kwargs or {}))
+
+
+class ReportScheduler(object):
+    """
+    Run report tasks in a process (or thread) pool
+    """
+
+    MODES = ('process', 'thread', 'serial')
+
+    def __init__(self, processes=None, mode='process', shared_dir=None):
+        """
+        Args:
+            processes (int): number of workers
+                (default: ``multiprocessing.cpu_count()``)
+            mode (str): ``process``, ``thread`` or ``serial``
+            shared_dir (str): parent directory of :class:`SharedFrame`
+                column files (process mode)
+        """
+        if mode not in self.MODES:
+            raise ValueError(mode)
+        self.processes = processes or multiprocessing.cpu_count()
+        self.mode = mode
+        self.shared_dir = shared_dir
+        self._pool = None
+
+    def get_pool(self):
+        """
+        Returns:
+            multiprocessing.pool.Pool: the worker pool (created once)
+        """
+        if self._pool is None:
+            if self.mode == 'process':
+                self._pool = multiprocessing.Pool(self.processes)
+            else:
+                self._pool = multiprocessing.pool.ThreadPool(self.processes)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def map(self, func, iterable):
+        """
+        Args:
+            func (callable): module-level function (process mode)
+            iterable (iterable): arguments
+        Returns:
+            list: ``[func(x) for x in iterable]``, computed by the pool
+        """
+        if self.mode == 'serial':
+            return [func(x) for x in iterable]
+        return self.get_pool().map(func, iterable, chunksize=1)
+
+    def imap(self, func, iterable, window=None):
+        """
+        Args:
+            func (callable): module-level function (process mode)
+            iterable (iterable): arguments (may be unbounded)
+            window (int): maximum number of pending results
+                (default: ``2 * processes``)
+        Yields:
+            object: ``func(x)`` for each ``x``, in order
+        """
+        if self.mode == 'serial':
+            for x in iterable:
+                yield func(x)
+            return
+        pool = self.get_pool()
+        window = window or 2 * self.processes
+        pending = collections.deque()
+        for x in iterable:
+            pending.append(pool.apply_async(func, (x,)))
+            if len(pending) >= window:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def run(self, df, tasks):
+        """
+        Run ``tasks`` and collect their reports by group
+
+        Args:
+            df (pandas.DataFrame): prepared transactions; tasks must not
+                modify it (threads share it)
+            tasks (iterable): :class:`ReportTask` s
+        Returns:
+            collections.OrderedDict: ``{group: [result, ...]}``, in task
+            order
+        """
+        tasks = list(tasks)
+        log.debug('running %d tasks (%s, %d workers)',
+                  len(tasks), self.mode, self.processes)
+        if self.mode == 'serial':
+            results = [run_report_task(df, task) for task in tasks]
+        elif self.mode == 'thread':
+            pool = self.get_pool()
+            results = [r.get() for r in [
+                pool.apply_async(run_report_task, (df, task))
+                for task in tasks]]
+        else:
+            with SharedFrame(df, directory=self.shared_dir) as shared:
+                pool = self.get_pool()
+                results = [r.get() for r in [
+                    pool.apply_async(run_report_task, (shared, task))
+                    for task in tasks]]
+        output = collections.OrderedDict()
+        for task, result in zip(tasks, results):
+            output.setdefault(task.group, []).append(result)
+        return output
+
+
+def _sum_column(df, colname):
+    return {colname: df[colname].sum(), 'pid': os.getpid()}
+
+
+class Test_scheduler(unittest.TestCase):
+    def setUp(self):
+        from dateutil.tz import tzoffset
+        self.df = pd.DataFrame(collections.OrderedDict((
+            ('date', pd.Series([
+                pd.Timestamp('2015-03-08 01:57:00', tz=tzoffset(None, -21600)),
+                pd.Timestamp('2015-03-08 03:57:00', tz=tzoffset(None, -18000)),
+                pd.Timestamp('2015-03-09 03:57:00', tz=tzoffset(None, -18000))],
+                dtype=object)),
+            ('desc', ['a', 'b', 'c']),
+            ('amount', [1.0, 2.0, 4.0]),
+            ('year', [2015, 2015, 2015]),
+            ('weekday_abbr', pd.Categorical(['6-Sun', '6-Sun', '0-Mon'])),
+        )))
+
+    def test_010_shared_frame(self):
+        with SharedFrame(self.df) as shared:
+            output = shared.load()
+            pd.util.testing.assert_frame_equal(output, self.df)
+            self.assertEqual([str(x) for x in output['date']],
+                             [str(x) for x in self.df['date']])
+            output = shared.load(['amount'])
+            self.assertEqual(list(output.columns), ['amount'])
+            self.assertIsInstance(np.asarray(output['amount']), np.ndarray)
+            directory = shared.directory
+        self.assertFalse(os.path.exists(directory))
+
+    def test_015_shared_frame_memmap(self):
+        with SharedFrame(self.df) as shared:
+            for colname in ('amount', 'year'):
+                self.assertIsInstance(shared._load_column(colname),
+                                      np.memmap)
+            output = shared.load(['amount', 'year', 'weekday_abbr'])
+            self.assertEqual(list(output.columns),
+                             ['amount', 'year', 'weekday_abbr'])
+            self.assertEqual(output['amount'].sum(), 7.0)
+            self.assertEqual(list(output['year']), [2015, 2015, 2015])
+            self.assertEqual(list(output['weekday_abbr']),
+                             ['6-Sun', '6-Sun', '0-Mon'])
+            self.assertEqual(len(shared.load([])), 3)
+            directory = shared.directory
+        self.assertFalse(os.path.exists(directory))
+
+    def test_016_shared_frame_pickle(self):
+        df = self.df.copy()
+        df['desc'] = df['desc'].astype('category')
+        with SharedFrame(df) as shared:
+            # workers receive the metadata, not the desc categories
+            data = pickle.dumps(shared, pickle.HIGHEST_PROTOCOL)
+            self.assertNotIn(b'6-Sun', data)
+            shared = pickle.loads(data)
+            self.assertEqual(list(shared.load(['desc'])['desc']),
+                             ['a', 'b', 'c'])
+            directory = shared.directory
+        self.assertFalse(os.path.exists(directory))
+
+    def test_020_run(self):
+        tasks = [ReportTask('a', _sum_column, ['amount'], {'colname': 'amount'}),
+                 ReportTask('b', _sum_column, ['year'], {'colname': 'year'}),
+                 ReportTask('a', _sum_column, ['year'], {'colname': 'year'})]
+        for mode in ReportScheduler.MODES:
+            with ReportScheduler(2, mode=mode) as scheduler:
+                output = scheduler.run(self.df, tasks)
+            self.assertEqual(list(output), ['a', 'b'])
+            self.assertEqual([x.get('amount', x.get('year'))
+                              for x in output['a']], [7.0, 6045])
+
+    def test_030_imap(self):
+        for mode in ReportScheduler.MODES:
+            with ReportScheduler(2, mode=mode) as scheduler:
+                output = scheduler.imap(abs, itertools.count(-5), window=3)
+                self.assertEqual(list(itertools.islice(output, 8)),
+                                 [5, 4, 3, 2, 1, 0, 1, 2])
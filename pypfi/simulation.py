@@ -0,0 +1,550 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.simulation
+=================
+
+Schedule-driven simulation of a checking account.
+
+:class:`ScheduleDataGenerator` generates transactions from calendars of
+recurring and constrained events, a block of days at a time:
+
+* a paycheck on payday (Fridays, ``DateTimeGenerator.payday``)
+* monthly bills on fixed days of the month (``MONTHLY_BILLS``)
+* purchases: a Poisson number per day, weighted by weekday and by month
+  (seasonality), at hours drawn from a wake/sleep and mealtime
+  hour-of-day distribution (later on weekends)
+* no overdrafts until payday: once a purchase would take the balance
+  below ``min_balance``, no more purchases are made until the next
+  paycheck (bills are still paid)
+
+Each step is vectorized over the days or events of a block; only the
+overdraft constraint loops, once per pay period.
+
+Usage::
+
+    python -m pypfi.simulation -d 3650 --seed 1 -o transactions.csv
+    python -m pypfi.simulation -d 3650 --purchases-per-day 500 \\
+        -o transactions.parquet
+
+"""
+import collections
+import logging
+import sys
+import unittest
+
+import arrow
+import numpy as np
+import pandas as pd
+
+try:
+    from . import datagenerator
+except (ImportError, ValueError):  # python ./pypfi/simulation.py
+    import datagenerator
+
+log = logging.getLogger('pypfi.simulation')
+
+
+PAYCHECK = 1500
+
+# (desc, day of the month, amount)
+MONTHLY_BILLS = (
+    (u"Rent", 1, -1200),
+    (u"Electric Utility", 15, -90),
+    (u"Internet", 20, -60),
+    (u"Phone", 25, -50),
+)
+
+# Mon..Sun
+WEEKDAY_WEIGHTS = (0.9, 0.9, 0.95, 1.0, 1.2, 1.4, 1.1)
+
+# Jan..Dec
+MONTH_WEIGHTS = (0.9, 0.85, 0.95, 1.0, 1.0, 1.05,
+                 1.05, 1.0, 0.95, 1.0, 1.1, 1.4)
+
+MEAL_HOURS = (1.5, 6, 12)  # hours after waking
+
+# lognormal purchase amounts (median ~20), in dollars
+PURCHASE_MU = 3.0
+PURCHASE_SIGMA = 0.8
+PURCHASE_RANGE = (0.5, 500)
+
+PAYCHECK_HOURS = 3  # hours after waking
+BILL_HOURS = 0  # hours after midnight
+
+DAY_NS = 24 * 3600 * 10 ** 9
+HOUR_NS = 3600 * 10 ** 9
+MINUTE_NS = 60 * 10 ** 9
+
+STATEMENT, PAYCHECK_EVENT, BILL, PURCHASE = range(4)
+
+
+def get_hour_weights(wake=6, sleep=22, meal_hours=MEAL_HOURS):
+    """
+    Args:
+        wake (int): wake hour
+        sleep (int): sleep hour
+        meal_hours (iterable): mealtimes, in hours after waking
+    Returns:
+        numpy.ndarray: probability of a purchase in each hour of the day
+            (zero while asleep, with peaks at mealtimes)
+    """
+    hours = np.arange(24)
+    weights = np.ones(24)
+    for meal in meal_hours:
+        weights += 2 * np.exp(-0.5 * (hours - (wake + meal)) ** 2)
+    weights[(hours < wake) | (hours >= sleep)] = 0
+    return weights / weights.sum()
+
+
+class ScheduleDataGenerator(datagenerator.BulkDataGenerator):
+    """
+    Generate transactions from calendars of recurring events
+
+    Rows are generated ``block_days`` days at a time and, like
+    :class:`pypfi.datagenerator.BulkDataGenerator`, can be written with
+    :meth:`write` (CSV, Parquet, Feather or ``.npy``). The first row is
+    an ``Account Statement`` row at ``date_start``; generation stops at
+    ``date_end`` (exclusive) or after ``max_count`` rows. The output is
+    reproducible for a given ``seed`` and ``block_days``.
+    """
+    def __init__(self,
+                 initial_balance=1001,
+                 date_start=None,
+                 date_end=None,
+                 max_count=None,
+                 seed=None,
+                 wake=6,
+                 sleep=22,
+                 weekend_delay=2,
+                 payday=5,
+                 paycheck=PAYCHECK,
+                 bills=MONTHLY_BILLS,
+                 purchases_per_day=4,
+                 weekday_weights=WEEKDAY_WEIGHTS,
+                 month_weights=MONTH_WEIGHTS,
+                 min_balance=0,
+                 block_days=7 * 52,
+                 vocabulary_size=1024):
+        """
+        Args:
+            initial_balance (numeric): starting balance
+            date_start (arrow.Arrow): starting date (if None, ``.now()``)
+            date_end (arrow.Arrow): stop before this date
+            max_count (int): stop after this many rows
+            seed (int): random seed
+            wake (int): usual wake hour
+            sleep (int): usual sleep hour
+            weekend_delay (int): hours later to wake and sleep on weekends
+            payday (int): isoweekday (1-7, 7 is Sunday)
+            paycheck (numeric): paycheck amount
+            bills (iterable): ``(desc, day_of_month, amount)`` tuples
+                (days past the end of a month are the last day)
+            purchases_per_day (float): mean number of purchases per day
+            weekday_weights (iterable): purchase rate multipliers, Mon..Sun
+            month_weights (iterable): purchase rate multipliers, Jan..Dec
+            min_balance (numeric): no purchases below this balance
+                (until payday)
+            block_days (int): number of days to generate at a time
+            vocabulary_size (int): number of distinct purchase and
+                paycheck descriptions
+        """
+        super(ScheduleDataGenerator, self).__init__(
+            initial_balance=initial_balance,
+            date_start=date_start,
+            date_end=date_end,
+            max_count=max_count,
+            seed=seed,
+            blocksize=block_days,
+            vocabulary_size=vocabulary_size)
+        self.wake = wake
+        self.sleep = sleep
+        self.weekend_delay = weekend_delay
+        self.payday = payday
+        self.paycheck_cents = int(round(paycheck * 100))
+        self.bills = tuple(bills)
+        self.purchases_per_day = purchases_per_day
+        self.weekday_weights = np.asarray(weekday_weights, dtype=float)
+        self.month_weights = np.asarray(month_weights, dtype=float)
+        self.min_balance_cents = int(round(min_balance * 100))
+        self.hour_cdf = np.array([
+            get_hour_weights(wake, sleep).cumsum(),
+            get_hour_weights(wake + weekend_delay,
+                             min(sleep + weekend_delay, 24)).cumsum()])
+
+        # add the bill descriptions to the vocabulary
+        bill_descs = np.array([desc for desc, _, _ in self.bills] or [u""],
+                              dtype=object)
+        categories = np.unique(
+            np.concatenate([self.categories, bill_descs]).astype(object))
+        codes = np.searchsorted(categories, self.categories)
+        self._statement_code = codes[self._statement_code]
+        self._debit_codes = codes[self._debit_codes]
+        self._credit_codes = codes[self._credit_codes]
+        self._bill_codes = np.searchsorted(categories, bill_descs)
+        self.categories = categories
+
+        start = pd.Timestamp(self.date_start.datetime)
+        self._start_wall_ns = start.tz_localize(None).value
+        self._day_ns = pd.Timestamp(start.date()).value
+        self._end_wall_ns = (
+            None if date_end is None else
+            pd.Timestamp(arrow.get(date_end).datetime).tz_localize(None).value)
+        self._frozen = False  # no purchases until payday
+
+    def get_calendar(self, ndays):
+        """
+        Args:
+            ndays (int): number of days from ``self._day_ns``
+        Returns:
+            pandas.DatetimeIndex: (naive, local) days
+        """
+        return pd.DatetimeIndex(self._day_ns + DAY_NS * np.arange(ndays))
+
+    def get_paychecks(self, days):
+        """
+        Returns:
+            tuple: ``(wall_ns, amount, desc)`` arrays
+        """
+        rs = self.random_state
+        paydays = days[days.weekday == self.payday - 1]
+        wall_ns = paydays.asi8 + (self.wake + PAYCHECK_HOURS) * HOUR_NS
+        amount = np.repeat(self.paycheck_cents, len(paydays))
+        desc = self._credit_codes.take(
+            rs.randint(0, len(self._credit_codes), len(paydays)))
+        return wall_ns, amount, desc
+
+    def get_bills(self, days):
+        """
+        Returns:
+            tuple: ``(wall_ns, amount, desc)`` arrays
+        """
+        wall_ns, amount, desc = [], [], []
+        month_end = np.asarray(days.days_in_month)
+        for (_, day, bill_amount), code in zip(self.bills, self._bill_codes):
+            billdays = days.asi8[np.asarray(days.day) == np.minimum(day, month_end)]
+            wall_ns.append(billdays + BILL_HOURS * HOUR_NS)
+            amount.append(np.repeat(int(round(bill_amount * 100)),
+                                    len(billdays)))
+            desc.append(np.repeat(code, len(billdays)))
+        if not wall_ns:
+            return (np.array([], dtype=np.int64),) * 3
+        return (np.concatenate(wall_ns), np.concatenate(amount),
+                np.concatenate(desc))
+
+    def get_purchases(self, days):
+        """
+        Returns:
+            tuple: ``(wall_ns, amount, desc)`` arrays
+        """
+        rs = self.random_state
+        weekday = np.asarray(days.weekday)
+        rate = (self.purchases_per_day *
+                self.weekday_weights[weekday] *
+                self.month_weights[np.asarray(days.month) - 1])
+        day_n = np.repeat(np.arange(len(days)), rs.poisson(rate))
+        n = len(day_n)
+        weekend = (weekday[day_n] >= 5).astype(int)
+        hours = np.empty(n, dtype=np.int64)
+        u = rs.random_sample(n)
+        for cdf_n in (0, 1):
+            mask = weekend == cdf_n
+            hours[mask] = np.searchsorted(self.hour_cdf[cdf_n], u[mask],
+                                          side='right')
+        hours = np.minimum(hours, 23)
+        wall_ns = (days.asi8[day_n] + hours * HOUR_NS +
+                   rs.randint(0, 60, n) * MINUTE_NS)
+        dollars = np.clip(rs.lognormal(PURCHASE_MU, PURCHASE_SIGMA, n),
+                          *PURCHASE_RANGE)
+        amount = -np.round(dollars * 100).astype(np.int64)
+        desc = self._debit_codes.take(
+            rs.randint(0, len(self._debit_codes), n))
+        return wall_ns, amount, desc
+
+    def apply_overdraft_constraint(self, kind, amount, paycheck_n):
+        """
+        Drop the purchases which would overdraw, until the next paycheck
+
+        Args:
+            kind (numpy.ndarray): event kinds (``PURCHASE``, ...)
+            amount (numpy.ndarray): amounts (cents), in date order
+            paycheck_n (numpy.ndarray): number of paychecks in the block
+                at or before each event (a pay period number)
+        Returns:
+            tuple: ``(keep, balance)`` arrays
+        """
+        if len(amount) == 0:
+            # a block without events
+            return np.ones(0, dtype=bool), np.empty(0, dtype=np.int64)
+        keep = np.ones(len(amount), dtype=bool)
+        balance = np.empty(len(amount), dtype=np.int64)
+        carry = self.balance_cents
+        bounds = np.concatenate([
+            [0], np.flatnonzero(np.diff(paycheck_n)) + 1, [len(amount)]])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if end == start:
+                continue
+            period_amount = amount[start:end]
+            purchase = kind[start:end] == PURCHASE
+            if paycheck_n[start] == 0 and self._frozen:
+                # no paycheck since the overdraft (in an earlier block)
+                drop = purchase
+            else:
+                period_balance = carry + period_amount.cumsum()
+                overdraw = purchase & (period_balance < self.min_balance_cents)
+                drop = purchase & (np.cumsum(overdraw) > 0)
+                self._frozen = bool(drop.any())
+            if drop.any():
+                keep[start:end] = ~drop
+                period_amount = np.where(drop, 0, period_amount)
+            balance[start:end] = carry + period_amount.cumsum()
+            carry = balance[end - 1]
+        return keep, balance
+
+    def generate_arrays(self):
+        """
+        Returns:
+            collections.OrderedDict: the next block of rows
+                (see :meth:`BulkDataGenerator.generate_arrays`)
+        """
+        if self.done:
+            return None
+        days = self.get_calendar(self.blocksize)
+        self._day_ns = days.asi8[-1] + DAY_NS
+        events = [self.get_paychecks(days), self.get_bills(days),
+                  self.get_purchases(days)]
+        kind = np.concatenate([
+            np.repeat(k, len(event[0]))
+            for k, event in zip((PAYCHECK_EVENT, BILL, PURCHASE), events)])
+        wall_ns, amount, desc = [np.concatenate(x) for x in zip(*events)]
+        if self.count == 0:
+            kind = np.concatenate([[STATEMENT], kind])
+            wall_ns = np.concatenate([[self._start_wall_ns], wall_ns])
+            amount = np.concatenate([[0], amount])
+            desc = np.concatenate([[self._statement_code], desc])
+
+        # sort by minute, then by kind (a paycheck before purchases)
+        order = np.argsort((wall_ns - days.asi8[0]) // MINUTE_NS * 4 + kind)
+        order = order[wall_ns[order] >= self._start_wall_ns]
+        kind, wall_ns, amount, desc = (
+            kind[order], wall_ns[order], amount[order], desc[order])
+
+        date_ns = pd.DatetimeIndex(wall_ns).tz_localize(
+            self.tz,
+            ambiguous=np.zeros(len(wall_ns), dtype=bool),
+            nonexistent='shift_forward').asi8
+        n = len(date_ns)
+        if self._end_ns is not None:
+            n = np.searchsorted(date_ns, self._end_ns, side='left')
+            if n < len(date_ns) or self._day_ns >= self._end_wall_ns:
+                self.done = True
+
+        keep, balance = self.apply_overdraft_constraint(
+            kind[:n], amount[:n], np.cumsum(kind[:n] == PAYCHECK_EVENT))
+        rows = np.flatnonzero(keep)
+        if self.max_count and self.count + len(rows) >= self.max_count:
+            rows = rows[:self.max_count - self.count]
+            self.done = True
+        if len(rows):
+            self.balance_cents = int(balance[rows[-1]])
+        self.count += len(rows)
+        return collections.OrderedDict((
+            ('date', date_ns[rows]),
+            ('desc', desc[rows]),
+            ('amount', amount[rows]),
+            ('balance', balance[rows])))
+
+
+class Test_simulation(unittest.TestCase):
+    def setUp(self):
+        self.date_start = arrow.get('2014-12-18T10:57:00').replace(
+            tzinfo='US/Central')
+        self.kwargs = dict(initial_balance=500, date_start=self.date_start,
+                           date_end=self.date_start.replace(years=+1),
+                           seed=1, block_days=30)
+
+    def test_010_get_hour_weights(self):
+        weights = get_hour_weights(wake=7, sleep=21)
+        self.assertAlmostEqual(weights.sum(), 1)
+        self.assertEqual(list(np.flatnonzero(weights)), list(range(7, 21)))
+        self.assertEqual(weights.argmax() in (8, 9, 13, 19), True)
+
+    def test_100_ScheduleDataGenerator(self):
+        df = ScheduleDataGenerator(**self.kwargs).to_frame()
+        self.assertEqual(df['desc'][0], u"Account Statement")
+        self.assertEqual(df['date'][0], self.date_start.datetime)
+        self.assertTrue(df['date'].is_monotonic_increasing)
+        self.assertLess(df['date'].iloc[-1], self.kwargs['date_end'].datetime)
+        np.testing.assert_allclose(df['balance'], 500 + df['amount'].cumsum())
+
+        paychecks = df[df['desc'].str.startswith('Paycheck')]
+        self.assertEqual(len(paychecks), 53)  # (2014-12-19 - 2015-12-18)
+        self.assertEqual(set(paychecks['date'].dt.weekday), set([4]))
+        self.assertEqual(set(paychecks['date'].dt.hour), set([9]))
+        self.assertEqual(set(paychecks['amount']), set([PAYCHECK]))
+        for desc, day, amount in MONTHLY_BILLS:
+            bills = df[df['desc'] == desc]
+            self.assertEqual(len(bills), 12)
+            self.assertEqual(set(bills['date'].dt.day), set([day]))
+            self.assertEqual(set(bills['amount']), set([amount]))
+
+        purchases = df[df['desc'].str.match('^(ABC|XYZ|example.com) ')]
+        self.assertTrue((purchases['amount'] < 0).all())
+        hours = purchases['date'].dt.hour
+        weekend = purchases['date'].dt.weekday >= 5
+        self.assertTrue(hours[~weekend].between(6, 21).all())
+        self.assertTrue(hours[weekend].between(8, 23).all())
+        # no overdrafts until payday
+        self.assertTrue((purchases['balance'] >= 0).all())
+
+        pd.util.testing.assert_frame_equal(
+            df, ScheduleDataGenerator(**self.kwargs).to_frame())
+
+    def test_110_overdraft_constraint(self):
+        self.kwargs['paycheck'] = 200
+        df = ScheduleDataGenerator(**self.kwargs).to_frame()
+        purchases = df['desc'].str.match('^(ABC|XYZ|example.com) ')
+        self.assertTrue((df['balance'][purchases] >= 0).all())
+        unconstrained = ScheduleDataGenerator(
+            min_balance=-10 ** 9, **self.kwargs).to_frame()
+        self.assertLess(len(df), len(unconstrained))
+        self.assertLess(unconstrained['balance'].min(), 0)
+
+    def test_115_overdraft_constraint_blocks(self):
+        dg = ScheduleDataGenerator(min_balance=0, **self.kwargs)
+        dg.balance_cents = 1000
+        # an overdraft, a block without purchases, then a purchase which
+        # would not overdraw: all before the next paycheck
+        blocks = [
+            ([PURCHASE, PURCHASE], [-600, -600], [0, 0]),
+            ([BILL], [-100], [0]),
+            ([PURCHASE, PAYCHECK_EVENT, PURCHASE], [-100, 500, -100],
+             [0, 1, 1])]
+        keeps = []
+        for kind, amount, paycheck_n in blocks:
+            keep, balance = dg.apply_overdraft_constraint(
+                np.array(kind), np.array(amount), np.array(paycheck_n))
+            dg.balance_cents = int(balance[-1])
+            keeps.append(list(keep))
+        self.assertEqual(keeps, [[True, False], [True],
+                                 [False, True, True]])
+        self.assertEqual(dg.balance_cents, 700)
+        self.assertFalse(dg._frozen)
+
+    def test_116_overdraft_constraint_no_events(self):
+        dg = ScheduleDataGenerator(**self.kwargs)
+        keep, balance = dg.apply_overdraft_constraint(
+            np.array([], dtype=int), np.array([], dtype=np.int64),
+            np.array([], dtype=int))
+        self.assertEqual((len(keep), len(balance)), (0, 0))
+
+        # blocks of one day: the statement, a paycheck (Friday), then a
+        # Saturday without events before date_end
+        self.kwargs.update(block_days=1, purchases_per_day=0,
+                           date_end=self.date_start.replace(days=+3))
+        df = ScheduleDataGenerator(**self.kwargs).to_frame()
+        self.assertEqual(len(df), 2)
+        self.assertEqual(df['desc'][0], u"Account Statement")
+        self.assertEqual(df['amount'][1], PAYCHECK)
+
+    def test_120_max_count(self):
+        self.kwargs['date_end'] = None
+        self.kwargs['max_count'] = 1000
+        dg = ScheduleDataGenerator(**self.kwargs)
+        self.assertEqual(len(dg.to_frame()), 1000)
+        self.assertEqual(dg.count, 1000)
+        self.assertIsNone(dg.generate_arrays())
+
+
+def main(*args):
+    import optparse
+
+    prs = optparse.OptionParser(
+        usage="%prog -d <days> [-o <output.csv|.parquet|.feather|.npy>]")
+
+    prs.add_option('-o', '--output-file',
+                   dest='output_file')
+    prs.add_option('-f', '--format',
+                   help='Output format: %s (default: from the -o extension)'
+                   % ', '.join(datagenerator.OUTPUT_FORMATS),
+                   dest='format',
+                   choices=datagenerator.OUTPUT_FORMATS,
+                   default=None)
+    prs.add_option('-b', '--balance',
+                   help='Initial balance',
+                   dest='initial_balance',
+                   type=float,
+                   default=1001)
+    prs.add_option('-c', '--count',
+                   dest='count',
+                   type=int,
+                   default=None)
+    prs.add_option('-d', '--days',
+                   dest='day_count',
+                   type=int,
+                   default=None)
+    prs.add_option('--seed',
+                   dest='seed',
+                   type=int,
+                   default=None)
+    prs.add_option('--paycheck',
+                   dest='paycheck',
+                   type=float,
+                   default=PAYCHECK)
+    prs.add_option('--purchases-per-day',
+                   dest='purchases_per_day',
+                   type=float,
+                   default=4)
+    prs.add_option('--min-balance',
+                   help='No purchases below this balance (until payday)',
+                   dest='min_balance',
+                   type=float,
+                   default=0)
+
+    prs.add_option('-v', '--verbose',
+                    dest='verbose',
+                    action='store_true',)
+    prs.add_option('-q', '--quiet',
+                    dest='quiet',
+                    action='store_true',)
+    prs.add_option('-t', '--test',
+                    dest='run_tests',
+                    action='store_true',)
+
+    args = args and list(args) or sys.argv[1:]
+    (opts, args) = prs.parse_args(args)
+
+    if not opts.quiet:
+        logging.basicConfig()
+
+        if opts.verbose:
+            logging.getLogger().setLevel(logging.DEBUG)
+
+    if opts.run_tests:
+        sys.argv = [sys.argv[0]] + args
+        exit(unittest.main())
+
+    if not (opts.day_count or opts.count):
+        prs.error('a number of days (-d) or rows (-c) is required')
+
+    date_start = arrow.now().replace(second=0, microsecond=0)
+    generator = ScheduleDataGenerator(
+        initial_balance=opts.initial_balance,
+        date_start=date_start,
+        date_end=(date_start.replace(days=+opts.day_count)
+                  if opts.day_count else None),
+        max_count=opts.count,
+        seed=opts.seed,
+        paycheck=opts.paycheck,
+        purchases_per_day=opts.purchases_per_day,
+        min_balance=opts.min_balance)
+    if opts.output_file:
+        generator.write(opts.output_file, format=opts.format)
+    else:
+        generator.write_csv(sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+"""
+pypfi.variance
+===============
+
+Budget vs. actual variance reports.
+
+Each transaction is mapped to a budget category (one of the
+:class:`pypfi.budget.Budget` ``monthly_*`` attributes, or
+``uncategorized``) by the prefix of its ``desc``
+(:func:`get_budget_categories`, with a :class:`pypfi.categorize.Categorizer`).
+The actual amounts are summed by ``(yearmonth, budget_category)`` in one
+grouped pass (see :func:`pypfi.aggregates.aggregate_by_keys`) and
+compared with the monthly budget of each category, with running
+over/under totals (:func:`build_variance_reports`).
+
+Amounts are signed like the transactions: the budget of an income
+category is positive, the budget of an expense category is negative,
+and ``variance = actual - budget``; so a positive variance is under
+budget (or more income than budgeted) and a negative variance is over
+budget.
+
+Usage::
+
+    python -m pypfi.variance -i transactions.csv -o variance.html \\
+        -b monthly_salary=3000 -b monthly_home_rent=1200 \\
+        -r 'Whole Foods=monthly_groceries'
+
+"""
+import collections
+import os
+import StringIO
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import aggregates
+    from . import pypfi as _pypfi
+    from .budget import Budget
+    from .categorize import Categorizer, CategoryRule, UNCATEGORIZED
+except (ImportError, ValueError):  # python ./pypfi/variance.py
+    import aggregates
+    import pypfi as _pypfi
+    from budget import Budget
+    from categorize import Categorizer, CategoryRule, UNCATEGORIZED
+
+
+BUDGET_CATEGORIES = (Budget.monthly_income_attrs +
+                     Budget.monthly_expense_attrs +
+                     (UNCATEGORIZED,))
+
+# (desc prefix, Budget attribute)
+# (the descriptions of pypfi.simulation.ScheduleDataGenerator)
+BUDGET_CATEGORY_RULES = (
+    ('Paycheck', 'monthly_salary'),
+    ('Rent', 'monthly_home_rent'),
+    ('Electric Utility', 'monthly_electric'),
+    ('Internet', 'monthly_internet'),
+    ('Phone', 'monthly_phone'),
+)
+
+VARIANCE_COLUMNS = ('count', 'budget', 'actual', 'variance',
+                    'cumulative_variance')
+
+
+def get_budget_categories(desc, rules=BUDGET_CATEGORY_RULES):
+    """
+    Map transaction descriptions to budget categories
+
+    Args:
+        desc (array-like): transaction descriptions
+        rules (iterable): ``(prefix, category)`` pairs; categories must
+            be ``BUDGET_CATEGORIES`` (the longest matching prefix wins;
+            see :class:`pypfi.categorize.Categorizer`)
+    Returns:
+        pandas.Categorical: categories ``BUDGET_CATEGORIES``
+    """
+    categorizer = Categorizer(
+        [CategoryRule(category, prefix, 'prefix')
+         for prefix, category in rules],
+        categories=BUDGET_CATEGORIES)
+    return categorizer.categorize(desc)
+
+
+def get_budget_amounts(budget, categories=BUDGET_CATEGORIES):
+    """
+    Args:
+        budget (pypfi.budget.Budget): monthly budget
+        categories (iterable): budget categories
+    Returns:
+        pandas.Series: signed monthly budget of each category
+        (income: positive; expenses: negative; None and
+        ``UNCATEGORIZED``: 0)
+    """
+    amounts = []
+    for category in categories:
+        value = getattr(budget, category, None) or 0
+        if category in Budget.monthly_expense_attrs:
+            value = -value
+        amounts.append(float(value))
+    return pd.Series(amounts, index=pd.Index(categories, name='category'))
+
+
+@_pypfi.requires_computed_columns('yearmonth')
+def build_variance_reports(df, budget, rules=BUDGET_CATEGORY_RULES,
+                           column='budget_category'):
+    """
+    Build budget vs. actual reports by ``yearmonth`` and budget category
+
+    The actual amounts are summed in one grouped pass over
+    ``(yearmonth, column)``; every observed month is compared with the
+    whole monthly budget.
+
+    Args:
+        df (pandas.DataFrame): transactions
+            (see :func:`pypfi.pypfi.add_computed_columns`)
+        budget (pypfi.budget.Budget): monthly budget
+        rules (iterable): ``(prefix, category)`` pairs
+            (see :func:`get_budget_categories`)
+        column (str): name of the budget category column; if it is not
+            in ``df``, it is added from ``df['desc']`` and ``rules``
+            (a ``category`` column whose categories are
+            ``BUDGET_CATEGORIES`` can be used instead, see
+            :func:`pypfi.categorize.add_category_column`)
+    Returns:
+        pypfi.pypfi.ReportDict: ``variance`` (``VARIANCE_COLUMNS`` by
+        ``(yearmonth, category)``, for the budgeted and the observed
+        categories), ``variance_by_yearmonth`` (totals of each month and
+        a running total) and ``variance_by_category`` (totals of each
+        category)
+
+    .. note:: This method modifies the ``df`` argument
+       (adds ``df[column]`` if it is missing)
+    """
+    if column not in df.columns:
+        df[column] = get_budget_categories(df['desc'], rules)
+    accumulator = aggregates.aggregate_by_keys(
+        df, ['yearmonth', column], value='amount')
+    state = accumulator.rollup(['yearmonth', column])
+
+    yearmonths = pd.Index(
+        np.asarray(df['yearmonth'].cat.categories), name='yearmonth')
+    if hasattr(df[column], 'cat'):
+        categories = list(df[column].cat.categories)
+    else:
+        categories = list(BUDGET_CATEGORIES)
+    amounts = get_budget_amounts(budget, categories)
+    observed = set(state.index.get_level_values(column))
+    categories = pd.Index(
+        [c for c in categories if amounts[c] or c in observed],
+        name='category')
+    amounts = amounts.reindex(categories)
+
+    # (yearmonth, category) grids
+    index = pd.MultiIndex.from_product([yearmonths, categories],
+                                       names=['yearmonth', 'category'])
+    state.index.names = ['yearmonth', 'category']
+    state = state.reindex(index)
+    shape = (len(yearmonths), len(categories))
+    count = state['count'].fillna(0).values.reshape(shape)
+    actual = state['sum'].fillna(0).values.reshape(shape)
+    budgeted = np.broadcast_to(amounts.values, shape)
+    variance = actual - budgeted
+
+    output = _pypfi.ReportDict()
+    output['variance'] = pd.DataFrame(collections.OrderedDict((
+        ('count', count.ravel().astype(np.int64)),
+        ('budget', budgeted.ravel()),
+        ('actual', actual.ravel()),
+        ('variance', variance.ravel()),
+        ('cumulative_variance', np.cumsum(variance, axis=0).ravel()))),
+        index=index)
+
+    by_yearmonth = pd.DataFrame(collections.OrderedDict((
+        ('budget', budgeted.sum(axis=1)),
+        ('actual', actual.sum(axis=1)),
+        ('variance', variance.sum(axis=1)))), index=yearmonths)
+    by_yearmonth['cumulative_variance'] = by_yearmonth['variance'].cumsum()
+    by_yearmonth['over_budget'] = by_yearmonth['variance'] < 0
+    output['variance_by_yearmonth'] = by_yearmonth
+
+    by_category = pd.DataFrame(collections.OrderedDict((
+        ('count', count.sum(axis=0).astype(np.int64)),
+        ('budget', budgeted.sum(axis=0)),
+        ('actual', actual.sum(axis=0)),
+        ('variance', variance.sum(axis=0)))), index=categories)
+    by_category['months_over_budget'] = (variance < 0).sum(axis=0)
+    output['variance_by_category'] = by_category
+    return output
+
+
+def pypfi_variance(input_file, output_file, budget,
+                   rules=BUDGET_CATEGORY_RULES, debug=False,
+                   output=sys.stdout, date_format=None, tz=None,
+                   max_rows=None, compress=None, lazy=False):
+    """
+    Write a budget vs. actual report of a transactions file
+
+    Args:
+        input_file (str): path to the transactions file
+        output_file (str): path to the output HTML file
+        budget (pypfi.budget.Budget): monthly budget
+        rules (iterable): ``(prefix, category)`` pairs
+    Returns:
+        int: 0
+    """
+    df = _pypfi.read_transactions_tsv(input_file, date_format=date_format,
+                                      tz=tz)
+    df = _pypfi.prepare_frame(df, [build_variance_reports])
+
+    report_dict = _pypfi.ReportDict(headingchar='=', headinghtml='h2')
+    report_dict['build_variance_reports'] = build_variance_reports(
+        df, budget, rules=rules)
+
+    if debug:
+        report_dict.print_str(output=output)
+
+    _pypfi.write_report(input_file, output_file, report_dict,
+                        max_rows=max_rows, compress=compress, lazy=lazy)
+    return 0
+
+
+class Test_variance(unittest.TestCase):
+    def setUp(self):
+        self.INPUT_FILE = os.path.join(os.path.dirname(__file__),
+                                       '..', 'tests', 'testdata.csv')
+        self.BUILDDIR = os.path.join(os.path.dirname(__file__),
+                                     '..', 'build')
+        if not os.path.exists(self.BUILDDIR):
+            os.mkdir(self.BUILDDIR)
+        self.budget = Budget(monthly_salary=3000,
+                             monthly_home_rent=1200,
+                             monthly_groceries=400)
+        self.rules = BUDGET_CATEGORY_RULES + (
+            ('ABC', 'monthly_groceries'),
+            ('ABC Pharmacy', 'monthly_health_prescriptions'))
+
+    def test_010_get_budget_categories(self):
+        desc = ['Paycheck 1', 'ABC x', 'ABC Pharmacy y', None, 'XYZ z',
+                'ABC x']
+        categories = get_budget_categories(desc, self.rules)
+        self.assertEqual(list(categories.categories), list(BUDGET_CATEGORIES))
+        self.assertEqual(list(categories), [
+            'monthly_salary', 'monthly_groceries',
+            'monthly_health_prescriptions', UNCATEGORIZED, UNCATEGORIZED,
+            'monthly_groceries'])
+        self.assertRaises(KeyError, get_budget_categories, desc,
+                          [('ABC', 'groceries')])
+
+    def test_020_get_budget_amounts(self):
+        amounts = get_budget_amounts(self.budget)
+        self.assertEqual(amounts['monthly_salary'], 3000)
+        self.assertEqual(amounts['monthly_home_rent'], -1200)
+        self.assertEqual(amounts['monthly_electric'], 0)
+        self.assertEqual(amounts[UNCATEGORIZED], 0)
+
+    def test_030_build_variance_reports(self):
+        df = _pypfi.read_transactions_tsv(self.INPUT_FILE)
+        df = _pypfi.add_computed_columns(df)
+        output = build_variance_reports(df, self.budget, rules=self.rules)
+
+        variance = output['variance']
+        self.assertEqual(list(variance.columns), list(VARIANCE_COLUMNS))
+        self.assertEqual(
+            list(variance.index.get_level_values('category').unique()),
+            ['monthly_salary', 'monthly_groceries', 'monthly_home_rent',
+             UNCATEGORIZED])
+        groceries = df['desc'].str.startswith('ABC')
+        expected = df[groceries].groupby('yearmonth')['amount'].sum()
+        actual = variance.xs('monthly_groceries', level='category')
+        np.testing.assert_allclose(actual['actual'].values, expected.values)
+        np.testing.assert_allclose(actual['variance'].values,
+                                   expected.values + 400)
+        np.testing.assert_allclose(actual['cumulative_variance'].values,
+                                   np.cumsum(expected.values + 400))
+        self.assertEqual(variance['count'].sum(), len(df))
+
+        by_yearmonth = output['variance_by_yearmonth']
+        expected = df.groupby('yearmonth')['amount'].sum()
+        np.testing.assert_allclose(by_yearmonth['actual'].values,
+                                   expected.values)
+        np.testing.assert_allclose(by_yearmonth['budget'].values,
+                                   3000 - 1200 - 400)
+        np.testing.assert_allclose(
+            by_yearmonth['cumulative_variance'].values[-1],
+            df['amount'].sum() - len(by_yearmonth) * (3000 - 1200 - 400))
+
+        by_category = output['variance_by_category']
+        self.assertAlmostEqual(by_category['actual'].sum(),
+                               df['amount'].sum())
+        self.assertEqual(by_category.loc['monthly_salary', 'count'],
+                         df['desc'].str.startswith('Paycheck').sum())
+        self.assertEqual(by_category.loc['monthly_home_rent', 'count'], 0)
+        self.assertEqual(
+            by_category.loc['monthly_home_rent', 'months_over_budget'], 0)
+
+    def test_900_pypfi_variance(self):
+        output_file = os.path.join(self.BUILDDIR, 'testoutput.variance.html')
+        output = pypfi_variance(self.INPUT_FILE, output_file, self.budget,
+                                rules=self.rules, output=StringIO.StringIO())
+        self.assertEqual(output, 0)
+        self.assertTrue(os.path.exists(output_file))
+
+
+def main(*args):
+    import logging
+    import optparse
+
+    prs = optparse.OptionParser(
+        usage="%prog -i <input.tsv> -o <variance.html> -b <attr>=<amount>")
+
+    prs.add_option('-i', '--input-file',
+                   dest='input_file')
+    prs.add_option('-o', '--output-file',
+                   dest='output_file',
+                   default='variance.html')
+    prs.add_option('-b', '--budget',
+                   dest='budget',
+                   help='A monthly budget amount: monthly_<category>=AMOUNT',
+                   action='append',
+                   default=[])
+    prs.add_option('-r', '--rule',
+                   dest='rules',
+                   help='A description prefix and its budget category: '
+                        'PREFIX=monthly_<category>',
+                   action='append',
+                   default=[])
+    prs.add_option('--date-format',
+                   dest='date_format',
+                   help='strptime format of the date column',
+                   default=None)
+    prs.add_option('--tz',
+                   dest='tz',
+                   help='Convert dates to this timezone (e.g. US/Central)',
+                   default=None)
+    prs.add_option('--max-rows',
+                   dest='max_rows',
+                   help='Truncate HTML tables to this many rows',
+                   type=int,
+                   default=None)
+    prs.add_option('--lazy',
+                   dest='lazy',
+                   help='Write a lazily loaded HTML report',
+                   action='store_true',)
+
+    prs.add_option('-v', '--verbose',
+                    dest='verbose',
+                    action='store_true',)
+    prs.add_option('-q', '--quiet',
+                    dest='quiet',
+                    action='store_true',)
+    prs.add_option('-t', '--test',
+                    dest='run_tests',
+                    action='store_true',)
+
+    args = args and list(args) or sys.argv[1:]
+    (opts, args) = prs.parse_args(args)
+
+    if not opts.quiet:
+        logging.basicConfig()
+
+        if opts.verbose:
+            logging.getLogger().setLevel(logging.DEBUG)
+
+    if opts.run_tests:
+        sys.argv = [sys.argv[0]] + args
+        exit(unittest.main())
+
+    if not opts.input_file:
+        prs.error('-i <input.tsv> is required')
+    budget_kwargs = {}
+    for item in opts.budget:
+        attr, value = item.split('=', 1)
+        if attr not in BUDGET_CATEGORIES or attr == UNCATEGORIZED:
+            prs.error('unknown budget category: %r' % attr)
+        budget_kwargs[attr] = float(value)
+    rules = BUDGET_CATEGORY_RULES + tuple(
+        tuple(x.rsplit('=', 1)) for x in opts.rules)
+
+    return pypfi_variance(opts.input_file,
+                          opts.output_file,
+                          Budget(**budget_kwargs),
+                          rules=rules,
+                          debug=opts.verbose,
+                          output=sys.stdout if opts.verbose else StringIO.StringIO(),
+                          date_format=opts.date_format,
+                          tz=opts.tz,
+                          max_rows=opts.max_rows,
+                          lazy=opts.lazy)
+
+
+if __name__ == "__main__":
+    sys.exit(main())